@@ -0,0 +1 @@
+"""Benchmarks of the file validator, see `benchmarks.suite`."""
@@ -0,0 +1,135 @@
+"""Synthetic, reproducible data and schemas for the benchmarks.
+
+Every generator takes a seed, so that the same arguments always produce the same
+data.  `error_rate` is the fraction of values that don't satisfy the schema.
+"""
+import csv
+import json
+import random
+import typing as t
+from pathlib import Path
+
+
+def csv_schema(
+    n_columns: int = 8, use_refs: bool = False, use_all_of: bool = False
+) -> dict:
+    """Returns a schema for CSV rows, cycling through string, integer and number
+    columns.  With use_refs, every column refers to its own definition.  With
+    use_all_of, the keywords of every column are split over a chain of `allOf`s,
+    as schemas composed from shared pieces are, and strings have a pattern."""
+    kinds = [
+        {"type": "string", "maxLength": 12},
+        {"type": "integer", "minimum": 0, "maximum": 1000},
+        {"type": "number", "minimum": 0, "maximum": 1},
+    ]
+    properties = {}
+    definitions = {}
+    for index in range(n_columns):
+        column = f"col{index}"
+        subschema = dict(kinds[index % len(kinds)])
+        if use_all_of:
+            if subschema["type"] == "string":
+                subschema["pattern"] = "^[a-f]+$"
+            # The type stays at the top, where the columns are cast from.
+            keywords = list(subschema.items())[1:]
+            chain = dict([keywords[-1]])
+            for keyword, value in reversed(keywords[:-1]):
+                chain = {keyword: value, "allOf": [chain]}
+            subschema = {"allOf": [chain], "type": subschema["type"]}
+        if use_refs:
+            definitions[column] = subschema
+            subschema = {"$ref": f"#/definitions/{column}"}
+        properties[column] = subschema
+    schema = {
+        "$schema": "http://json-schema.org/draft-07/schema",
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+    }
+    if use_refs:
+        schema["definitions"] = definitions
+    return schema
+
+
+def csv_rows(
+    n_rows: int, n_columns: int = 8, error_rate: float = 0.0, seed: int = 0
+) -> t.Iterator[t.Dict[str, str]]:
+    """Yields rows matching `csv_schema(n_columns)`, as read from a CSV file."""
+    rng = random.Random(seed)
+    valid = [
+        lambda: rng.choice("abcdef") * rng.randint(1, 12),
+        lambda: str(rng.randint(0, 1000)),
+        lambda: f"{rng.random():.6f}",
+    ]
+    invalid = [
+        lambda: "x" * 20,
+        lambda: rng.choice(["-1", "2000", "abc"]),
+        lambda: rng.choice(["1.5", "nan?"]),
+    ]
+    for _ in range(n_rows):
+        row = {}
+        for index in range(n_columns):
+            generators = invalid if rng.random() < error_rate else valid
+            row[f"col{index}"] = generators[index % len(generators)]()
+        yield row
+
+
+def write_csv(path: Path, rows: t.Iterable[t.Dict[str, str]]) -> Path:
+    rows = iter(rows)
+    first = next(rows)
+    with open(path, "w", newline="") as fp:
+        writer = csv.DictWriter(fp, fieldnames=list(first))
+        writer.writeheader()
+        writer.writerow(first)
+        writer.writerows(rows)
+    return path
+
+
+def json_schema(depth: int = 3, use_refs: bool = False) -> dict:
+    """Returns a schema for `json_document`s of the given depth."""
+    leaf = {"type": "integer", "minimum": 0}
+    node = {"type": "object", "additionalProperties": leaf}
+    definitions = {"leaf": leaf}
+    for level in range(depth):
+        children = {"type": "array", "items": node}
+        node = {
+            "type": "object",
+            "properties": {"name": {"type": "string"}, "children": children},
+            "required": ["name"],
+        }
+        if use_refs:
+            definitions[f"level{level}"] = node
+            node = {"$ref": f"#/definitions/level{level}"}
+    schema = {"$schema": "http://json-schema.org/draft-07/schema", **node}
+    if use_refs:
+        schema["definitions"] = definitions
+    return schema
+
+
+def json_document(
+    depth: int = 3, width: int = 10, error_rate: float = 0.0, seed: int = 0
+) -> dict:
+    """Returns a tree of objects, `width` children per level, `depth` levels deep.
+
+    The leaves are objects of `width` integers.
+    """
+    rng = random.Random(seed)
+
+    def value() -> t.Any:
+        return -1 if rng.random() < error_rate else rng.randint(0, 1000)
+
+    def node(level: int) -> dict:
+        if level == 0:
+            return {f"v{index}": value() for index in range(width)}
+        return {
+            "name": f"node{level}",
+            "children": [node(level - 1) for _ in range(width)],
+        }
+
+    return node(depth)
+
+
+def write_json(path: Path, document: t.Any) -> Path:
+    with open(path, "w") as fp:
+        json.dump(document, fp)
+    return path
@@ -0,0 +1,96 @@
+"""Import times of the gear modules, as reported by `python -X importtime`.
+
+For small files, starting the interpreter and importing the gear take longer than
+validating them.  `import_times` imports a module in a fresh interpreter and returns
+the time spent importing each module it pulls in, to find the imports to defer.
+
+Usage:
+    python -m benchmarks.startup [fw_gear_file_validator.cli] [--top 20]
+"""
+import argparse
+import re
+import subprocess
+import sys
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+# Modules whose startup is benchmarked: the CLI, the gear run script, and the
+# modules validating file contents.
+MODULES = [
+    "fw_gear_file_validator.cli",
+    "fw_gear_file_validator.loader",
+    "fw_gear_file_validator.validator",
+    "run",
+]
+ROOT_DIR = Path(__file__).parents[1]
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    """Time spent importing a module, in microseconds."""
+
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_import_times(output: str) -> t.List[ImportTime]:
+    """Parses the `-X importtime` report written to stderr, skipping other lines."""
+    times = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            depth = (len(indent) - 1) // 2
+            times.append(ImportTime(name, int(self_us), int(cumulative_us), depth))
+    return times
+
+
+def import_command(module: str) -> t.List[str]:
+    return [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+
+
+def import_times(module: str) -> t.List[ImportTime]:
+    """Imports the module in a fresh interpreter and returns its import times.
+
+    Raises:
+        subprocess.CalledProcessError: if the module can't be imported.
+    """
+    process = subprocess.run(
+        import_command(module),
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_times(process.stderr)
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.startup", description=__doc__
+    )
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--top", type=int, default=20, help="slowest imports shown")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        times = import_times(module)
+        total = next((i.cumulative_us for i in times if i.name == module), 0)
+        print(f"{module}: {total / 1000:.1f} ms")
+        slowest = sorted(times, key=lambda i: i.cumulative_us, reverse=True)
+        for import_time in slowest[: args.top]:
+            print(
+                f"  {import_time.cumulative_us / 1000:>8.1f} ms "
+                f"{import_time.self_us / 1000:>8.1f} ms  "
+                f"{'  ' * import_time.depth}{import_time.name}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""Benchmarks of the loading, validation and error handling stages, and of the
+startup of the gear.
+
+Each benchmark times a single stage on synthetic data (see `benchmarks.data`),
+generated beforehand, and reports its best time over a few runs and its peak memory,
+traced with tracemalloc in a separate run so that tracing doesn't skew the time.
+Startup benchmarks time a fresh interpreter importing a module, `python -m
+benchmarks.startup` details the time of each import.
+
+Results can be saved as a baseline, and later runs compared against it: a benchmark
+regresses when its time or peak memory exceeds the baseline by more than the
+threshold.
+
+Usage:
+    python -m benchmarks [--rows 1000 100000] [-k csv] [--save baseline.json]
+    python -m benchmarks --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as t
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from benchmarks import data, startup
+from fw_gear_file_validator.loader import CsvLoader, JsonLoader
+from fw_gear_file_validator.validator import JsonValidator, initialize_validator
+
+# Default numbers of CSV rows.
+ROWS = [1000, 100000]
+# Fraction of invalid values of the error-heavy inputs.
+ERROR_RATE = 0.1
+# Default tolerance before a benchmark is reported as a regression.
+THRESHOLD = 0.25
+# Differences below these are noise, whatever the threshold.
+MIN_DELTA = {"seconds": 0.005, "peak_mb": 0.5}
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float
+    peak_mb: float
+
+
+@dataclass
+class Benchmark:
+    """A stage to measure, `setup` returns the function to time."""
+
+    name: str
+    setup: t.Callable[[Path], t.Callable[[], t.Any]]
+
+
+def measure(func: t.Callable[[], t.Any], repeat: int = 3) -> t.Tuple[float, float]:
+    """Returns the best time of func over repeat runs, and its peak memory in MB."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def csv_benchmarks(n_rows: int) -> t.Iterator[Benchmark]:
+    def load(tmp_dir: Path):
+        path = data.write_csv(tmp_dir / f"load_{n_rows}.csv", data.csv_rows(n_rows))
+        return lambda: CsvLoader().load_object(path)
+
+    yield Benchmark(f"csv_load[{n_rows}]", load)
+
+    variants = {
+        "clean": dict(n_columns=8),
+        "errors": dict(n_columns=8, error_rate=ERROR_RATE),
+        "wide": dict(n_columns=200),
+        "refs": dict(n_columns=8, use_refs=True),
+        "allof": dict(n_columns=8, use_all_of=True),
+    }
+    for variant, options in variants.items():
+        for engine in ["jsonschema", "compiled", "columnar"]:
+
+            def validate(tmp_dir: Path, options=options, engine=engine):
+                n_columns = options["n_columns"]
+                schema = data.csv_schema(
+                    n_columns,
+                    options.get("use_refs", False),
+                    options.get("use_all_of", False),
+                )
+                # Wide rows hold as many values in fewer rows.
+                rows = n_rows * 8 // n_columns
+                rows = list(
+                    data.csv_rows(rows, n_columns, options.get("error_rate", 0.0))
+                )
+                validator = initialize_validator(
+                    "csv", schema, {"engine": engine, "workers": 1}
+                )
+                return lambda: validator.validate(rows)
+
+            yield Benchmark(f"csv_validate[{variant},{engine},{n_rows}]", validate)
+
+    def validate_table(tmp_dir: Path):
+        path = data.write_csv(
+            tmp_dir / f"table_{n_rows}.csv", data.csv_rows(n_rows, 8, ERROR_RATE)
+        )
+        table = CsvLoader().load_object(path)
+        validator = initialize_validator(
+            "csv", data.csv_schema(8), {"engine": "columnar", "workers": 1}
+        )
+        return lambda: validator.validate(table)
+
+    yield Benchmark(f"csv_validate[table,columnar,{n_rows}]", validate_table)
+
+
+def json_benchmarks() -> t.Iterator[Benchmark]:
+    shapes = {"deep": dict(depth=6, width=4), "wide": dict(depth=1, width=500)}
+    for shape, options in shapes.items():
+
+        def load(tmp_dir: Path, shape=shape, options=options):
+            path = data.write_json(
+                tmp_dir / f"{shape}.json", data.json_document(**options)
+            )
+            return lambda: JsonLoader().load_object(path)
+
+        yield Benchmark(f"json_load[{shape}]", load)
+
+        for variant, error_rate in [("clean", 0.0), ("errors", ERROR_RATE)]:
+            for engine in ["jsonschema", "compiled"]:
+
+                def validate(
+                    tmp_dir: Path, options=options, error_rate=error_rate, engine=engine
+                ):
+                    schema = data.json_schema(options["depth"], use_refs=True)
+                    document = data.json_document(**options, error_rate=error_rate)
+                    validator = initialize_validator("json", schema, {"engine": engine})
+                    return lambda: validator.validate(document)
+
+                yield Benchmark(f"json_validate[{shape},{variant},{engine}]", validate)
+
+    def handle_errors(tmp_dir: Path):
+        options = shapes["wide"]
+        validator = JsonValidator(data.json_schema(options["depth"]))
+        document = data.json_document(**options, error_rate=ERROR_RATE)
+        errors = list(validator.validator.iter_errors(document))
+        return lambda: [dict(e) for e in validator.handle_errors(errors)]
+
+    yield Benchmark("json_handle_errors", handle_errors)
+
+
+def flywheel_benchmarks() -> t.Iterator[Benchmark]:
+    def add_location(tmp_dir: Path):
+        from fw_gear_file_validator.errors import add_flywheel_location_to_errors
+
+        class Reference:
+            """Stands for a FwReference whose containers are already fetched."""
+
+            contents = "file"
+            type = "file"
+            hierarchy_objects = {
+                "project": {"label": "project", "id": "project_id"},
+                "file": {"name": "file.csv", "file_id": "file_id"},
+            }
+
+            def get_lookup_path(self, level: str = None) -> str:
+                return "fw://project/file.csv"
+
+        schema = data.csv_schema()
+        rows = list(data.csv_rows(10000, error_rate=ERROR_RATE))
+        _, errors = initialize_validator("csv", schema, {"workers": 1}).validate(rows)
+        return lambda: add_flywheel_location_to_errors(Reference(), errors)
+
+    yield Benchmark("add_flywheel_location_to_errors", add_location)
+
+
+def startup_benchmarks() -> t.Iterator[Benchmark]:
+    """Startup of a fresh interpreter importing the module, which is most of the
+    runtime of the gear on small files (see `startup` for the time per import)."""
+    for module in startup.MODULES:
+
+        def start(tmp_dir: Path, module=module):
+            command = [sys.executable, "-c", f"import {module}"]
+            return lambda: subprocess.run(command, cwd=startup.ROOT_DIR, check=True)
+
+        yield Benchmark(f"startup[{module}]", start)
+
+
+def all_benchmarks(rows: t.List[int]) -> t.Iterator[Benchmark]:
+    for n_rows in rows:
+        yield from csv_benchmarks(n_rows)
+    yield from json_benchmarks()
+    yield from flywheel_benchmarks()
+    yield from startup_benchmarks()
+
+
+def run(
+    benchmarks: t.Iterable[Benchmark], repeat: int = 3, log: t.TextIO = sys.stdout
+) -> t.List[Result]:
+    """Runs the benchmarks, printing their results as they complete."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for benchmark in benchmarks:
+            func = benchmark.setup(Path(tmp_dir))
+            seconds, peak_mb = measure(func, repeat)
+            del func
+            result = Result(benchmark.name, round(seconds, 6), round(peak_mb, 3))
+            log.write(f"{result.name:<55} {seconds:>10.4f}s {peak_mb:>10.2f} MB\n")
+            log.flush()
+            results.append(result)
+    return results
+
+
+def find_regressions(
+    results: t.List[Result], baseline: t.Dict[str, t.Dict], threshold: float
+) -> t.List[str]:
+    """Returns a description of the results exceeding the baseline by threshold."""
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if not base:
+            continue
+        for metric, min_delta in MIN_DELTA.items():
+            value, reference = getattr(result, metric), base[metric]
+            if value > max(reference * (1 + threshold), reference + min_delta):
+                regressions.append(f"{result.name}: {metric} {value} > {reference}")
+    return regressions
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "--rows", nargs="+", type=int, default=ROWS, help="numbers of CSV rows"
+    )
+    parser.add_argument("-k", dest="keyword", help="only run the matching benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--save", type=Path, help="save the results as a baseline")
+    parser.add_argument("--baseline", type=Path, help="baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    benchmarks = all_benchmarks(args.rows)
+    if args.keyword:
+        benchmarks = (b for b in benchmarks if args.keyword in b.name)
+    results = run(benchmarks, args.repeat)
+
+    if args.save:
+        args.save.write_text(
+            json.dumps({r.name: asdict(r) for r in results}, indent=2) + "\n"
+        )
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
@@ -1,7 +1,14 @@
 """The fw_gear_{{gear_package}} package."""
-from importlib.metadata import version
 
-try:
-    __version__ = version(__package__)
-except Exception:  # pragma: no cover
-    pass
+
+def __getattr__(name):
+    # The version is read from the package metadata when first used, importing
+    # importlib.metadata takes longer than the rest of the package.
+    if name == "__version__":
+        from importlib.metadata import version
+
+        try:
+            return version(__package__)
+        except Exception:  # pragma: no cover
+            pass
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,244 @@
+"""Validation of all the files of a Flywheel container in a single run.
+
+The files are listed page by page and handled a batch at a time by a bounded pool of
+threads, which mostly wait on the Flywheel API.  All files share the validators,
+compiled once per file type, and a caching client, so that a parent container is
+fetched once for the whole run.  The QC results and tags of a batch are written
+together once it has been validated.
+"""
+import itertools
+import logging
+import tempfile
+import threading
+import typing as t
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import flywheel
+from flywheel_gear_toolkit import GearToolkitContext
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.budget import ErrorBudget
+from fw_gear_file_validator.client import CachingClient
+from fw_gear_file_validator.errors import (
+    add_flywheel_location_to_errors,
+    errors_file_name,
+    qc_result,
+)
+from fw_gear_file_validator.loader import Loader
+from fw_gear_file_validator.parser import get_ext, identify_file_type
+from fw_gear_file_validator.timing import StageTimer
+from fw_gear_file_validator.utils import MAX_CONCURRENT_REQUESTS, FwReference
+
+log = logging.getLogger(__name__)
+
+# Number of files listed per API request.
+PAGE_SIZE = 250
+# Number of files validated before their results are written.
+BATCH_SIZE = 100
+
+
+def iter_files(
+    client: flywheel.Client, level: str, container_id: str, page_size: int = PAGE_SIZE
+) -> t.Iterator[flywheel.FileOutput]:
+    """Yields the files of the container and of its children, one page at a time."""
+    kwargs = {"filter": f"parents.{level}={container_id}", "limit": page_size}
+    while True:
+        page = client.get_all_files(**kwargs)
+        files = getattr(page, "results", page)
+        if not files:
+            return
+        yield from files
+        if len(files) < page_size:
+            return
+        kwargs["after_id"] = files[-1].file_id
+
+
+def iter_batches(items: t.Iterable, size: int) -> t.Iterator[t.List]:
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+@dataclass
+class FileResult:
+    """The validation result of a file of the batch."""
+
+    fw_ref: FwReference
+    valid: bool
+    errors: t.List[t.Dict] = field(default_factory=list)
+    # Reason the validation stopped early, if it did.
+    partial: t.Optional[str] = None
+
+
+class BatchValidator:
+    """Validates the files of a container and saves their QC results and tags.
+
+    Args:
+        context: the gear context, to save QC results with
+        schema: the validation JSON schema
+        validation_level: "file" to validate the files' contents, "flywheel" to
+            validate their Flywheel representation
+        tag: the tag prefix, "-PASS" or "-FAIL" is appended
+        loader_config: config of the loaders
+        validator_config: config of the validators
+        workers: number of files handled at the same time
+        batch_size: number of files validated before their results are written
+    """
+
+    def __init__(
+        self,
+        context: GearToolkitContext,
+        schema: dict,
+        validation_level: str,
+        tag: str,
+        loader_config: t.Dict[str, t.Any] = None,
+        validator_config: t.Dict[str, t.Any] = None,
+        workers: int = MAX_CONCURRENT_REQUESTS,
+        batch_size: int = BATCH_SIZE,
+    ):
+        self.context = context
+        self.client = CachingClient.wrap(context.client)
+        self.schema = schema
+        self.validation_level = validation_level
+        self.tag = tag
+        self.loader_config = {**(loader_config or {}), "schema": schema}
+        # Files are already validated by concurrent threads: creating a process pool
+        # per file from them would fork a multithreaded process and oversubscribe
+        # the CPUs, so the rows of each file are validated in its thread.
+        self.validator_config = {**(validator_config or {}), "workers": 1}
+        self.workers = workers
+        self.batch_size = batch_size
+        self.output_dir = Path(context.output_dir)
+        self.timer = StageTimer()
+        self._lock = threading.Lock()
+        self._loaders = {}
+        self._validators = {}
+
+    def get_loader(self, file_type: str) -> Loader:
+        """Returns the loader of the file type, initialized once for the run."""
+        with self._lock:
+            if file_type not in self._loaders:
+                self._loaders[file_type] = Loader.factory(
+                    file_type, config=self.loader_config
+                )
+            return self._loaders[file_type]
+
+    def get_validator(
+        self, file_type: str
+    ) -> t.Union[validator.JsonValidator, validator.CsvValidator]:
+        """Returns the validator of the file type, initialized once for the run."""
+        with self._lock:
+            if file_type not in self._validators:
+                self._validators[file_type] = validator.initialize_validator(
+                    file_type, self.schema, self.validator_config
+                )
+            return self._validators[file_type]
+
+    def run(self, level: str, container_id: str) -> Counter:
+        """Validates the files of the container, returns the number of files by state.
+
+        States are "PASS", "FAIL" and "SKIPPED" for files of unsupported types or
+        that can't be read or validated.
+        """
+        states = Counter()
+        files = iter_files(self.client, level, container_id)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in iter_batches(files, self.batch_size):
+                results = list(executor.map(self.validate_file, batch))
+                states["SKIPPED"] += results.count(None)
+                results = [result for result in results if result is not None]
+                states.update(executor.map(self.save_result, results))
+                log.info(f"Validated {sum(states.values())} files: {dict(states)}")
+        return states
+
+    def validate_file(self, file: flywheel.FileOutput) -> t.Optional[FileResult]:
+        """Validates the file, returns None if it is not supported or can't be read.
+
+        Unexpected failures, e.g. when downloading the file, only skip this file:
+        the other files of the container are still validated.
+        """
+        try:
+            return self._validate_file(file)
+        except Exception:
+            log.exception(f"Skipping {file.name}, unable to validate it")
+            return None
+
+    def _validate_file(self, file: flywheel.FileOutput) -> t.Optional[FileResult]:
+        if self.validation_level == "flywheel":
+            file_type = "flywheel"
+        else:
+            file_type = identify_file_type(get_ext(file.name), file.mimetype)
+            if not file_type:
+                log.debug(f"Skipping {file.name}, file type not supported")
+                return None
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_object = None
+            if self.validation_level == "file":
+                path = Path(tmp_dir) / file.name
+                with self.timer.span("download"):
+                    self.client.download_file_from_container(
+                        file.parent_ref["id"], file.name, str(path)
+                    )
+                input_object = {"location": {"path": path}}
+
+            fw_ref = FwReference(
+                id=file.file_id,
+                input_object=input_object,
+                type="file",
+                name=file.name,
+                file_type=file_type,
+                parents=dict(file.parents),
+                _client=self.client,
+                contents=self.validation_level,
+            )
+            # Validators are shared by the threads, budgets are not.
+            budget = ErrorBudget.from_config(self.validator_config)
+            try:
+                with self.timer.span("validate"):
+                    valid, errors = self.get_validator(file_type).validate(
+                        self.get_loader(file_type).load_object(fw_ref.loc), budget
+                    )
+            except ValueError as e:
+                log.error(f"Skipping {file.name}: {e}")
+                return None
+        with self.timer.span("locate_errors"):
+            errors = add_flywheel_location_to_errors(fw_ref, errors)
+        partial = budget.reason if budget is not None else None
+        return FileResult(fw_ref, valid and not partial, errors, partial)
+
+    def save_result(self, result: FileResult) -> str:
+        """Saves the QC result and tags of the file, returns its state.
+
+        Files whose result can't be saved are counted as "SKIPPED".
+        """
+        try:
+            return self._save_result(result)
+        except Exception:
+            log.exception(f"Unable to save the result of {result.fw_ref.name}")
+            return "SKIPPED"
+
+    def _save_result(self, result: FileResult) -> str:
+        fw_ref = result.fw_ref
+        errors_path = self.output_dir / errors_file_name(f"{fw_ref.id}.{fw_ref.name}")
+        with self.timer.span("save_errors"):
+            state, meta_dict = qc_result(result.errors, errors_path, result.partial)
+            file = fw_ref.fw_object
+            self.context.metadata.add_qc_result_via_sdk(
+                file, "validation", state=state, **meta_dict
+            )
+
+        with self.timer.span("tags"):
+            stale_tag = f"{self.tag}-{'FAIL' if state == 'PASS' else 'PASS'}"
+            if stale_tag in (file.tags or []):
+                self.client.delete_file_tags(fw_ref.id, body=[stale_tag])
+            self.client.add_file_tags(fw_ref.id, [f"{self.tag}-{state}"])
+        # The file is not needed anymore, unlike its parent containers.
+        self.client.forget("get_file", fw_ref.id)
+        return state
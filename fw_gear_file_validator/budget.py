@@ -0,0 +1,127 @@
+"""Limits on the errors reported and the time spent validating a file.
+
+A completely wrong file, e.g. with swapped columns, has errors on every row:
+validating it in full takes as long as for a valid file, only to report millions of
+redundant errors.  An `ErrorBudget` stops the validation early:
+
+- once max_errors errors have been reported, when there are more,
+- after the first error, with fail_fast,
+- once deadline seconds have passed since the validation started.
+
+Validators read the rows of a file and collect its errors lazily, through `rows`
+and `limit`, so that stopping also stops reading and validating the rest of the
+file.  Validations that only know the order of their errors once they are all
+collected (e.g. of streamed JSON documents) check `exhausted` as they go, and
+`truncate` the errors found.  The reason the validation stopped, if it did, is kept
+in `reason`, for the result to be reported as partial.
+"""
+import time
+import typing as t
+
+# Reasons for stopping early.
+MAX_ERRORS = "max_errors"
+FAIL_FAST = "fail_fast"
+DEADLINE = "deadline"
+
+
+class ErrorBudget:
+    """The errors and time a validation can use.
+
+    A budget is used by a single validation at a time: `start` resets it.
+
+    Args:
+        max_errors: number of errors reported, 0 for no limit
+        fail_fast: whether to stop at the first error
+        deadline: number of seconds the validation can run for, 0 for no limit
+    """
+
+    def __init__(
+        self, max_errors: int = 0, fail_fast: bool = False, deadline: float = 0
+    ):
+        self.max_errors = max_errors
+        self.fail_fast = fail_fast
+        self.deadline = deadline
+        self.error_count = 0
+        self.reason: t.Optional[str] = None
+        self._end: t.Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: t.Dict[str, t.Any]) -> t.Optional["ErrorBudget"]:
+        """Returns the budget of the "max_errors", "fail_fast" and "deadline"
+        options of the config, None if they don't limit the validation."""
+        budget = cls(
+            config.get("max_errors") or 0,
+            bool(config.get("fail_fast")),
+            config.get("deadline") or 0,
+        )
+        return budget if budget.enabled else None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_errors or self.fail_fast or self.deadline)
+
+    @property
+    def partial(self) -> bool:
+        """Whether the validation stopped before the end of the file."""
+        return self.reason is not None
+
+    def start(self):
+        """Starts a validation, with the full budget."""
+        self.error_count = 0
+        self.reason = None
+        self._end = time.monotonic() + self.deadline if self.deadline else None
+
+    def stopped(self) -> bool:
+        """Returns whether the validation must stop."""
+        if self.reason is None and self._end is not None:
+            if time.monotonic() >= self._end:
+                self.reason = DEADLINE
+        return self.reason is not None
+
+    def rows(self, rows: t.Iterable) -> t.Iterator:
+        """Yields the rows (or lines) until the validation must stop."""
+        for row in rows:
+            if self.stopped():
+                return
+            yield row
+
+    def limit(self, errors: t.Iterable) -> t.Iterator:
+        """Yields the errors within the budget, and stops consuming them once it
+        is exhausted."""
+        for error in errors:
+            if self.stopped():
+                return
+            if self.max_errors and self.error_count >= self.max_errors:
+                self.reason = MAX_ERRORS
+                return
+            self.error_count += 1
+            yield error
+            if self.fail_fast:
+                self.reason = FAIL_FAST
+                return
+
+    def exhausted(self, found: int) -> bool:
+        """Returns whether a validation must stop, having found this many errors.
+
+        For validations sorting their errors before reporting them (see
+        `truncate`): one more error than max_errors is collected, to know that some
+        were left out.
+        """
+        if self.fail_fast and found >= 1:
+            return True
+        if self.max_errors and found > self.max_errors:
+            return True
+        return self.stopped()
+
+    def truncate(self, errors: t.List) -> t.List:
+        """Returns the errors within the budget of those collected until it was
+        exhausted, in the order they are reported."""
+        limit = 1 if self.fail_fast else self.max_errors
+        if limit and len(errors) > limit:
+            errors = errors[:limit]
+            if self.reason is None:
+                self.reason = MAX_ERRORS
+        if self.fail_fast and errors and self.reason is None:
+            self.reason = FAIL_FAST
+        self.error_count = len(errors)
+        return errors
@@ -0,0 +1,218 @@
+"""Cache of compiled schemas, shared across validators and gear runs.
+
+Schemas are keyed by a hash of their content, so a modified schema simply gets a new
+entry.  Each entry holds the validator for the schema, the dereferenced schema and
+the artifacts derived from it (the json type of each csv column, the compiled
+`pattern`s and, for the "compiled" engine, the generated validation code).
+Validation itself uses the original schema, as error reports include the
+(sub)schemas as written by the user.  Entries are kept in memory for the lifetime of
+the process and, when a cache directory is given, written to disk so that later runs
+can skip the compilation.  Both levels are bounded and evict the least recently used
+entries first.
+
+The generated code is only kept in memory: code read back from the cache directory
+would be executed, so it is generated again from the schema by each process.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import typing as t
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from pathlib import Path
+
+import jsonschema
+
+from fw_gear_file_validator.compiler import CompiledValidator
+from fw_gear_file_validator.schema import dereference, iter_subschemas
+
+log = logging.getLogger(__name__)
+
+# Bump when the content of the cache entries changes.
+CACHE_VERSION = 3
+MAX_ENTRIES = 32
+
+
+@lru_cache(maxsize=None)
+def jsonschema_version() -> str:
+    """Returns the version of jsonschema, whose validators the entries hold."""
+    from importlib.metadata import version
+
+    return version("jsonschema")
+
+
+def schema_hash(schema: dict) -> str:
+    """Returns a hash of the schema content, independent of key order."""
+    content = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    content = f"{CACHE_VERSION}:{jsonschema_version()}:{content}"
+    return hashlib.sha256(content.encode("UTF-8")).hexdigest()
+
+
+class CompiledSchema:
+    """A schema, its dereferenced version and the artifacts derived from them."""
+
+    def __init__(
+        self,
+        key: str,
+        schema: dict,
+        dereferenced: dict,
+        column_types: t.Optional[t.Dict[str, t.Any]] = None,
+    ):
+        self.key = key
+        self.schema = schema
+        self.dereferenced = dereferenced
+        self._column_types = column_types
+        self.source: t.Optional[str] = None
+
+    @classmethod
+    def compile(cls, schema: dict, key: t.Optional[str] = None) -> "CompiledSchema":
+        return cls(key or schema_hash(schema), schema, dereference(schema))
+
+    @cached_property
+    def validator(self) -> jsonschema.Draft7Validator:
+        return jsonschema.Draft7Validator(self.schema)
+
+    @cached_property
+    def generated_validator(self) -> CompiledValidator:
+        """Validator running the code generated for the schema."""
+        validator = CompiledValidator(self.schema, self.source)
+        self.source = validator.source
+        return validator
+
+    @property
+    def column_types(self) -> t.Dict[str, t.Any]:
+        """The json type of each column (top level property) of the schema."""
+        if self._column_types is None:
+            column_types = {}
+            for name, property_val in self.dereferenced.get("properties", {}).items():
+                if isinstance(property_val, dict) and "$ref" in property_val:
+                    _, property_val = self.validator.resolver.resolve(
+                        property_val["$ref"]
+                    )
+                column_types[name] = property_val.get("type")
+            self._column_types = column_types
+        return self._column_types
+
+    @cached_property
+    def patterns(self) -> t.Dict[str, re.Pattern]:
+        """The compiled `pattern`s of the schema, by pattern string."""
+        patterns = {}
+        for subschema in iter_subschemas(self.dereferenced):
+            pattern = subschema.get("pattern")
+            if isinstance(pattern, str) and pattern not in patterns:
+                patterns[pattern] = re.compile(pattern)
+        return patterns
+
+    def to_dict(self) -> dict:
+        return {
+            "version": CACHE_VERSION,
+            "key": self.key,
+            "dereferenced": self.dereferenced,
+            "column_types": self.column_types,
+        }
+
+
+class SchemaCache:
+    """Size-bounded LRU cache of CompiledSchemas, optionally persisted to disk."""
+
+    def __init__(
+        self,
+        cache_dir: t.Union[Path, str, None] = None,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.cache_dir = Path(cache_dir) / "schemas" if cache_dir else None
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, schema: dict, generate_code: bool = False) -> CompiledSchema:
+        """Returns the compiled version of the schema, compiling it if needed.
+
+        Args:
+            schema: the JSON schema
+            generate_code: whether the entry should also hold the generated code of
+                the schema (see `CompiledSchema.generated_validator`), which is not
+                saved to the cache directory.
+        """
+        key = schema_hash(schema)
+        compiled = self._entries.get(key)
+        if compiled:
+            self._entries.move_to_end(key)
+        else:
+            compiled = self._load(key, schema)
+            if not compiled:
+                log.debug(f"Compiling schema {key}")
+                compiled = CompiledSchema.compile(schema, key)
+                self._save(compiled)
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        if generate_code and compiled.source is None:
+            log.debug(f"Generating code for schema {key}")
+            _ = compiled.generated_validator
+        return compiled
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load(self, key: str, schema: dict) -> t.Optional[CompiledSchema]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="UTF-8") as fp:
+                content = json.load(fp)
+            if content.get("version") != CACHE_VERSION or content.get("key") != key:
+                raise ValueError("Outdated cache entry")
+            # Mark the entry as recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.debug(f"Discarding schema cache entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        log.debug(f"Loaded compiled schema {key} from {self.cache_dir}")
+        return CompiledSchema(
+            key, schema, content["dereferenced"], content["column_types"]
+        )
+
+    def _save(self, compiled: CompiledSchema):
+        if not self.cache_dir:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that concurrent runs never read a
+            # partially written entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="UTF-8") as fp:
+                    json.dump(compiled.to_dict(), fp)
+                os.replace(tmp_path, self._path(compiled.key))
+            finally:
+                Path(tmp_path).unlink(missing_ok=True)
+            self._evict()
+        except (OSError, TypeError, ValueError) as e:
+            log.warning(f"Unable to save compiled schema to {self.cache_dir}: {e}")
+
+    def _evict(self):
+        """Removes the least recently used entries beyond max_entries from disk."""
+        paths = sorted(
+            self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True
+        )
+        for path in paths[self.max_entries :]:
+            path.unlink(missing_ok=True)
+
+
+_caches = {}
+
+
+def get_schema_cache(cache_dir: t.Union[Path, str, None] = None) -> SchemaCache:
+    """Returns the process-wide SchemaCache for the given cache directory."""
+    cache_key = str(cache_dir) if cache_dir else None
+    if cache_key not in _caches:
+        _caches[cache_key] = SchemaCache(cache_dir)
+    return _caches[cache_key]
@@ -0,0 +1,320 @@
+"""Command line interface validating local files, without Flywheel.
+
+Validates every supported file under the given directories (or listed in a
+manifest) against a schema, with a pool of worker processes, and writes one NDJSON
+line per file, e.g.:
+    {"path": "data/a.csv", "file_type": "csv", "valid": false, "error_count": 1,
+     "errors": [...], "elapsed": 0.012}
+Files whose validation stopped early (see --max-errors, --fail-fast and --deadline)
+have the reason as "partial".
+
+Usage:
+    file-validator schema.json data/ [--pattern "*.csv"] [--workers 4]
+
+This module must not import the Flywheel SDK, directly or not, so that it can run
+where it is not installed.
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+import typing as t
+from collections import deque
+from pathlib import Path
+
+from fw_gear_file_validator.budget import ErrorBudget
+from fw_gear_file_validator.compression import content_extension
+from fw_gear_file_validator.constraints import MAX_INDEX_KEYS
+from fw_gear_file_validator.loader import SUPPORTED_FILE_EXTENSIONS, Loader
+from fw_gear_file_validator.parallel import available_cpus
+from fw_gear_file_validator.records import MAX_LENGTH
+from fw_gear_file_validator.validator import ENGINES, initialize_validator
+
+log = logging.getLogger(__name__)
+
+# Validators of the current worker process by file type, set up by `_init_worker`.
+_worker_state = {}
+
+
+def iter_paths(
+    roots: t.Iterable[t.Union[Path, str]], patterns: t.Optional[t.List[str]] = None
+) -> t.Iterator[Path]:
+    """Yields the supported files under the roots, in sorted order.
+
+    Roots that are files are yielded as is.  Files under directories are yielded if
+    their name matches one of the patterns, or if they have a supported extension
+    when no pattern is given.
+    """
+    for root in roots:
+        root = Path(root)
+        if not root.is_dir():
+            yield root
+            continue
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            for name in sorted(file_names):
+                if patterns:
+                    if not any(fnmatch.fnmatch(name, p) for p in patterns):
+                        continue
+                elif (
+                    content_extension(Path(dir_path) / name)
+                    not in SUPPORTED_FILE_EXTENSIONS
+                ):
+                    continue
+                yield Path(dir_path) / name
+
+
+def read_manifest(manifest: t.TextIO) -> t.Iterator[Path]:
+    """Yields the paths listed in the manifest, one per line."""
+    for line in manifest:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield Path(line)
+
+
+def _init_worker(schema: dict, loader_config: dict, validator_config: dict):
+    _worker_state.clear()
+    _worker_state.update(
+        schema=schema,
+        loader_config=loader_config,
+        validator_config=validator_config,
+        validators={},
+    )
+
+
+def validate_path(path: Path) -> t.Dict[str, t.Any]:
+    """Validates the file with the validators of the worker, returns its result."""
+    start = time.monotonic()
+    file_type = SUPPORTED_FILE_EXTENSIONS.get(content_extension(path))
+    result = {"path": str(path), "file_type": file_type}
+    validators = _worker_state["validators"]
+    try:
+        if file_type is None:
+            raise ValueError(f"File type {''.join(path.suffixes)} is not supported")
+        if file_type not in validators:
+            validators[file_type] = initialize_validator(
+                file_type, _worker_state["schema"], _worker_state["validator_config"]
+            )
+        loader = Loader.factory(file_type, config=_worker_state["loader_config"])
+        budget = ErrorBudget.from_config(_worker_state["validator_config"])
+        valid, errors = validators[file_type].validate(loader.load_object(path), budget)
+    except ValueError as e:
+        result.update(valid=False, error=str(e))
+    except Exception as e:
+        # Any other failure is reported as the error of this file only, the other
+        # files are still validated.
+        log.exception(f"Unable to validate {path}")
+        result.update(valid=False, error=f"{type(e).__name__}: {e}")
+    else:
+        result.update(
+            valid=valid,
+            error_count=len(errors),
+            errors=[dict(error) for error in errors],
+        )
+        if budget is not None and budget.partial:
+            result.update(valid=False, partial=budget.reason)
+    result["size"] = path.stat().st_size if path.is_file() else None
+    result["elapsed"] = round(time.monotonic() - start, 6)
+    return result
+
+
+def validate_paths(
+    paths: t.Iterable[Path],
+    schema: dict,
+    loader_config: t.Dict[str, t.Any] = None,
+    validator_config: t.Dict[str, t.Any] = None,
+    workers: int = 0,
+) -> t.Iterator[t.Dict[str, t.Any]]:
+    """Validates the files with a pool of workers, yields their results in order.
+
+    Args:
+        paths: the files to validate
+        schema: the validation JSON schema
+        loader_config: config of the loaders, e.g. {"streaming": True}
+        validator_config: config of the validators, e.g. {"engine": "compiled"}
+        workers: number of worker processes, 0 for all available CPUs, 1 to
+            validate in this process
+    """
+    workers = workers or available_cpus()
+    # Files are already validated concurrently, not their rows.
+    validator_config = {**(validator_config or {}), "workers": 1}
+    initargs = (schema, loader_config or {}, validator_config)
+    if workers == 1:
+        _init_worker(*initargs)
+        yield from map(validate_path, paths)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=initargs
+    ) as executor:
+        # Keep a bounded number of files in flight, so that long manifests are not
+        # read in full, and collect the results in order.
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(validate_path, path))
+            if len(pending) >= 4 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_args(argv: t.Optional[t.List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="file-validator",
+        description="Validates local JSON and CSV files against a JSON schema and "
+        "writes one NDJSON result line per file.",
+    )
+    parser.add_argument("schema", type=Path, help="the JSON schema file")
+    parser.add_argument(
+        "paths", nargs="*", type=Path, help="files or directories to validate"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=argparse.FileType("r"),
+        help="file listing the files to validate, one per line ('-' for stdin)",
+    )
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        dest="patterns",
+        help="glob pattern of the file names to validate in directories, can be "
+        "repeated (default: all supported extensions)",
+    )
+    parser.add_argument(
+        "--output",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="file to write the results to (default: stdout)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="number of worker processes, 0 for all available CPUs (default: 0)",
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="jsonschema")
+    parser.add_argument(
+        "--streaming", action="store_true", help="stream files from disk"
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        help="memory available to each worker to load a file, in MB, larger files "
+        "are streamed",
+    )
+    parser.add_argument("--cache-dir", help="directory to cache compiled schemas in")
+    parser.add_argument("--max-value-length", type=int, default=MAX_LENGTH)
+    parser.add_argument(
+        "--reference-dir",
+        type=Path,
+        help="directory the files referenced by foreign keys are relative to "
+        "(default: the directory of the schema)",
+    )
+    parser.add_argument(
+        "--max-index-keys",
+        type=int,
+        default=MAX_INDEX_KEYS,
+        help="number of keys of the unique and foreign key indexes held in memory "
+        "before spilling them to disk, 0 for no limit (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only validate the chunks of csv rows not validated in a previous run, "
+        "with their results saved in the --cache-dir",
+    )
+    parser.add_argument(
+        "--max-errors",
+        type=int,
+        default=0,
+        help="stop validating a file after this many errors, 0 for no limit "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="stop validating a file at its first error",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=0,
+        help="stop validating a file after this many seconds, 0 for no limit "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-optimize",
+        dest="optimize",
+        action="store_false",
+        help="validate with the schema as written rather than its optimized version",
+    )
+    parser.add_argument("--debug", action="store_true", help="log debug messages")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("no files to validate, give paths or a --manifest")
+    return args
+
+
+def main(argv: t.Optional[t.List[str]] = None) -> int:
+    """Runs the CLI, returns 0 if all the files are valid, 1 otherwise."""
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s %(message)s",
+        stream=sys.stderr,
+    )
+
+    schema = Loader.load_schema(args.schema)
+    paths = iter_paths(args.paths, args.patterns)
+    if args.manifest:
+        paths = itertools.chain(paths, read_manifest(args.manifest))
+    if args.output is not sys.stdout:
+        # The results file may be written in one of the validated directories.
+        output_path = Path(args.output.name).resolve()
+        paths = (path for path in paths if path.resolve() != output_path)
+    loader_config = {"streaming": args.streaming, "memory_budget": args.memory_budget}
+    validator_config = {
+        "engine": args.engine,
+        "cache_dir": args.cache_dir,
+        "max_value_length": args.max_value_length,
+        "reference_dir": args.reference_dir or Path(args.schema).parent,
+        "max_index_keys": args.max_index_keys,
+        "incremental": args.incremental,
+        "max_errors": args.max_errors,
+        "fail_fast": args.fail_fast,
+        "deadline": args.deadline,
+        "optimize": args.optimize,
+    }
+
+    start = time.monotonic()
+    counts = {"files": 0, "valid": 0, "errors": 0, "bytes": 0}
+    results = validate_paths(
+        paths, schema, loader_config, validator_config, args.workers
+    )
+    for result in results:
+        args.output.write(json.dumps(result, default=str))
+        args.output.write("\n")
+        args.output.flush()
+        counts["files"] += 1
+        counts["valid"] += bool(result["valid"])
+        counts["errors"] += result.get("error_count", 0)
+        counts["bytes"] += result.get("size") or 0
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    log.info(
+        f"Validated {counts['files']} files ({counts['bytes'] / 1e6:.1f} MB) in "
+        f"{elapsed:.2f}s: {counts['files'] / elapsed:.1f} files/s, "
+        f"{counts['bytes'] / 1e6 / elapsed:.1f} MB/s, "
+        f"{counts['files'] - counts['valid']} invalid, {counts['errors']} errors"
+    )
+    return 0 if counts["valid"] == counts["files"] else 1
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
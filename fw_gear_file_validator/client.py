@@ -0,0 +1,115 @@
+"""Flywheel client proxy fetching each container at most once per run."""
+import logging
+import threading
+import time
+import typing as t
+from collections import Counter
+from functools import partial
+
+if t.TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    import flywheel
+
+log = logging.getLogger(__name__)
+
+# Getters of single containers, whose results are memoized.
+CACHED_METHODS = {
+    "get_group",
+    "get_project",
+    "get_subject",
+    "get_session",
+    "get_acquisition",
+    "get_analysis",
+    "get_file",
+}
+
+
+class CachingClient:
+    """Proxy of a flywheel.Client memoizing its `get_<level>(id)` calls.
+
+    Identical calls, including concurrent ones, are coalesced into a single API
+    request: later callers get the result of the first one, waiting for it if it is
+    still in flight.  Failed requests are not cached.  Other attributes are passed
+    through to the client.
+
+    The number of API calls, cache hits and the time spent in API calls are counted
+    in `stats`.
+    """
+
+    def __init__(self, client: "flywheel.Client"):
+        self.client = client
+        self._lock = threading.Lock()
+        self._results: t.Dict[t.Tuple, "Future"] = {}
+        self.api_calls = Counter()
+        self.api_time = 0.0
+        self.cache_hits = 0
+
+    @classmethod
+    def wrap(cls, client: t.Union["flywheel.Client", "CachingClient", None]):
+        """Returns the client wrapped in a CachingClient, if not already."""
+        if client is None or isinstance(client, cls):
+            return client
+        return cls(client)
+
+    def __getattr__(self, name: str) -> t.Any:
+        if name == "client":
+            raise AttributeError(name)
+        attribute = getattr(self.client, name)
+        if name in CACHED_METHODS and callable(attribute):
+            return partial(self._get, name)
+        return attribute
+
+    def _get(self, method: str, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        key = (method, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return self._call(method, args, kwargs)
+
+        from concurrent.futures import Future
+
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self.cache_hits += 1
+                owner = False
+            else:
+                result = self._results[key] = Future()
+                owner = True
+
+        if owner:
+            try:
+                result.set_result(self._call(method, args, kwargs))
+            except BaseException as e:
+                with self._lock:
+                    del self._results[key]
+                result.set_exception(e)
+        return result.result()
+
+    def forget(self, method: str, *args: t.Any, **kwargs: t.Any):
+        """Drops the memoized result of a call, e.g. once a file is processed."""
+        key = (method, args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            self._results.pop(key, None)
+
+    def _call(self, method: str, args: t.Tuple, kwargs: t.Dict) -> t.Any:
+        start = time.monotonic()
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.api_calls[method] += 1
+                self.api_time += elapsed
+
+    @property
+    def stats(self) -> t.Dict[str, t.Any]:
+        """Counters of the API calls made through the proxy."""
+        with self._lock:
+            return {
+                "api_calls": sum(self.api_calls.values()),
+                "cache_hits": self.cache_hits,
+                "api_time": round(self.api_time, 3),
+                "calls_by_method": dict(self.api_calls),
+            }
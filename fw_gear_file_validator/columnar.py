@@ -0,0 +1,518 @@
+"""Column-wise validation engine for CSV files.
+
+Instead of casting and validating each row separately, rows are gathered in blocks,
+transposed into per-column lists, cast in bulk and checked one keyword at a time over
+the whole column.  Only the keywords listed in `COLUMN_KEYWORDS` are evaluated this
+way; columns using any other keyword are validated with jsonschema, and schemas whose
+root uses anything beyond `properties`, `required` and an object `type` fall back to
+the row-wise `CsvValidator` entirely.
+
+Errors are the same `ErrorRecord`s as the ones built from jsonschema's errors, so they
+go through `handle_errors` and `add_csv_location_spec` unchanged.  Their messages are
+only rendered when accessed.
+"""
+import itertools
+import logging
+import re
+import typing as t
+from collections import defaultdict
+from pathlib import Path
+
+from fw_gear_file_validator.records import MAX_LENGTH, ErrorRecord
+from fw_gear_file_validator.schema import CONSTRAINT_KEYWORDS
+from fw_gear_file_validator.table import Column, CsvTable
+from fw_gear_file_validator.validator import JSON_TYPES, CsvValidator, cast_csv_val
+
+if t.TYPE_CHECKING:
+    from fw_gear_file_validator.cache import SchemaCache
+
+log = logging.getLogger(__name__)
+
+# Keywords that never produce errors.
+ANNOTATION_KEYWORDS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "title",
+    "description",
+    "default",
+    "examples",
+    "definitions",
+}
+ROOT_KEYWORDS = {"type", "required", "properties"}
+COLUMN_KEYWORDS = {
+    "type",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+    "enum",
+    "const",
+    "minLength",
+    "maxLength",
+    "pattern",
+}
+
+TYPE_CHECKS = {
+    "string": lambda v: v.__class__ is str,
+    "number": lambda v: v.__class__ in (int, float),
+    "integer": lambda v: v.__class__ is int
+    or (v.__class__ is float and v.is_integer()),
+    "boolean": lambda v: v.__class__ is bool,
+    "null": lambda v: v is None,
+    "array": lambda v: v.__class__ is list,
+    "object": lambda v: v.__class__ is dict,
+}
+
+# Placeholder for a column that is absent from a given row.
+_MISSING = object()
+
+
+def _is_number(value: t.Any) -> bool:
+    return value.__class__ in (int, float)
+
+
+def _equality_key(value: t.Any) -> t.Hashable:
+    """Returns a key that compares like jsonschema's `equal` for scalar values.
+
+    Booleans never equal numbers, while ints and floats compare by value.
+    """
+    if value.__class__ is bool:
+        return bool, value
+    if _is_number(value):
+        return float, value
+    return value.__class__, value
+
+
+def _is_hashable(value: t.Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def cast_column(values: t.List, cast_type: type) -> t.Tuple[t.List, bool]:
+    """Casts a whole column, returning the cast values and whether all casts succeeded.
+
+    The column is first cast in a single pass; only when that fails is each value cast
+    on its own with `cast_csv_val`, leaving the uncastable ones as they are.
+    """
+    if cast_type is str and None not in values:
+        return values, True
+    try:
+        return list(map(cast_type, values)), True
+    except (ValueError, TypeError):
+        return [
+            v if v is _MISSING else cast_csv_val(v, cast_type) for v in values
+        ], False
+
+
+def table_column_values(
+    column: Column, cast_type: t.Optional[type], start: int, stop: int
+) -> t.Tuple[t.List, bool]:
+    """Returns the values of the column from start to stop as `cast_column` does.
+
+    Numbers already parsed by the table are reused, and the distinct values of
+    dictionary-encoded columns are only cast once.
+    """
+    if cast_type is None:
+        return column.text(start, stop), False
+    values = column.typed(cast_type, start, stop)
+    if values is not None:
+        return values, True
+    if column.kind == "dictionary":
+        # Values missing from this block may fail to cast, which only means that
+        # their type is checked.
+        dictionary, clean = cast_column(column.dictionary, cast_type)
+        return list(map(dictionary.__getitem__, column.data[start:stop])), clean
+    return cast_column(column.text(start, stop), cast_type)
+
+
+class ColumnSpec:
+    """The compiled checks of a single column."""
+
+    def __init__(
+        self,
+        name: str,
+        schema: dict,
+        compiled_patterns: t.Optional[t.Dict[str, re.Pattern]] = None,
+    ):
+        self.name = name
+        self.schema = schema
+        self.json_type = schema.get("type")
+        self.patterns = {}
+        self.equality_keys = {}
+        for keyword, value in schema.items():
+            if keyword == "pattern":
+                compiled_pattern = (compiled_patterns or {}).get(value)
+                self.patterns[keyword] = (compiled_pattern or re.compile(value)).search
+            elif keyword == "enum":
+                self.equality_keys[keyword] = {
+                    _equality_key(v) for v in value if _is_hashable(v)
+                }
+            elif keyword == "const" and _is_hashable(value):
+                self.equality_keys[keyword] = {_equality_key(value)}
+            elif keyword == "const":
+                self.equality_keys[keyword] = set()
+
+    @classmethod
+    def compile(
+        cls,
+        name: str,
+        schema: t.Any,
+        compiled_patterns: t.Optional[t.Dict[str, re.Pattern]] = None,
+    ) -> t.Optional["ColumnSpec"]:
+        """Returns a ColumnSpec, or None if the schema can't be evaluated column-wise."""
+        if not isinstance(schema, dict):
+            return None
+        for keyword, value in schema.items():
+            if keyword in ANNOTATION_KEYWORDS:
+                continue
+            if keyword not in COLUMN_KEYWORDS:
+                return None
+            if keyword == "type" and value not in TYPE_CHECKS:
+                return None
+            if keyword == "pattern" and not isinstance(value, str):
+                return None
+            if keyword == "enum" and not isinstance(value, list):
+                return None
+        return cls(name, schema, compiled_patterns)
+
+    def iter_failures(
+        self, values: t.List, cast_type: t.Optional[type] = None
+    ) -> t.Iterator[t.Tuple[str, t.List[int], t.Callable[[t.Any], str]]]:
+        """Yields (keyword, failing row indices, message builder) in schema order.
+
+        Args:
+            values: the column values
+            cast_type: the type every value was successfully cast to, if any
+        """
+        for keyword, expected in self.schema.items():
+            if keyword in ANNOTATION_KEYWORDS:
+                continue
+
+            if keyword == "type":
+                if cast_type and JSON_TYPES.get(expected) is cast_type:
+                    continue
+                is_type = TYPE_CHECKS[expected]
+                failed = [
+                    i
+                    for i, v in enumerate(values)
+                    if v is not _MISSING and not is_type(v)
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} is not of type {e!r}"
+                )
+
+            elif keyword == "minimum":
+                failed = [
+                    i for i, v in enumerate(values) if _is_number(v) and v < expected
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} is less than the minimum of {e!r}"
+                )
+
+            elif keyword == "maximum":
+                failed = [
+                    i for i, v in enumerate(values) if _is_number(v) and v > expected
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} is greater than the maximum of {e!r}"
+                )
+
+            elif keyword == "exclusiveMinimum":
+                failed = [
+                    i for i, v in enumerate(values) if _is_number(v) and v <= expected
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} is less than or equal to the minimum of {e!r}"
+                )
+
+            elif keyword == "exclusiveMaximum":
+                failed = [
+                    i for i, v in enumerate(values) if _is_number(v) and v >= expected
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} is greater than or equal to the maximum of {e!r}"
+                )
+
+            elif keyword in ("enum", "const"):
+                keys = self.equality_keys[keyword]
+                failed = [
+                    i
+                    for i, v in enumerate(values)
+                    if v is not _MISSING and _equality_key(v) not in keys
+                ]
+                if keyword == "enum":
+                    yield keyword, failed, lambda v, e=expected: (
+                        f"{v!r} is not one of {e!r}"
+                    )
+                else:
+                    yield keyword, failed, lambda v, e=expected: f"{e!r} was expected"
+
+            elif keyword == "minLength":
+                failed = [
+                    i
+                    for i, v in enumerate(values)
+                    if v.__class__ is str and len(v) < expected
+                ]
+                message = "should be non-empty" if expected == 1 else "is too short"
+                yield keyword, failed, lambda v, m=message: f"{v!r} {m}"
+
+            elif keyword == "maxLength":
+                failed = [
+                    i
+                    for i, v in enumerate(values)
+                    if v.__class__ is str and len(v) > expected
+                ]
+                message = "is expected to be empty" if expected == 0 else "is too long"
+                yield keyword, failed, lambda v, m=message: f"{v!r} {m}"
+
+            elif keyword == "pattern":
+                search = self.patterns[keyword]
+                failed = [
+                    i
+                    for i, v in enumerate(values)
+                    if v.__class__ is str and not search(v)
+                ]
+                yield keyword, failed, lambda v, e=expected: (
+                    f"{v!r} does not match {e!r}"
+                )
+
+
+class ColumnarCsvValidator(CsvValidator):
+    """CSV Validator evaluating the schema column by column.
+
+    Produces the same errors, in the same order, as `CsvValidator`.
+    """
+
+    # Number of rows transposed and validated at a time.
+    block_size = 10000
+    reads_columns = True
+
+    def __init__(
+        self,
+        schema: t.Union[dict, Path, str],
+        cache: "SchemaCache" = None,
+        max_value_length: int = MAX_LENGTH,
+        optimize: bool = True,
+    ):
+        super().__init__(
+            schema, cache, max_value_length=max_value_length, optimize=optimize
+        )
+        self.column_specs = {}
+        self.fallback_columns = {}
+        self.row_fallback = not self._root_is_compilable()
+        if self.row_fallback:
+            log.debug("Schema root can't be evaluated column-wise, validating rows.")
+            return
+
+        dereferenced = self.compiled.dereferenced if self.compiled else {}
+        for name, property_schema in self.validator.schema["properties"].items():
+            resolved = dereferenced.get("properties", {}).get(name, property_schema)
+            spec = ColumnSpec.compile(
+                name,
+                self.resolve_schema(resolved),
+                self.compiled.patterns if self.compiled else None,
+            )
+            if spec:
+                self.column_specs[name] = spec
+            else:
+                log.debug(f"Column {name} will be validated with jsonschema.")
+                self.fallback_columns[name] = property_schema
+
+    def _root_is_compilable(self) -> bool:
+        schema = self.validator.schema
+        if not isinstance(schema, dict) or not isinstance(
+            schema.get("properties"), dict
+        ):
+            return False
+        for keyword, value in schema.items():
+            # Constraints across rows are checked while rows are read.
+            if keyword in ANNOTATION_KEYWORDS or keyword in CONSTRAINT_KEYWORDS:
+                continue
+            if keyword not in ROOT_KEYWORDS:
+                return False
+            if keyword == "type" and value != "object":
+                return False
+        return True
+
+    def resolve_schema(self, schema: t.Any) -> t.Any:
+        """Follows `$ref`s until reaching the schema that is actually applied.
+
+        As in Draft 7, keywords next to a `$ref` are ignored.
+        """
+        while isinstance(schema, dict) and "$ref" in schema:
+            _, schema = self.validator.resolver.resolve(schema["$ref"])
+        return schema
+
+    def iter_validate(
+        self, csv_dict: t.Iterable[t.Dict], start: int = 0
+    ) -> t.Iterator[t.Dict]:
+        if self.row_fallback:
+            yield from super().iter_validate(csv_dict, start)
+            return
+
+        column_types = self.get_column_dtypes()
+        if isinstance(csv_dict, CsvTable) and not csv_dict.extras:
+            yield from self._iter_validate_table(csv_dict, start, column_types)
+            return
+
+        rows = iter(csv_dict)
+        row_offset = start
+        while True:
+            block = list(itertools.islice(rows, self.block_size))
+            if not block:
+                break
+            yield from self._validate_block(row_offset, block, column_types)
+            row_offset += len(block)
+
+    def _iter_validate_table(
+        self, table: CsvTable, start: int, column_types: t.Dict[str, type]
+    ) -> t.Iterator[t.Dict]:
+        """Validates the columns of the table in blocks, without materializing its
+        rows, and reusing the numbers it has already parsed."""
+        keys = list(table.columns)
+        for block_start in range(0, len(table), self.block_size):
+            block_stop = min(block_start + self.block_size, len(table))
+            columns = {}
+            cast_types = {}
+            for key in keys:
+                values, clean = table_column_values(
+                    table.columns[key], column_types.get(key), block_start, block_stop
+                )
+                if clean:
+                    cast_types[key] = column_types[key]
+                columns[key] = values
+            yield from self._block_errors(
+                start + block_start,
+                block_stop - block_start,
+                keys,
+                columns,
+                cast_types,
+            )
+
+    def _validate_block(
+        self, row_offset: int, block: t.List[t.Dict], column_types: t.Dict[str, type]
+    ) -> t.Iterator[t.Dict]:
+        """Validates a block of rows and yields the formatted errors in row order."""
+        first_keys = block[0].keys()
+        if all(row.keys() == first_keys for row in block):
+            keys = list(first_keys)
+        else:
+            keys = list(dict.fromkeys(k for row in block for k in row))
+
+        columns = {}
+        cast_types = {}
+        for key in keys:
+            values = [row.get(key, _MISSING) for row in block]
+            if key in column_types:
+                values, clean = cast_column(values, column_types[key])
+                if clean:
+                    cast_types[key] = column_types[key]
+            columns[key] = values
+        yield from self._block_errors(row_offset, len(block), keys, columns, cast_types)
+
+    def _block_errors(
+        self,
+        row_offset: int,
+        n_rows: int,
+        keys: t.List[str],
+        columns: t.Dict[str, t.List],
+        cast_types: t.Dict[str, type],
+    ) -> t.Iterator[t.Dict]:
+        """Validates the columns of a block and yields the errors in row order."""
+        # Errors are bucketed per row, in the order jsonschema sorts them: root errors
+        # first, then by column name, then in schema keyword order.
+        row_errors = defaultdict(list)
+        self._required_errors(n_rows, keys, columns, row_errors)
+        for key in sorted(keys, key=str):
+            if key in self.column_specs:
+                self._column_errors(
+                    self.column_specs[key],
+                    columns[key],
+                    cast_types.get(key),
+                    row_errors,
+                )
+            elif key in self.fallback_columns:
+                self._fallback_errors(
+                    key, self.fallback_columns[key], columns[key], row_errors
+                )
+
+        for row_num in sorted(row_errors):
+            errors = self.handle_errors(row_errors[row_num])
+            self.add_csv_location_spec(row_offset + row_num, errors)
+            yield from errors
+
+    def _required_errors(
+        self,
+        n_rows: int,
+        keys: t.List[str],
+        columns: t.Dict[str, t.List],
+        row_errors: dict,
+    ):
+        schema = self.validator.schema
+        required = schema.get("required", [])
+        if not required:
+            return
+        for row_num in range(n_rows):
+            missing = [
+                name
+                for name in required
+                if name not in columns or columns[name][row_num] is _MISSING
+            ]
+            if not missing:
+                continue
+            instance = {
+                k: columns[k][row_num]
+                for k in keys
+                if columns[k][row_num] is not _MISSING
+            }
+            for name in missing:
+                row_errors[row_num].append(
+                    ErrorRecord(
+                        "required",
+                        (),
+                        ("required",),
+                        instance,
+                        schema,
+                        f"{name!r} is a required property",
+                        self.max_value_length,
+                    )
+                )
+
+    def _column_errors(
+        self,
+        spec: ColumnSpec,
+        values: t.List,
+        cast_type: t.Optional[type],
+        row_errors: dict,
+    ):
+        path = (spec.name,)
+        for keyword, failed, message in spec.iter_failures(values, cast_type):
+            schema_path = ("properties", spec.name, keyword)
+            for row_num in failed:
+                row_errors[row_num].append(
+                    ErrorRecord(
+                        keyword,
+                        path,
+                        schema_path,
+                        values[row_num],
+                        spec.schema,
+                        message,
+                        self.max_value_length,
+                    )
+                )
+
+    def _fallback_errors(
+        self, name: str, schema: t.Any, values: t.List, row_errors: dict
+    ):
+        for row_num, value in enumerate(values):
+            if value is _MISSING:
+                continue
+            for error in self.validator.descend(
+                value, schema, path=name, schema_path=name
+            ):
+                error.schema_path.appendleft("properties")
+                row_errors[row_num].append(error)
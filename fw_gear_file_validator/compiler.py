@@ -0,0 +1,530 @@
+"""Compiles Draft 7 schemas into specialized Python validation code.
+
+`SchemaCompiler` walks the schema and generates one Python generator function per
+subschema, with the checks of each keyword written out inline (e.g. a `maximum` of 5
+becomes `if _is_number(instance) and instance > 5:`).  The generated functions yield
+the same `ValidationError`s, in the same order, as `jsonschema.Draft7Validator`.
+
+Subschemas using a keyword the compiler does not support are validated by a regular
+`Draft7Validator`, as are schemas with nested `$id`s, which change how references are
+resolved.  The generated source only refers to the schema through JSON pointers, so
+it can be cached and executed again for the same schema.
+"""
+import math
+import numbers
+import re
+import typing as t
+
+import jsonschema
+from jsonschema.exceptions import ValidationError
+
+from fw_gear_file_validator.schema import (
+    has_nested_ids,
+    parse_pointer,
+    resolve_pointer,
+)
+
+# Keywords with a code generator below.  Other Draft 7 keywords are delegated to
+# jsonschema, and unknown keywords are ignored, as jsonschema does.
+COMPILED_KEYWORDS = {
+    "$ref",
+    "type",
+    "enum",
+    "const",
+    "minimum",
+    "maximum",
+    "exclusiveMinimum",
+    "exclusiveMaximum",
+    "minLength",
+    "maxLength",
+    "pattern",
+    "minItems",
+    "maxItems",
+    "items",
+    "required",
+    "properties",
+    "additionalProperties",
+    "allOf",
+    "anyOf",
+    "format",  # Draft7Validator doesn't check formats by default
+}
+
+TYPE_CHECKS = {
+    "string": "isinstance({0}, str)",
+    "integer": "_is_integer({0})",
+    "number": "_is_number({0})",
+    "boolean": "isinstance({0}, bool)",
+    "null": "{0} is None",
+    "array": "isinstance({0}, list)",
+    "object": "isinstance({0}, dict)",
+}
+
+BOUNDS = {
+    "minimum": ("<", "is less than the minimum of"),
+    "maximum": (">", "is greater than the maximum of"),
+    "exclusiveMinimum": ("<=", "is less than or equal to the minimum of"),
+    "exclusiveMaximum": (">=", "is greater than or equal to the maximum of"),
+}
+
+
+def _is_number(instance: t.Any) -> bool:
+    return not isinstance(instance, bool) and isinstance(instance, numbers.Number)
+
+
+def _is_integer(instance: t.Any) -> bool:
+    if isinstance(instance, bool):
+        return False
+    return isinstance(instance, int) or (
+        isinstance(instance, float) and instance.is_integer()
+    )
+
+
+def _equal(one: t.Any, two: t.Any) -> bool:
+    """Returns whether two JSON values are equal, as jsonschema compares them for
+    `const` and `enum`: booleans are not equal to numbers, including within arrays
+    and objects."""
+    if isinstance(one, bool) or isinstance(two, bool):
+        return isinstance(one, bool) and isinstance(two, bool) and one == two
+    if isinstance(one, (list, tuple)) and isinstance(two, (list, tuple)):
+        return len(one) == len(two) and all(map(_equal, one, two))
+    if isinstance(one, dict) and isinstance(two, dict):
+        return len(one) == len(two) and all(
+            key in two and _equal(value, two[key]) for key, value in one.items()
+        )
+    return one == two
+
+
+def _error(message, keyword, value, instance, schema, path, schema_path, context=()):
+    return ValidationError(
+        message,
+        validator=keyword,
+        validator_value=value,
+        instance=instance,
+        schema=schema,
+        path=path,
+        schema_path=schema_path,
+        context=context,
+    )
+
+
+class SchemaCompiler:
+    """Generates the source code of a validation module for a schema."""
+
+    def __init__(self, schema: t.Union[dict, bool]):
+        self.schema = schema
+        self.lines = []
+        self.pointers = []
+        self.pointer_index = {}
+        self.patterns = []
+        self.functions = {}
+        self.pending = []
+
+    def generate(self) -> str:
+        """Returns the source of a module defining `validate(instance)`."""
+        if self._needs_fallback():
+            body = [
+                "def validate(instance):",
+                "    yield from _fallback_root(instance)",
+            ]
+            return "\n".join(body) + "\n"
+
+        root = self._function((), self.schema)
+        while self.pending:
+            name, pointer, node = self.pending.pop(0)
+            self._emit_function(name, pointer, node)
+
+        header = ["_s = ["]
+        header += [f"    _at(schema, {pointer!r})," for pointer in self.pointers]
+        header += ["]"]
+        header += [f"_p{i} = re.compile({p!r})" for i, p in enumerate(self.patterns)]
+        footer = [
+            "def validate(instance):",
+            f"    yield from {root}(instance, (), ())",
+        ]
+        return "\n".join(header + self.lines + footer) + "\n"
+
+    def _needs_fallback(self) -> bool:
+        if not isinstance(self.schema, (dict, bool)):
+            return True
+        return has_nested_ids(self.schema)
+
+    def _constant(self, pointer: t.Tuple) -> str:
+        """Returns an expression evaluating to the schema node at the pointer."""
+        if pointer not in self.pointer_index:
+            self.pointer_index[pointer] = len(self.pointers)
+            self.pointers.append(pointer)
+        return f"_s[{self.pointer_index[pointer]}]"
+
+    def _function(self, pointer: t.Tuple, node: t.Any) -> str:
+        """Returns the name of the function validating the node, queuing it if new."""
+        if pointer not in self.functions:
+            name = f"_v{len(self.functions)}"
+            self.functions[pointer] = name
+            self.pending.append((name, pointer, node))
+        return self.functions[pointer]
+
+    def _descend(
+        self,
+        pointer: t.Tuple,
+        node: t.Any,
+        instance: str,
+        keyword: str,
+        path: t.Optional[str] = None,
+        schema_path: t.Optional[str] = None,
+    ) -> str:
+        """Returns the statement validating an instance against a subschema.
+
+        `path` and `schema_path` are the expressions jsonschema's `descend` extends
+        the error paths with.  As with jsonschema, the errors of a False subschema are
+        reported at the location of the parent instance.
+        """
+        function = self._function(pointer, node)
+        path_expr = "path"
+        schema_parts = [repr(keyword)]
+        if node is not False:
+            if path is not None:
+                path_expr = f"path + ({path},)"
+            if schema_path is not None:
+                schema_parts.append(schema_path)
+        schema_expr = f"schema_path + ({', '.join(schema_parts)},)"
+        return f"yield from {function}({instance}, {path_expr}, {schema_expr})"
+
+    def _emit_function(self, name: str, pointer: t.Tuple, node: t.Any):
+        lines = [f"def {name}(instance, path, schema_path):"]
+        body = self._compile_node(pointer, node)
+        lines += ["    " + line for line in body]
+        # Makes every function a generator, even if it has no checks.
+        lines += ["    return", "    yield"]
+        self.lines += lines
+
+    def _compile_node(self, pointer: t.Tuple, node: t.Any) -> t.List[str]:
+        schema = self._constant(pointer)
+        if node is True:
+            return []
+        if node is False:
+            return [
+                "yield _error(f'False schema does not allow {instance!r}', None, None,"
+                f" instance, {schema}, path, schema_path)"
+            ]
+        if not isinstance(node, dict):
+            return [f"yield from _fallback(instance, {schema}, path, schema_path)"]
+
+        ref = node.get("$ref")
+        if ref is not None:
+            # In Draft 7, keywords next to a $ref are ignored.
+            target = self._ref_pointer(ref)
+            if target is None:
+                return [f"yield from _fallback(instance, {schema}, path, schema_path)"]
+            function = self._function(target, resolve_pointer(self.schema, ref))
+            return [f"yield from {function}(instance, path, schema_path)"]
+
+        keywords = [k for k in node if k in jsonschema.Draft7Validator.VALIDATORS]
+        if not all(self._is_compilable(k, node) for k in keywords):
+            return [f"yield from _fallback(instance, {schema}, path, schema_path)"]
+
+        lines = []
+        for keyword in keywords:
+            lines += getattr(self, f"_compile_{keyword}")(pointer, node, schema)
+        return lines
+
+    def _ref_pointer(self, ref: t.Any) -> t.Optional[t.Tuple]:
+        """Returns the pointer of a local reference, None if it can't be compiled."""
+        if not isinstance(ref, str) or not (ref == "#" or ref.startswith("#/")):
+            return None
+        try:
+            return parse_pointer(self.schema, ref)
+        except (KeyError, IndexError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _is_compilable(keyword: str, node: dict) -> bool:
+        value = node[keyword]
+        if keyword not in COMPILED_KEYWORDS:
+            return False
+        if keyword == "type":
+            types = [value] if isinstance(value, str) else value
+            return isinstance(types, list) and all(
+                isinstance(v, str) and v in TYPE_CHECKS for v in types
+            )
+        if keyword in BOUNDS:
+            return type(value) in (int, float) and math.isfinite(value)
+        if keyword in ("minLength", "maxLength", "minItems", "maxItems"):
+            return type(value) is int
+        if keyword == "pattern":
+            return isinstance(value, str)
+        if keyword in ("enum", "required", "allOf"):
+            return isinstance(value, list)
+        if keyword == "anyOf":
+            return isinstance(value, list) and len(value) > 0
+        if keyword == "properties":
+            return isinstance(value, dict)
+        if keyword == "additionalProperties":
+            # Extra properties are collected in a set by jsonschema, so the order of
+            # the errors below an additionalProperties schema isn't reproducible.
+            return isinstance(value, bool) and "patternProperties" not in node
+        if keyword == "items":
+            return isinstance(value, (dict, bool, list))
+        return True
+
+    @staticmethod
+    def _error(message: str, keyword: str, value: str, schema: str) -> str:
+        return (
+            f"yield _error({message}, {keyword!r}, {value}, instance, {schema}, path,"
+            f" schema_path + ({keyword!r},))"
+        )
+
+    def _compile_type(self, pointer, node, schema):
+        value = node["type"]
+        types = [value] if isinstance(value, str) else value
+        check = " or ".join(TYPE_CHECKS[v].format("instance") for v in types) or "False"
+        reprs = ", ".join(repr(v) for v in types)
+        message = f"f'{{instance!r}} is not of type ' + {reprs!r}"
+        value_expr = self._constant(pointer + ("type",))
+        return [
+            f"if not ({check}):",
+            "    " + self._error(message, "type", value_expr, schema),
+        ]
+
+    def _compile_enum(self, pointer, node, schema):
+        enums = node["enum"]
+        value_expr = self._constant(pointer + ("enum",))
+        message = f"f'{{instance!r}} is not one of ' + {repr(enums)!r}"
+        if enums and all(isinstance(v, str) for v in enums):
+            members = repr(frozenset(enums))
+            check = f"isinstance(instance, str) and instance in {members}"
+        else:
+            check = f"any(_equal(each, instance) for each in {value_expr})"
+        return [
+            f"if not ({check}):",
+            "    " + self._error(message, "enum", value_expr, schema),
+        ]
+
+    def _compile_const(self, pointer, node, schema):
+        value_expr = self._constant(pointer + ("const",))
+        message = repr(f"{node['const']!r} was expected")
+        return [
+            f"if not _equal(instance, {value_expr}):",
+            "    " + self._error(message, "const", value_expr, schema),
+        ]
+
+    def _compile_bound(self, keyword, node, schema):
+        operator, text = BOUNDS[keyword]
+        value = node[keyword]
+        message = f"f'{{instance!r}} {text} ' + {repr(value)!r}"
+        return [
+            f"if _is_number(instance) and instance {operator} {value!r}:",
+            "    " + self._error(message, keyword, repr(value), schema),
+        ]
+
+    def _compile_minimum(self, pointer, node, schema):
+        return self._compile_bound("minimum", node, schema)
+
+    def _compile_maximum(self, pointer, node, schema):
+        return self._compile_bound("maximum", node, schema)
+
+    def _compile_exclusiveMinimum(self, pointer, node, schema):
+        return self._compile_bound("exclusiveMinimum", node, schema)
+
+    def _compile_exclusiveMaximum(self, pointer, node, schema):
+        return self._compile_bound("exclusiveMaximum", node, schema)
+
+    def _compile_length(self, keyword, node, schema, check, operator):
+        value = node[keyword]
+        if keyword.startswith("min"):
+            text = "should be non-empty" if value == 1 else "is too short"
+        else:
+            text = "is expected to be empty" if value == 0 else "is too long"
+        message = f"f'{{instance!r}} {text}'"
+        return [
+            f"if {check} and len(instance) {operator} {value!r}:",
+            "    " + self._error(message, keyword, repr(value), schema),
+        ]
+
+    def _compile_minLength(self, pointer, node, schema):
+        return self._compile_length(
+            "minLength", node, schema, "isinstance(instance, str)", "<"
+        )
+
+    def _compile_maxLength(self, pointer, node, schema):
+        return self._compile_length(
+            "maxLength", node, schema, "isinstance(instance, str)", ">"
+        )
+
+    def _compile_minItems(self, pointer, node, schema):
+        return self._compile_length(
+            "minItems", node, schema, "isinstance(instance, list)", "<"
+        )
+
+    def _compile_maxItems(self, pointer, node, schema):
+        return self._compile_length(
+            "maxItems", node, schema, "isinstance(instance, list)", ">"
+        )
+
+    def _compile_pattern(self, pointer, node, schema):
+        pattern = node["pattern"]
+        compiled = f"_p{len(self.patterns)}"
+        self.patterns.append(pattern)
+        message = f"f'{{instance!r}} does not match ' + {repr(pattern)!r}"
+        return [
+            f"if isinstance(instance, str) and not {compiled}.search(instance):",
+            "    " + self._error(message, "pattern", repr(pattern), schema),
+        ]
+
+    def _compile_required(self, pointer, node, schema):
+        value_expr = self._constant(pointer + ("required",))
+        message = "f'{_name!r} is a required property'"
+        return [
+            "if isinstance(instance, dict):",
+            f"    for _name in {value_expr}:",
+            "        if _name not in instance:",
+            "            " + self._error(message, "required", value_expr, schema),
+        ]
+
+    def _compile_properties(self, pointer, node, schema):
+        lines = []
+        for name, subschema in node["properties"].items():
+            if subschema is True:
+                continue
+            statement = self._descend(
+                pointer + ("properties", name),
+                subschema,
+                f"instance[{name!r}]",
+                "properties",
+                repr(name),
+                repr(name),
+            )
+            lines += [f"    if {name!r} in instance:", f"        {statement}"]
+        if not lines:
+            return []
+        return ["if isinstance(instance, dict):"] + lines
+
+    def _compile_additionalProperties(self, pointer, node, schema):
+        if node["additionalProperties"] is not False:
+            return []
+        properties = repr(frozenset(node.get("properties", {})))
+        message = (
+            "'Additional properties are not allowed (%s %s unexpected)' % "
+            "(', '.join(repr(e) for e in _extras), 'was' if len(_extras) == 1 "
+            "else 'were')"
+        )
+        return [
+            "if isinstance(instance, dict):",
+            f"    _extras = sorted({{k for k in instance if k not in {properties}}},"
+            " key=str)",
+            "    if _extras:",
+            "        " + self._error(message, "additionalProperties", "False", schema),
+        ]
+
+    def _compile_items(self, pointer, node, schema):
+        items = node["items"]
+        if isinstance(items, list):
+            lines = []
+            for index, subschema in enumerate(items):
+                statement = self._descend(
+                    pointer + ("items", index),
+                    subschema,
+                    f"instance[{index}]",
+                    "items",
+                    repr(index),
+                    repr(index),
+                )
+                lines += [f"    if len(instance) > {index}:", f"        {statement}"]
+            return ["if isinstance(instance, list):"] + lines if lines else []
+        if items is True:
+            return []
+        statement = self._descend(
+            pointer + ("items",), items, "_item", "items", "_index"
+        )
+        return [
+            "if isinstance(instance, list):",
+            "    for _index, _item in enumerate(instance):",
+            f"        {statement}",
+        ]
+
+    def _compile_allOf(self, pointer, node, schema):
+        return [
+            self._descend(
+                pointer + ("allOf", index),
+                subschema,
+                "instance",
+                "allOf",
+                schema_path=repr(index),
+            )
+            for index, subschema in enumerate(node["allOf"])
+        ]
+
+    def _compile_anyOf(self, pointer, node, schema):
+        value_expr = self._constant(pointer + ("anyOf",))
+        # (function, relative schema path of its errors), see `_descend`.
+        functions = [
+            "({}, {})".format(
+                self._function(pointer + ("anyOf", index), subschema),
+                "()" if subschema is False else f"({index},)",
+            )
+            for index, subschema in enumerate(node["anyOf"])
+        ]
+        message = "f'{instance!r} is not valid under any of the given schemas'"
+        return [
+            "_all_errors = []",
+            f"for _function, _schema_path in ({', '.join(functions)},):",
+            "    _errors = list(_function(instance, (), _schema_path))",
+            "    if not _errors:",
+            "        break",
+            "    _all_errors.extend(_errors)",
+            "else:",
+            f"    yield _error({message}, 'anyOf', {value_expr}, instance, {schema},"
+            " path, schema_path + ('anyOf',), _all_errors)",
+        ]
+
+    def _compile_format(self, pointer, node, schema):
+        return []
+
+
+class CompiledValidator:
+    """Validator running the code generated by `SchemaCompiler`.
+
+    Exposes the parts of the `jsonschema.Draft7Validator` interface used by the
+    validators of this package.
+    """
+
+    def __init__(self, schema: t.Union[dict, bool], source: t.Optional[str] = None):
+        self.schema = schema
+        self.fallback = jsonschema.Draft7Validator(schema)
+        self.source = source or SchemaCompiler(schema).generate()
+        namespace = {
+            "schema": schema,
+            "re": re,
+            "_at": self._at,
+            "_error": _error,
+            "_equal": _equal,
+            "_is_number": _is_number,
+            "_is_integer": _is_integer,
+            "_fallback": self._fallback,
+            "_fallback_root": self.fallback.iter_errors,
+        }
+        exec(compile(self.source, "<compiled schema>", "exec"), namespace)
+        self._validate = namespace["validate"]
+
+    @staticmethod
+    def _at(schema: t.Any, pointer: t.Tuple) -> t.Any:
+        for part in pointer:
+            schema = schema[part]
+        return schema
+
+    def _fallback(
+        self, instance: t.Any, schema: t.Any, path: t.Tuple, schema_path: t.Tuple
+    ) -> t.Iterator[ValidationError]:
+        for error in self.fallback.descend(instance, schema):
+            error.path.extendleft(reversed(path))
+            error.schema_path.extendleft(reversed(schema_path))
+            yield error
+
+    def iter_errors(self, instance: t.Any) -> t.Iterator[ValidationError]:
+        return self._validate(instance)
+
+    def descend(self, *args, **kwargs) -> t.Iterator[ValidationError]:
+        return self.fallback.descend(*args, **kwargs)
+
+    @property
+    def resolver(self):
+        return self.fallback.resolver
@@ -0,0 +1,134 @@
+"""Reading of compressed files, decompressed on the fly.
+
+Files compressed with gzip, bzip2 or xz, or stored alone in a zip archive, are
+recognized by their last extension (e.g. "data.csv.gz") and read through a
+decompressing stream, so that the decompressed content is never written to disk nor
+held in memory in full.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+import struct
+import typing as t
+import zipfile
+from pathlib import Path
+
+# Assumed compression ratio of the formats that don't record the original size.
+DEFAULT_COMPRESSION_RATIO = 5
+
+# Errors raised when reading corrupted compressed files.
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, zipfile.BadZipFile)
+
+
+def _zip_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) != 1:
+        raise ValueError(
+            f"Expected a single file in zip archive {archive.filename}, "
+            f"found {len(members)}"
+        )
+    return members[0]
+
+
+class _ZipMemberReader(io.TextIOWrapper):
+    """Text reader of the file of a zip archive, closing the archive with it."""
+
+    def __init__(self, archive: zipfile.ZipFile, **kwargs):
+        self._archive = archive
+        super().__init__(archive.open(_zip_member(archive)), **kwargs)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._archive.close()
+
+
+def _open_zip(file_path: Path, encoding: str = None, newline: str = None) -> t.TextIO:
+    archive = zipfile.ZipFile(file_path)
+    try:
+        return _ZipMemberReader(archive, encoding=encoding, newline=newline)
+    except BaseException:
+        archive.close()
+        raise
+
+
+def _open_compressed(opener: t.Callable) -> t.Callable[..., t.TextIO]:
+    def open_text(file_path: Path, encoding: str = None, newline: str = None):
+        return opener(file_path, "rt", encoding=encoding, newline=newline)
+
+    return open_text
+
+
+# Openers of the compressed files by extension.
+COMPRESSIONS = {
+    ".gz": _open_compressed(gzip.open),
+    ".bz2": _open_compressed(bz2.open),
+    ".xz": _open_compressed(lzma.open),
+    ".zip": _open_zip,
+}
+
+
+def compression(file_path: t.Union[Path, str]) -> t.Optional[str]:
+    """Returns the compression extension of the file (e.g. ".gz"), if any."""
+    suffix = Path(file_path).suffix.lower()
+    return suffix if suffix in COMPRESSIONS else None
+
+
+def content_extension(file_path: t.Union[Path, str]) -> str:
+    """Returns the extension of the content of the file, e.g. ".csv" for data.csv.gz.
+
+    For a zip archive named without it (e.g. data.zip), this is the extension of the
+    file in the archive, if it can be read.
+    """
+    path = Path(file_path)
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes and suffixes[-1] in COMPRESSIONS:
+        compressed_with = suffixes.pop()
+        if not suffixes and compressed_with == ".zip" and path.is_file():
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    return Path(_zip_member(archive).filename).suffix.lower()
+            except (ValueError, zipfile.BadZipFile):
+                return ""
+    return suffixes[-1] if suffixes else ""
+
+
+def open_text(
+    file_path: t.Union[Path, str], encoding: str = None, newline: str = None
+) -> t.TextIO:
+    """Opens the file in text mode, decompressing it on the fly if compressed."""
+    opener = COMPRESSIONS.get(compression(file_path))
+    if opener is None:
+        return open(file_path, "r", encoding=encoding, newline=newline)
+    return opener(file_path, encoding=encoding, newline=newline)
+
+
+def uncompressed_size(file_path: t.Union[Path, str]) -> int:
+    """Returns the size of the content of the file, in bytes.
+
+    The size is exact for uncompressed and zip files and, up to 4 GB, gzip files.
+    It is estimated with DEFAULT_COMPRESSION_RATIO for the others.
+    """
+    size = os.path.getsize(file_path)
+    compressed_with = compression(file_path)
+    if compressed_with == ".gz" and size >= 18:
+        # The last 4 bytes hold the size modulo 2^32.
+        with open(file_path, "rb") as fp:
+            fp.seek(-4, os.SEEK_END)
+            original_size = struct.unpack("<I", fp.read(4))[0]
+        # Sizes over 4 GB wrap around, and can't be smaller than the compressed size.
+        while original_size < size:
+            original_size += 2**32
+        return original_size
+    if compressed_with == ".zip":
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                return _zip_member(archive).file_size
+        except (ValueError, zipfile.BadZipFile):
+            return size
+    if compressed_with is not None:
+        return size * DEFAULT_COMPRESSION_RATIO
+    return size
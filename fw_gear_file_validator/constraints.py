@@ -0,0 +1,376 @@
+"""Constraints across the rows of CSV files: unique keys and foreign keys.
+
+JSON Schema validates each row on its own.  The root of a CSV schema can also declare
+keys that must be unique in the file, and keys that must exist in another (CSV, JSON
+or NDJSON) file, with two extension keywords that JSON Schema ignores:
+
+    "uniqueKeys": [["subject_id"], ["subject_label", "session_label"]],
+    "foreignKeys": [
+        {
+            "columns": ["session_id"],
+            "reference": {"file": "sessions.csv", "columns": ["id"]}
+        }
+    ]
+
+Both are checked in the same pass as the schema, as the rows go through the
+validator, with hash indexes of the keys seen so far and of the keys of the
+referenced files.  Indexes growing over a number of keys are spilled to a SQLite
+database on disk, so that very large key sets don't have to fit in memory.
+
+Rows missing a value of a key are not checked, as in SQL; use "required" and
+"minLength" to require the values.
+"""
+import json
+import logging
+import os
+import tempfile
+import typing as t
+from contextlib import ExitStack
+from pathlib import Path
+
+from fw_gear_file_validator.compression import content_extension
+from fw_gear_file_validator.loader import SUPPORTED_FILE_EXTENSIONS, Loader
+from fw_gear_file_validator.records import MAX_LENGTH, ErrorRecord
+from fw_gear_file_validator.schema import CONSTRAINT_KEYWORDS
+
+if t.TYPE_CHECKING:
+    import sqlite3
+
+log = logging.getLogger(__name__)
+
+# Default number of keys of an index held in memory before spilling it to disk.
+MAX_INDEX_KEYS = 1000000
+
+Key = t.Tuple[str, ...]
+
+
+class KeyIndex:
+    """Hash index of keys, mapped to the line where they were first seen.
+
+    Keys are held in a dict until there are more than max_keys of them, then moved
+    to a SQLite database in a temporary file, deleted when the index is closed.
+    """
+
+    def __init__(self, max_keys: int = MAX_INDEX_KEYS, spill_dir: str = None):
+        """
+        Args:
+            max_keys: number of keys held in memory, 0 for no limit
+            spill_dir: directory of the database, the system default if None
+        """
+        self.max_keys = max_keys
+        self.spill_dir = spill_dir
+        self._keys: t.Dict[Key, int] = {}
+        self._db: t.Optional["sqlite3.Connection"] = None
+        self._db_path: t.Optional[str] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._db is not None
+
+    def setdefault(self, key: Key, line: int) -> int:
+        """Adds the key if it is new, returns the line it was first seen at."""
+        if self._db is None:
+            first_line = self._keys.setdefault(key, line)
+            if self.max_keys and len(self._keys) > self.max_keys:
+                self._spill()
+            return first_line
+        encoded = json.dumps(key)
+        inserted = self._db.execute(
+            "INSERT OR IGNORE INTO keys VALUES (?, ?)", (encoded, line)
+        ).rowcount
+        if inserted:
+            return line
+        return self._db.execute(
+            "SELECT line FROM keys WHERE key = ?", (encoded,)
+        ).fetchone()[0]
+
+    def __contains__(self, key: Key) -> bool:
+        if self._db is None:
+            return key in self._keys
+        row = self._db.execute(
+            "SELECT 1 FROM keys WHERE key = ?", (json.dumps(key),)
+        ).fetchone()
+        return row is not None
+
+    def _spill(self):
+        import sqlite3
+
+        fd, self._db_path = tempfile.mkstemp(dir=self.spill_dir, suffix=".sqlite")
+        os.close(fd)
+        log.info(f"Spilling an index of {len(self._keys)} keys to {self._db_path}")
+        # The database is private and temporary, durability is not needed.
+        self._db = sqlite3.connect(self._db_path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute(
+            "CREATE TABLE keys (key TEXT PRIMARY KEY, line INTEGER) WITHOUT ROWID"
+        )
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "INSERT INTO keys VALUES (?, ?)",
+            ((json.dumps(key), line) for key, line in self._keys.items()),
+        )
+        self._keys = {}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.remove(self._db_path)
+        self._keys = {}
+
+    def __enter__(self) -> "KeyIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def key_value(value: t.Any) -> t.Optional[str]:
+    """Returns the value as compared in keys, None for missing values.
+
+    Values are compared as they are written in the files: CSV values as is, and
+    JSON values other than strings in their JSON form (e.g. 1 as "1").
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def get_key(record: t.Mapping, columns: t.List[str]) -> t.Optional[Key]:
+    """Returns the key of the record, None if it misses a value."""
+    key = tuple(key_value(record.get(column)) for column in columns)
+    return None if None in key else key
+
+
+def _check_columns(value: t.Any, keyword: str) -> t.List[str]:
+    if (
+        not isinstance(value, list)
+        or not value
+        or not all(isinstance(column, str) for column in value)
+    ):
+        raise ValueError(f"{keyword} must list column names, got {value!r}")
+    return value
+
+
+class RowConstraints:
+    """The unique and foreign keys declared in a CSV schema.
+
+    Args:
+        unique_keys: the columns of each unique key
+        foreign_keys: the foreign key declarations, as in the schema
+        reference_dir: directory the referenced files are relative to, the current
+            directory if None
+        max_keys: number of keys of an index held in memory, 0 for no limit
+        spill_dir: directory of the indexes spilled to disk
+    """
+
+    def __init__(
+        self,
+        unique_keys: t.List[t.List[str]],
+        foreign_keys: t.List[t.Dict[str, t.Any]],
+        reference_dir: t.Optional[t.Union[Path, str]] = None,
+        max_keys: int = MAX_INDEX_KEYS,
+        spill_dir: t.Optional[str] = None,
+    ):
+        self.unique_keys = [
+            _check_columns(columns, "uniqueKeys") for columns in unique_keys
+        ]
+        for foreign_key in foreign_keys:
+            reference = None
+            if isinstance(foreign_key, dict):
+                reference = foreign_key.get("reference")
+            if not isinstance(reference, dict) or "file" not in reference:
+                raise ValueError(
+                    f"foreignKeys must have a reference file, got {foreign_key!r}"
+                )
+            columns = _check_columns(foreign_key.get("columns"), "foreignKeys")
+            reference_columns = _check_columns(
+                reference.get("columns", columns), "foreignKeys reference"
+            )
+            if len(columns) != len(reference_columns):
+                raise ValueError(
+                    "foreignKeys columns and reference columns must have the same "
+                    f"length, got {foreign_key!r}"
+                )
+        self.foreign_keys = foreign_keys
+        self.reference_dir = reference_dir
+        self.max_keys = max_keys
+        self.spill_dir = spill_dir
+
+    @classmethod
+    def from_schema(cls, schema: t.Any, **kwargs) -> t.Optional["RowConstraints"]:
+        """Returns the constraints declared in the schema, None if there are none.
+
+        Raises:
+            ValueError: if the declarations are invalid.
+        """
+        if not isinstance(schema, dict) or not CONSTRAINT_KEYWORDS & schema.keys():
+            return None
+        unique_keys = schema.get("uniqueKeys", [])
+        foreign_keys = schema.get("foreignKeys", [])
+        if not isinstance(unique_keys, list) or not isinstance(foreign_keys, list):
+            raise ValueError("uniqueKeys and foreignKeys must be lists")
+        return cls(unique_keys, foreign_keys, **kwargs)
+
+    def reference_path(self, foreign_key: t.Dict[str, t.Any]) -> Path:
+        path = Path(foreign_key["reference"]["file"])
+        if self.reference_dir and not path.is_absolute():
+            path = Path(self.reference_dir) / path
+        return path
+
+    def load_reference(self, foreign_key: t.Dict[str, t.Any]) -> KeyIndex:
+        """Returns the index of the keys of the file referenced by the foreign key.
+
+        Raises:
+            ValueError: if the file can't be read.
+        """
+        path = self.reference_path(foreign_key)
+        reference = foreign_key["reference"]
+        columns = reference.get("columns", foreign_key["columns"])
+        index = KeyIndex(self.max_keys, self.spill_dir)
+        try:
+            for line, record in enumerate(iter_records(path)):
+                key = get_key(record, columns) if isinstance(record, dict) else None
+                if key is not None:
+                    index.setdefault(key, line + 1)
+        except OSError as e:
+            index.close()
+            raise ValueError(
+                f"Reference file {path} of foreign key {foreign_key['columns']} "
+                f"can't be read: {e}"
+            )
+        except BaseException:
+            index.close()
+            raise
+        return index
+
+    def check(
+        self, rows: t.Iterable[t.Dict], max_value_length: int = MAX_LENGTH
+    ) -> "ConstraintCheck":
+        return ConstraintCheck(self, rows, max_value_length)
+
+
+class ConstraintCheck:
+    """Checks the constraints on the rows as they are read.
+
+    Iterating over the check yields the rows unchanged, the errors are collected in
+    `errors` along the way.  The indexes are released when the check is closed.
+    """
+
+    def __init__(
+        self,
+        constraints: RowConstraints,
+        rows: t.Iterable[t.Dict],
+        max_value_length: int = MAX_LENGTH,
+    ):
+        self.constraints = constraints
+        self.rows = rows
+        self.max_value_length = max_value_length
+        self.errors: t.List[ErrorRecord] = []
+        self._stack = ExitStack()
+
+    def __iter__(self) -> t.Iterator[t.Dict]:
+        constraints = self.constraints
+        unique_indexes = [
+            self._stack.enter_context(
+                KeyIndex(constraints.max_keys, constraints.spill_dir)
+            )
+            for _ in constraints.unique_keys
+        ]
+        reference_indexes = [
+            self._stack.enter_context(constraints.load_reference(foreign_key))
+            for foreign_key in constraints.foreign_keys
+        ]
+        for row_num, row in enumerate(self.rows):
+            for position, columns in enumerate(constraints.unique_keys):
+                key = get_key(row, columns)
+                if key is None:
+                    continue
+                first_line = unique_indexes[position].setdefault(key, row_num + 1)
+                if first_line != row_num + 1:
+                    self._add_error(
+                        "uniqueKeys",
+                        position,
+                        row_num,
+                        columns,
+                        key,
+                        columns,
+                        f"Duplicate key {_render(columns, key)}, first found on "
+                        f"line {first_line}",
+                    )
+            for position, foreign_key in enumerate(constraints.foreign_keys):
+                columns = foreign_key["columns"]
+                key = get_key(row, columns)
+                if key is None or key in reference_indexes[position]:
+                    continue
+                self._add_error(
+                    "foreignKeys",
+                    position,
+                    row_num,
+                    columns,
+                    key,
+                    foreign_key,
+                    f"Key {_render(columns, key)} not found in "
+                    f"{foreign_key['reference']['file']}",
+                )
+            yield row
+
+    def _add_error(
+        self,
+        code: str,
+        position: int,
+        row_num: int,
+        columns: t.List[str],
+        key: Key,
+        expected: t.Any,
+        message: str,
+    ):
+        error = ErrorRecord(
+            code,
+            (),
+            (code, position),
+            dict(zip(columns, key)),
+            expected,
+            message,
+            self.max_value_length,
+        )
+        error["location"] = {"line": row_num + 1, "column_name": ",".join(columns)}
+        self.errors.append(error)
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self) -> "ConstraintCheck":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _render(columns: t.List[str], key: Key) -> str:
+    return ", ".join(f"{column}={value!r}" for column, value in zip(columns, key))
+
+
+def iter_records(path: Path) -> t.Iterator[t.Any]:
+    """Yields the records of a CSV, JSON (list of objects) or NDJSON file."""
+    file_type = SUPPORTED_FILE_EXTENSIONS.get(content_extension(path))
+    if file_type is None:
+        raise ValueError(f"Reference file type of {path.name} is not supported")
+    # Raises FileNotFoundError for missing files, rather than the loader's ValueError.
+    path.stat()
+    # Only JSON files are loaded in full.
+    loader = Loader.factory(file_type, config={"streaming": file_type != "json"})
+    content = loader.load_object(path)
+    if file_type == "ndjson":
+        for line in content:
+            try:
+                yield json.loads(line) if line.strip() else None
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Error loading reference file {path.name}: {e}")
+    elif file_type == "json" and not isinstance(content, list):
+        raise ValueError(f"Reference file {path.name} must hold a list of objects")
+    else:
+        yield from content
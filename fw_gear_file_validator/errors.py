@@ -1,15 +1,25 @@
+import gzip
+import json
 import logging
 import typing as t
-
-from flywheel_gear_toolkit import GearToolkitContext
+from pathlib import Path
 
 from fw_gear_file_validator.utils import PARENT_ORDER, FwReference
 
+if t.TYPE_CHECKING:
+    from flywheel_gear_toolkit import GearToolkitContext
+
 log = logging.getLogger(__name__)
 
+# Number of sample errors saved in the summary for each group of errors.
+N_SAMPLES = 5
+
 
 def add_flywheel_location_to_errors(fw_ref: FwReference, packaged_errors: list):
     """Takes a set of packaged errors and adds flywheel hierarchy info to them."""
+    if not packaged_errors:
+        # Avoids fetching the hierarchy when there is nothing to locate.
+        return packaged_errors
     hierarchy = fw_ref.hierarchy_objects
     fw_url = fw_ref.get_lookup_path()
     if fw_ref.contents == "file":
@@ -18,7 +28,7 @@ def add_flywheel_location_to_errors(fw_ref: FwReference, packaged_errors: list):
             e["container_id"] = hierarchy["file"]["file_id"]
     else:
         for e in packaged_errors:
-            location = e["location"].split(".")[0]
+            location = error_level(e, fw_ref.type)
             if location not in PARENT_ORDER:
                 raise ValueError(
                     f"Value {location} not valid flywheel hierarchy location"
@@ -30,17 +40,128 @@ def add_flywheel_location_to_errors(fw_ref: FwReference, packaged_errors: list):
     return packaged_errors
 
 
+def error_level(error: t.Mapping, default: str) -> str:
+    """Returns the hierarchy level of an error on a Flywheel object.
+
+    The level is the first property of the key path of the error, e.g. "session"
+    for "properties.session.properties.age", read the same way from ErrorRecords
+    and from errors already rendered as dicts.  Errors on the hierarchy itself
+    (e.g. a missing level) are located at default.
+    """
+    steps = error["location"].get("key_path", "").split(".")
+    for step, next_step in zip(steps, steps[1:]):
+        if step == "properties":
+            return next_step
+    return default
+
+
 def save_errors_metadata(
-    errors: t.List[t.Dict], input_file: FwReference, gtk_context: GearToolkitContext
-):
-    """Saves the packaged errors to file metadata."""
-    if not errors:
-        state = "PASS"
-        meta_dict = {}
-    else:
-        state = "FAIL"
-        meta_dict = {"data": errors}
+    errors: t.List[t.Dict],
+    input_file: FwReference,
+    gtk_context: "GearToolkitContext",
+    timings: t.Optional[t.Dict] = None,
+    result_key: t.Optional[str] = None,
+    partial: t.Optional[str] = None,
+) -> t.Tuple[str, t.Dict]:
+    """Saves a summary of the packaged errors to file metadata.
+
+    The full list of errors is written to a gzipped NDJSON file in the output
+    directory (see `write_errors`), whose name is saved with the summary.  The
+    timings of the run and the key of its result (see `results.result_key`), if
+    given, are saved with it as well.  partial is the reason the validation stopped
+    early, if it did (see `budget`).
 
+    Returns:
+        The QC state and the data saved with it.
+    """
+    errors_path = Path(gtk_context.output_dir) / errors_file_name(input_file.name)
+    state, meta_dict = qc_result(errors, errors_path, partial)
+    if timings:
+        meta_dict["timings"] = timings
+    if result_key:
+        meta_dict["result_key"] = result_key
     gtk_context.metadata.add_qc_result(
         input_file.name, "validation", state=state, **meta_dict
     )
+    return state, meta_dict
+
+
+def qc_result(
+    errors: t.List[t.Dict], errors_path: Path, partial: t.Optional[str] = None
+) -> t.Tuple[str, t.Dict]:
+    """Returns the QC state and data of the packaged errors.
+
+    If there are errors, they are written to errors_path and the data holds their
+    summary.  If the validation stopped early, the data holds the reason as
+    "partial", and the state is FAIL even without errors, as the rest of the input
+    wasn't validated.
+    """
+    if not errors and not partial:
+        return "PASS", {}
+    if errors:
+        summary = write_errors(errors, errors_path)
+        log.info(f"Saved {len(errors)} errors to {errors_path}")
+        data = {
+            "data": summary,
+            "error_count": len(errors),
+            "errors_file": errors_path.name,
+        }
+    else:
+        data = {"error_count": 0}
+    if partial:
+        data["partial"] = partial
+    return "FAIL", data
+
+
+def errors_file_name(input_name: str) -> str:
+    return f"{input_name}.errors.ndjson.gz"
+
+
+def write_errors(
+    errors: t.Iterable[t.Mapping], path: Path, n_samples: int = N_SAMPLES
+) -> t.List[t.Dict]:
+    """Writes the errors to a gzipped NDJSON file and returns their summary.
+
+    Errors are written one per line as they are iterated over.  The summary groups
+    them by code and location (column name for csv files, key path for json files),
+    with the number of errors and the first n_samples errors of each group, e.g.:
+        {
+            "code": "maximum",
+            "location": {"column_name": "age"},
+            "count": 1520,
+            "message": "101 is greater than the maximum of 100",
+            "samples": [
+                {"location": {"line": 12, "column_name": "age"}, "value": "101"},
+                ...
+            ]
+        }
+    """
+    groups = {}
+    with gzip.open(path, "wt", encoding="UTF-8") as fp:
+        for error in errors:
+            error = dict(error)
+            fp.write(json.dumps(error, default=str))
+            fp.write("\n")
+
+            location = {k: v for k, v in error["location"].items() if k != "line"}
+            key = (error["code"], json.dumps(location, default=str, sort_keys=True))
+            if "flywheel_path" in error:
+                key += (error["flywheel_path"],)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "code": error["code"],
+                    "location": location,
+                    "count": 0,
+                    "message": error["message"],
+                    "samples": [],
+                }
+                for fw_key in ("flywheel_path", "container_id"):
+                    if fw_key in error:
+                        group[fw_key] = error[fw_key]
+            group["count"] += 1
+            if len(group["samples"]) < n_samples:
+                group["samples"].append(
+                    {"location": error["location"], "value": error["value"]}
+                )
+    return list(groups.values())
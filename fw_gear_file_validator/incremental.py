@@ -0,0 +1,246 @@
+"""Incremental validation of CSV files, reusing the errors of unchanged chunks.
+
+Files uploaded again with a few rows appended or changed are mostly made of rows
+already validated.  The rows are split into chunks whose boundaries depend on their
+content: a chunk ends after a row whose checksum matches a pattern (or once it is
+MAX_CHUNK_ROWS long).  Inserting or changing a row only changes the chunk holding it
+and, at worst, the next one, while the other chunks keep the same rows, wherever
+they are in the file.
+
+The errors of each chunk are saved in a SQLite database of the cache directory,
+keyed by a hash of the rows of the chunk, the schema and the options changing the
+reported errors, with line numbers relative to the chunk.  A chunk seen before
+reuses its errors, moved to its current lines, and only the other chunks are
+validated.
+
+Row errors only depend on the row, but unique and foreign keys (see `constraints`)
+depend on the whole file, and are checked on all the rows on every run.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import sqlite3
+import time
+import typing as t
+import zlib
+from contextlib import closing
+from pathlib import Path
+
+from fw_gear_file_validator.cache import schema_hash
+
+if t.TYPE_CHECKING:
+    from fw_gear_file_validator.validator import CsvValidator
+
+log = logging.getLogger(__name__)
+
+# Bump when the content of the chunk results changes.
+CHUNK_STORE_VERSION = 1
+# A chunk ends after a row whose checksum has these bits unset, 1 row in 4096 on
+# average, once it has MIN_CHUNK_ROWS rows, and at most after MAX_CHUNK_ROWS rows.
+BOUNDARY_MASK = 0xFFF
+MIN_CHUNK_ROWS = 256
+MAX_CHUNK_ROWS = 16384
+# Number of rows of consecutive changed chunks validated together, so that parallel
+# validators get them in large enough batches.
+MAX_PENDING_ROWS = 65536
+# Number of chunk results kept, the least recently used are removed first.
+MAX_CHUNKS = 100000
+
+# Index of the first row, rows and key of a chunk.
+Chunk = t.Tuple[int, t.List[t.Dict], str]
+
+
+def iter_chunks(
+    rows: t.Iterable[t.Dict],
+    start: int = 0,
+    min_rows: int = MIN_CHUNK_ROWS,
+    max_rows: int = MAX_CHUNK_ROWS,
+    mask: int = BOUNDARY_MASK,
+) -> t.Iterator[Chunk]:
+    """Splits the rows into content-defined chunks.
+
+    A chunk ends after its max_rows-th row, or after a row whose CRC-32 checksum
+    has the bits of mask unset, once it has min_rows rows.
+
+    Yields:
+        (index of the first row, rows, hash of the rows) tuples.
+    """
+    chunk = []
+    digest = hashlib.sha256()
+    for row in rows:
+        content = repr(tuple(row.items())).encode("UTF-8")
+        chunk.append(row)
+        digest.update(content)
+        digest.update(b"\n")
+        if len(chunk) >= max_rows or (
+            len(chunk) >= min_rows and not zlib.crc32(content) & mask
+        ):
+            yield start, chunk, digest.hexdigest()
+            start += len(chunk)
+            chunk = []
+            digest = hashlib.sha256()
+    if chunk:
+        yield start, chunk, digest.hexdigest()
+
+
+class ChunkStore:
+    """The errors of validated chunks, in a SQLite database of the cache directory.
+
+    Args:
+        cache_dir: directory of the database
+        max_chunks: number of chunk results kept
+    """
+
+    def __init__(self, cache_dir: t.Union[Path, str], max_chunks: int = MAX_CHUNKS):
+        self.path = Path(cache_dir) / "chunks.sqlite"
+        self.max_chunks = max_chunks
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=60)
+        # Concurrent runs can read while one writes.
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks "
+            "(key TEXT PRIMARY KEY, errors TEXT, used REAL) WITHOUT ROWID"
+        )
+        return db
+
+    @staticmethod
+    def get(db: sqlite3.Connection, key: str) -> t.Optional[t.List[t.Dict]]:
+        """Returns the errors of the chunk, with lines relative to the chunk."""
+        row = db.execute("SELECT errors FROM chunks WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    @staticmethod
+    def touch(db: sqlite3.Connection, keys: t.List[str]):
+        """Marks the chunks as recently used."""
+        now = time.time()
+        db.executemany(
+            "UPDATE chunks SET used = ? WHERE key = ?", ((now, key) for key in keys)
+        )
+
+    @staticmethod
+    def put(db: sqlite3.Connection, key: str, errors: t.List[t.Dict]):
+        db.execute(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+            (key, json.dumps(errors, default=str), time.time()),
+        )
+
+    def evict(self, db: sqlite3.Connection):
+        """Removes the least recently used chunks beyond max_chunks."""
+        db.execute(
+            "DELETE FROM chunks WHERE key IN (SELECT key FROM chunks "
+            "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_chunks,),
+        )
+
+
+class IncrementalValidation:
+    """Validates the rows of CSV files chunk by chunk, reusing the errors of the
+    chunks validated before.
+
+    Args:
+        store: the store of the chunk results
+        min_rows, max_rows, mask: size of the chunks (see `iter_chunks`)
+    """
+
+    def __init__(
+        self,
+        store: ChunkStore,
+        min_rows: int = MIN_CHUNK_ROWS,
+        max_rows: int = MAX_CHUNK_ROWS,
+        mask: int = BOUNDARY_MASK,
+    ):
+        self.store = store
+        self.chunk_sizes = {"min_rows": min_rows, "max_rows": max_rows, "mask": mask}
+        # Number of rows whose errors were reused and validated in the last run.
+        self.reused_rows = 0
+        self.validated_rows = 0
+
+    @staticmethod
+    def context_key(validator: "CsvValidator") -> str:
+        """Returns the hash of what the errors of the rows depend on, besides the
+        rows."""
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    CHUNK_STORE_VERSION,
+                    schema_hash(validator.validator.schema),
+                    validator.max_value_length,
+                ]
+            ).encode("UTF-8")
+        ).hexdigest()
+
+    def iter_validate(
+        self, validator: "CsvValidator", rows: t.Iterable[t.Dict], start: int = 0
+    ) -> t.Iterator[t.Dict]:
+        """Yields the errors of the rows, in the same order as the validator."""
+        self.reused_rows = self.validated_rows = 0
+        context = self.context_key(validator)
+        with closing(self.store.connect()) as db:
+            pending = []
+            pending_rows = 0
+            reused = []
+            for chunk_start, chunk_rows, digest in iter_chunks(
+                rows, start, **self.chunk_sizes
+            ):
+                key = f"{context}:{digest}"
+                errors = self.store.get(db, key)
+                if errors is None:
+                    pending.append((chunk_start, chunk_rows, key))
+                    pending_rows += len(chunk_rows)
+                    if pending_rows >= MAX_PENDING_ROWS:
+                        yield from self._validate(db, validator, pending)
+                        pending = []
+                        pending_rows = 0
+                    continue
+                yield from self._validate(db, validator, pending)
+                pending = []
+                pending_rows = 0
+                reused.append(key)
+                self.reused_rows += len(chunk_rows)
+                for error in errors:
+                    error["location"]["line"] += chunk_start
+                    yield error
+            yield from self._validate(db, validator, pending)
+            self.store.touch(db, reused)
+            self.store.evict(db)
+            db.commit()
+        log.info(
+            f"Reused the errors of {self.reused_rows} rows, validated "
+            f"{self.validated_rows} rows"
+        )
+
+    def _validate(
+        self,
+        db: sqlite3.Connection,
+        validator: "CsvValidator",
+        chunks: t.List[Chunk],
+    ) -> t.Iterator[t.Dict]:
+        """Validates consecutive chunks together, and saves the errors of each."""
+        if not chunks:
+            return
+        rows = list(itertools.chain.from_iterable(c[1] for c in chunks))
+        self.validated_rows += len(rows)
+        errors = list(validator.iter_validate(rows, chunks[0][0]))
+        # Errors are in row order, split them by chunk.
+        position = 0
+        for chunk_start, chunk_rows, key in chunks:
+            chunk_end = chunk_start + len(chunk_rows)
+            chunk_errors = []
+            while (
+                position < len(errors)
+                and errors[position]["location"]["line"] <= chunk_end
+            ):
+                error = dict(errors[position])
+                error["location"] = {
+                    **error["location"],
+                    "line": error["location"]["line"] - chunk_start,
+                }
+                chunk_errors.append(error)
+                position += 1
+            self.store.put(db, key, chunk_errors)
+        db.commit()
+        yield from errors
@@ -0,0 +1,461 @@
+"""Incremental parsing and validation of large JSON documents.
+
+`JsonStream` reads a JSON document in chunks and hands out the members of its objects
+and arrays one at a time, decoding each member value with `json.JSONDecoder.raw_decode`.
+`StreamingValidation` walks the document with it: when the schema of an object or array
+only inspects the names or number of its members (e.g. `required`, `maxItems`), the
+members are validated one by one, recursively, and discarded as soon as they are
+validated.  Other values are decoded whole and validated by jsonschema.
+
+Errors have the same paths, schema paths and order as when validating the whole
+document.  Only the errors about a streamed container itself report a summary of the
+container, with the member values elided (e.g. "{'a': ..., 'b': ...}"), as its content
+is not held in memory.
+"""
+import json
+import re
+import typing as t
+
+from fw_gear_file_validator.schema import has_nested_ids, resolve_local
+
+if t.TYPE_CHECKING:
+    from jsonschema.exceptions import ValidationError
+
+    from fw_gear_file_validator.budget import ErrorBudget
+
+# Characters read from the file at a time.
+CHUNK_SIZE = 1 << 20
+# Containers deeper than this are decoded whole, as the overhead of validating their
+# members one by one outweighs the memory savings for the (usually small) records of
+# large arrays or maps.
+MAX_DEPTH = 2
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_TAIL = re.compile(r"[0-9+\-.eE]*")
+
+# Keywords that need the whole value of a container to be validated.
+VALUE_KEYWORDS = {
+    "enum",
+    "const",
+    "allOf",
+    "anyOf",
+    "oneOf",
+    "not",
+    "if",
+    "dependencies",
+}
+# Keywords validating the members of a container, one at a time.
+MEMBER_KEYWORDS = {"properties", "patternProperties", "items", "additionalItems"}
+
+
+def _extend(path: t.Tuple, key: t.Any) -> t.Tuple:
+    return path if key is None else path + (key,)
+
+
+class _Elided:
+    """Stands for a member value that isn't kept in memory."""
+
+    def __repr__(self):
+        return "..."
+
+
+ELIDED = _Elided()
+
+
+class JsonStream:
+    """Reads a JSON document from a file one value at a time.
+
+    `iter_object` and `iter_array` yield the keys and indices of the members of the
+    next container, and the caller must consume each member value (with `read_value`
+    or by iterating over it) before resuming the iteration.
+    """
+
+    def __init__(self, fp: t.TextIO, chunk_size: int = CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        # Number of characters consumed before the current buffer.
+        self.offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def __enter__(self) -> "JsonStream":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.fp.close()
+
+    def _fill(self, size: t.Optional[int] = None):
+        """Reads the next characters of the file, dropping the consumed ones."""
+        chunk = self.fp.read(size or self.chunk_size)
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(
+            f"Error loading JSON object: {message} (char {self.offset + self.pos})"
+        )
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character, without consuming it."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self._fill()
+
+    def _consume(self, expected: str) -> str:
+        char = self.peek()
+        if not char or char not in expected:
+            raise self._error(f"Expecting one of {expected!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self) -> t.Any:
+        """Decodes and returns the next value."""
+        first = self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise self._error(e.msg)
+                # Double the buffer, so that long values are decoded in linear time.
+                self._fill(max(self.chunk_size, len(self.buffer)))
+                continue
+            # A number at the end of the buffer may continue in the next chunk (e.g.
+            # "1." is decoded as 1).
+            if (
+                not self.eof
+                and first in "-0123456789"
+                and NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer)
+            ):
+                self._fill(max(self.chunk_size, len(self.buffer)))
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self) -> t.Iterator[str]:
+        """Yields the keys of the next object."""
+        self._consume("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.read_value()
+            self._consume(":")
+            yield key
+            if self._consume(",}") == "}":
+                return
+
+    def iter_array(self) -> t.Iterator[int]:
+        """Yields the indices of the members of the next array."""
+        self._consume("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._consume(",]") == "]":
+                return
+
+    def check_end(self):
+        """Raises a ValueError if the document continues after its root value."""
+        if self.peek():
+            raise self._error("Extra data")
+
+
+class _BudgetSpent(Exception):
+    """Raised to stop reading the document once the error budget is exhausted."""
+
+
+class StreamingValidation:
+    """Validates a `JsonStream` member by member.
+
+    Args:
+        validator: the (jsonschema.Draft7Validator compatible) validator of the schema
+        max_depth: containers at this depth and below are decoded whole
+        budget: if given, the document is only read until the budget is exhausted
+            (see `budget`), and only the errors found until then are reported.
+    """
+
+    def __init__(
+        self,
+        validator: t.Any,
+        max_depth: int = MAX_DEPTH,
+        budget: t.Optional["ErrorBudget"] = None,
+    ):
+        self.validator = validator
+        self.schema = validator.schema
+        self.max_depth = max_depth
+        self.budget = budget
+        # Nested $ids change how references are resolved, don't follow them.
+        self.enabled = isinstance(self.schema, dict) and not has_nested_ids(self.schema)
+
+    def iter_errors(self, stream: JsonStream) -> t.Iterator["ValidationError"]:
+        """Validates the document and returns its errors in jsonschema's order."""
+        errors = []
+        try:
+            for error in self._validate(stream, self.schema, (), (), None, None, ()):
+                errors.append(error)
+                if self.budget is not None and self.budget.exhausted(len(errors)):
+                    raise _BudgetSpent
+            stream.check_end()
+        except _BudgetSpent:
+            pass
+        # Errors are tagged with their position in jsonschema's traversal of the schema.
+        errors.sort(key=lambda error: error[0])
+        errors = [error for _, error in errors]
+        if self.budget is not None:
+            errors = self.budget.truncate(errors)
+        return iter(errors)
+
+    def _check_budget(self):
+        """Stops the validation once the budget is exhausted, e.g. at the deadline."""
+        if self.budget is not None and self.budget.stopped():
+            raise _BudgetSpent
+
+    def _resolve(self, schema: t.Any) -> t.Optional[dict]:
+        """Follows the local references of the schema, None if it can't."""
+        schema = resolve_local(schema, self.schema)
+        return schema if isinstance(schema, dict) else None
+
+    @staticmethod
+    def _streams_object(schema: dict) -> bool:
+        return not VALUE_KEYWORDS.intersection(schema) and (
+            isinstance(schema.get("properties", {}), dict)
+            and isinstance(schema.get("patternProperties", {}), dict)
+        )
+
+    @staticmethod
+    def _streams_array(schema: dict) -> bool:
+        if VALUE_KEYWORDS.intersection(schema) or "contains" in schema:
+            return False
+        if schema.get("uniqueItems"):
+            return False
+        items = schema.get("items", {})
+        additional = schema.get("additionalItems", True)
+        return isinstance(items, (dict, bool)) or (
+            isinstance(items, list)
+            and (additional is True or isinstance(additional, dict))
+        )
+
+    def _validate(
+        self,
+        stream: JsonStream,
+        schema: t.Any,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        key: t.Any,
+        schema_key: t.Any,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        """Validates the next value of the stream against a subschema.
+
+        Like jsonschema's `descend`, `key` and `schema_key` extend the (parent) path
+        and schema path, except for False subschemas.
+        """
+        streamed = self.enabled and len(_extend(path, key)) < self.max_depth
+        resolved = self._resolve(schema) if streamed else None
+        if resolved is not None:
+            char = stream.peek()
+            if char == "{" and self._streams_object(resolved):
+                validate_members = self._validate_object
+            elif char == "[" and self._streams_array(resolved):
+                validate_members = self._validate_array
+            else:
+                validate_members = None
+            if validate_members:
+                yield from validate_members(
+                    stream,
+                    resolved,
+                    _extend(path, key),
+                    _extend(schema_path, schema_key),
+                    tag,
+                )
+                return
+        yield from self._validate_value(
+            stream.read_value(), schema, path, schema_path, key, schema_key, tag
+        )
+
+    @staticmethod
+    def _prefix(
+        errors: t.Iterable["ValidationError"],
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        for index, error in enumerate(errors):
+            error.path.extendleft(reversed(path))
+            error.schema_path.extendleft(reversed(schema_path))
+            yield tag + (index,), error
+
+    def _validate_value(
+        self,
+        value: t.Any,
+        schema: t.Any,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        key: t.Any,
+        schema_key: t.Any,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        errors = self.validator.descend(value, schema)
+        if schema is not False:
+            path, schema_path = _extend(path, key), _extend(schema_path, schema_key)
+        yield from self._prefix(errors, path, schema_path, tag)
+
+    def _validate_container(
+        self,
+        skeleton: t.Union[dict, list],
+        schema: dict,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        """Validates the container itself, given its skeleton (the elided members)."""
+        keywords = list(schema)
+        reduced = {
+            keyword: value
+            for keyword, value in schema.items()
+            if keyword not in MEMBER_KEYWORDS
+            and not (keyword == "additionalProperties" and value is not False)
+        }
+        if reduced.get("additionalProperties") is False:
+            # Needed to find the additional properties, without validating them.
+            for keyword in ("properties", "patternProperties"):
+                if keyword in schema:
+                    reduced[keyword] = {name: True for name in schema[keyword]}
+        for error in self.validator.descend(skeleton, reduced):
+            # The errors are reported against the actual schema of the container.
+            if error.schema is reduced:
+                error.schema = schema
+            keyword_tag = tag + (keywords.index(error.relative_schema_path[0]),)
+            yield from self._prefix([error], path, schema_path, keyword_tag)
+
+    def _validate_object(
+        self,
+        stream: JsonStream,
+        schema: dict,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        keywords = list(schema)
+        properties = schema.get("properties", {})
+        property_index = {name: index for index, name in enumerate(properties)}
+        patterns = list(schema.get("patternProperties", {}).items())
+        additional = schema.get("additionalProperties")
+        skeleton = {}
+        for index, key in enumerate(stream.iter_object()):
+            self._check_budget()
+            skeleton[key] = ELIDED
+            # (tag, subschema, keyword, schema_key) of the subschemas applying to the
+            # member, in the order jsonschema validates them.
+            applicable = []
+            if key in properties:
+                applicable.append(
+                    (
+                        (keywords.index("properties"), property_index[key]),
+                        properties[key],
+                        "properties",
+                        key,
+                    )
+                )
+            matched = False
+            for pattern_index, (pattern, subschema) in enumerate(patterns):
+                if re.search(pattern, key):
+                    matched = True
+                    applicable.append(
+                        (
+                            (keywords.index("patternProperties"), pattern_index, index),
+                            subschema,
+                            "patternProperties",
+                            pattern,
+                        )
+                    )
+            if isinstance(additional, dict) and key not in properties and not matched:
+                applicable.append(
+                    (
+                        (keywords.index("additionalProperties"), index),
+                        additional,
+                        "additionalProperties",
+                        None,
+                    )
+                )
+            applicable.sort(key=lambda each: each[0])
+
+            if len(applicable) == 1:
+                member_tag, subschema, keyword, schema_key = applicable[0]
+                yield from self._validate(
+                    stream,
+                    subschema,
+                    path,
+                    schema_path + (keyword,),
+                    key,
+                    schema_key,
+                    tag + member_tag,
+                )
+                continue
+            value = stream.read_value()
+            for member_tag, subschema, keyword, schema_key in applicable:
+                yield from self._validate_value(
+                    value,
+                    subschema,
+                    path,
+                    schema_path + (keyword,),
+                    key,
+                    schema_key,
+                    tag + member_tag,
+                )
+        yield from self._validate_container(skeleton, schema, path, schema_path, tag)
+
+    def _validate_array(
+        self,
+        stream: JsonStream,
+        schema: dict,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        tag: t.Tuple,
+    ) -> t.Iterator[t.Tuple[t.Tuple, "ValidationError"]]:
+        keywords = list(schema)
+        items = schema.get("items")
+        additional = schema.get("additionalItems")
+        count = 0
+        for index in stream.iter_array():
+            self._check_budget()
+            count += 1
+            if isinstance(items, list):
+                if index < len(items):
+                    member = (items[index], "items", index)
+                elif isinstance(additional, dict):
+                    member = (additional, "additionalItems", None)
+                else:
+                    member = None
+            elif items is not None:
+                member = (items, "items", None)
+            else:
+                member = None
+
+            if member is None:
+                stream.read_value()
+                continue
+            subschema, keyword, schema_key = member
+            yield from self._validate(
+                stream,
+                subschema,
+                path,
+                schema_path + (keyword,),
+                index,
+                schema_key,
+                tag + (keywords.index(keyword), index),
+            )
+        yield from self._validate_container(
+            [ELIDED] * count, schema, path, schema_path, tag
+        )
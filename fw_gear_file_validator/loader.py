@@ -1,10 +1,39 @@
 import csv
+import importlib
 import json
+import logging
 import typing as t
 from abc import ABC, abstractmethod
 from pathlib import Path
 
-from flywheel_gear_toolkit.utils.datatypes import Container
+if t.TYPE_CHECKING:
+    from flywheel_gear_toolkit.utils.datatypes import Container
+
+    from fw_gear_file_validator.jsonstream import JsonStream
+    from fw_gear_file_validator.table import CsvTable
+    from fw_gear_file_validator.utils import FwReference
+
+log = logging.getLogger(__name__)
+
+# Loaders of local files by extension, of their content if they are compressed (see
+# `compression.content_extension`).
+SUPPORTED_FILE_EXTENSIONS = {
+    ".json": "json",
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+# Loaders by name, as "module:class" paths imported when a loader of that name is
+# first created (see `Loader.register`).  The modules reading the files are only
+# imported when a file is loaded, so that importing this module stays cheap.
+LOADERS = {
+    "json": f"{__name__}:JsonLoader",
+    "flywheel": f"{__name__}:FwLoader",
+    "csv": f"{__name__}:CsvLoader",
+    "ndjson": f"{__name__}:NdjsonLoader",
+}
+_loader_classes: t.Dict[str, t.Type["Loader"]] = {}
 
 PARENT_INCLUDE = [
     # General values
@@ -33,23 +62,48 @@ class Loader(ABC):
 
     name = None
     has_config = False
+    # Approximate size of a loaded file in memory, relative to its size on disk.
+    footprint_factor = 1
+    # Whether the loader can stream files instead of loading them in memory.
+    streamable = False
 
     @classmethod
     def factory(cls, name: str, config: t.Dict[str, t.Any] = None) -> "Loader":
         """Returns a configured loader based on the name and config provided."""
-        loader = None
-        for subclass in cls.__subclasses__():
-            if subclass.name == name:
-                if subclass.has_config:
-                    loader = subclass(config)
-                else:
-                    loader = subclass()
-                break
-
-        if not loader:
-            raise ValueError(f"Loader {name} not found")
+        loader_class = cls.get_class(name)
+        if loader_class.has_config:
+            return loader_class(config)
+        return loader_class()
+
+    @staticmethod
+    def register(name: str, path: str):
+        """Registers the loader of the "module:class" path under the name.
 
-        return loader
+        The module is only imported when a loader of that name is first created.
+        """
+        LOADERS[name] = path
+        _loader_classes.pop(name, None)
+
+    @staticmethod
+    def get_class(name: str) -> t.Type["Loader"]:
+        """Returns the class of the loader registered under the name, importing it
+        if needed.
+
+        Raises:
+            ValueError: if no loader is registered under the name.
+        """
+        loader_class = _loader_classes.get(name)
+        if loader_class is not None:
+            return loader_class
+        if name not in LOADERS:
+            raise ValueError(f"Loader {name} not found")
+        module_name, _, class_name = LOADERS[name].partition(":")
+        try:
+            loader_class = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Loader {name} can't be imported: {e}")
+        _loader_classes[name] = loader_class
+        return loader_class
 
     @staticmethod
     def load_schema(file_path: Path) -> dict:
@@ -60,65 +114,255 @@ class Loader(ABC):
         """Returns the object to be validated as a dict."""
         pass
 
+    def estimate_footprint_mb(self, file_path: Path) -> float:
+        """Returns the estimated memory needed to load the file in full, in MB.
+
+        For compressed files, this is based on the size of their decompressed content.
+        """
+        from fw_gear_file_validator.compression import uncompressed_size
+
+        return uncompressed_size(file_path) * self.footprint_factor / 2**20
+
+    def use_streaming(self, file_path: Path, budget_mb: t.Optional[float]) -> bool:
+        """Returns whether the file should be streamed to fit in the memory budget.
+
+        Raises:
+            MemoryBudgetError: if the file doesn't fit in the budget and can't be
+                streamed.
+        """
+        if not budget_mb:
+            return False
+        from fw_gear_file_validator.memory import MemoryBudgetError, current_rss_mb
+
+        try:
+            footprint = self.estimate_footprint_mb(file_path)
+        except (OSError, TypeError):
+            # Missing files are reported when loading them.
+            return False
+        available = budget_mb - current_rss_mb()
+        if footprint <= available:
+            return False
+        message = (
+            f"Loading {Path(file_path).name} would take about {footprint:.0f} MB, "
+            f"more than the {available:.0f} MB left of the {budget_mb:.0f} MB memory "
+            f"budget"
+        )
+        if not self.streamable:
+            raise MemoryBudgetError(message)
+        log.warning(f"{message}, streaming it instead")
+        return True
+
 
 class JsonLoader(Loader):
     """Loads a JSON file."""
 
     name = "json"
-    has_config = False
+    has_config = True
+    footprint_factor = 8
+    streamable = True
 
-    def __init__(self):
+    def __init__(self, config: t.Dict[str, t.Any] = None):
         super().__init__()
+        config = config or {}
+        self.streaming = config.get("streaming", False)
+        self.memory_budget = config.get("memory_budget")
 
-    def load_object(self, file_path: Path) -> dict:
-        """Returns the content of the JSON file as a dict."""
+    def load_object(self, file_path: Path) -> t.Union[dict, "JsonStream"]:
+        """Returns the content of the JSON file as a dict.
+
+        In streaming mode, a JsonStream is returned instead, from which the validator
+        reads the document incrementally.  Files that don't fit in the memory budget
+        are streamed as well.
+
+        Compressed files are decompressed on the fly while they are read.
+        """
+        from fw_gear_file_validator.compression import DECOMPRESSION_ERRORS, open_text
+        from fw_gear_file_validator.jsonstream import JsonStream
+
+        if self.streaming or self.use_streaming(file_path, self.memory_budget):
+            try:
+                return JsonStream(open_text(file_path, encoding="UTF-8"))
+            except (TypeError, ValueError, *DECOMPRESSION_ERRORS) as e:
+                raise ValueError(f"Error loading JSON object: {e}")
         try:
-            with open(file_path, "r", encoding="UTF-8") as fp:
+            with open_text(file_path, encoding="UTF-8") as fp:
                 content = json.load(fp)
             return content
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+        except (ValueError, *DECOMPRESSION_ERRORS) as e:
             raise ValueError(f"Error loading JSON object: {e}")
 
 
 class FwLoader(Loader):
-    """Loads a Flywheel object."""
+    """Loads a Flywheel object.
+
+    When the schema is given in the config, only the hierarchy levels and the fields
+    it references are fetched and loaded (see `schema.referenced_properties`).
+    """
 
     name = "flywheel"
     has_config = True
 
     def __init__(self, config: t.Dict[str, t.Any]):
         self.add_parents = config.get("add_parents")
+        schema = config.get("schema")
+        self.projection = None
+        if schema:
+            from fw_gear_file_validator.schema import referenced_properties
 
-    def load_object(self, fw_hierarchy: dict) -> dict:
-        """Returns the content of the Flywheel reference as a dict."""
-        if not self.add_parents:
+            self.projection = referenced_properties(schema)
+
+    def load_object(self, fw_hierarchy: t.Union[dict, "FwReference"]) -> dict:
+        """Returns the content of the Flywheel reference as a dict.
+
+        Args:
+            fw_hierarchy: the containers by level, or the FwReference to fetch them
+                from.
+        """
+        if not isinstance(fw_hierarchy, dict):
+            fw_hierarchy = self._fetch(fw_hierarchy)
+        elif not self.add_parents:
             fw_hierarchy = {"file": fw_hierarchy["file"]}
 
-        for k, container in fw_hierarchy.items():
-            fw_hierarchy[k] = self._filter_container(container)
-        return fw_hierarchy
+        projection = self.projection or {}
+        return {
+            level: self._filter_container(container, projection.get(level))
+            for level, container in fw_hierarchy.items()
+            if self.projection is None or level in projection
+        }
+
+    def _fetch(self, fw_ref: "FwReference") -> t.Dict[str, t.Union["Container", dict]]:
+        """Fetches the containers of the levels to load."""
+        levels = [level for level in fw_ref.ref if self.add_parents or level == "file"]
+        if self.projection is None:
+            return fw_ref.fetch_levels(levels)
+
+        levels = [level for level in levels if level in self.projection]
+        # Levels only required to exist don't need to be fetched.
+        containers = fw_ref.fetch_levels(
+            level for level in levels if self.projection[level] != {}
+        )
+        return {level: containers.get(level, {}) for level in levels}
 
     @staticmethod
-    def _filter_container(container: Container):
-        """Filters the container to remove unwanted fields."""
-        cont_f = {k: v for k, v in container.to_dict().items() if k in PARENT_INCLUDE}
+    def _filter_container(
+        container: t.Union["Container", dict], fields: t.Optional[dict] = None
+    ) -> dict:
+        """Filters the container to remove unwanted fields.
+
+        If fields is given, only those fields are read from the container, which
+        avoids serializing it in full.
+        """
+        if fields is None:
+            if isinstance(container, dict):
+                return {k: v for k, v in container.items() if k in PARENT_INCLUDE}
+            cont_f = {
+                k: v for k, v in container.to_dict().items() if k in PARENT_INCLUDE
+            }
+            return cont_f
+
+        cont_f = {}
+        for k in fields:
+            if k not in PARENT_INCLUDE:
+                continue
+            if isinstance(container, dict):
+                if k in container:
+                    cont_f[k] = container[k]
+            elif hasattr(container, k):
+                cont_f[k] = _to_plain(getattr(container, k))
         return cont_f
 
 
+def _to_plain(value: t.Any) -> t.Any:
+    """Converts flywheel models within the value to dicts, as `to_dict` does."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    return value
+
+
 class CsvLoader(Loader):
     """Loads a csv object."""
 
     name = "csv"
-    has_config = False
+    has_config = True
+    # Columns of short distinct strings take the most memory in a CsvTable.
+    footprint_factor = 6
+    streamable = True
 
-    def __init__(self, config: t.Dict[str, t.Any]):
+    def __init__(self, config: t.Dict[str, t.Any] = None):
         super().__init__()
+        config = config or {}
+        self.streaming = config.get("streaming", False)
+        self.memory_budget = config.get("memory_budget")
+
+    def load_object(self, file_path: Path) -> t.Union["CsvTable", t.Iterator[t.Dict]]:
+        """Returns the content of the csv file as a table of its rows.
+
+        The rows are stored column by column, in a compact CsvTable that reads like a
+        list of row dicts.  In streaming mode, the rows are returned as a lazy
+        iterator instead, so that only the row currently being validated is held in
+        memory.  Files that don't fit in the memory budget are streamed as well.
+
+        Compressed files are decompressed on the fly while they are read.
+        """
+        from fw_gear_file_validator.compression import DECOMPRESSION_ERRORS, open_text
+        from fw_gear_file_validator.table import CsvTable
+
+        # Decided before opening the file, which isn't closed if this raises.
+        streaming = self.streaming or self.use_streaming(file_path, self.memory_budget)
+        try:
+            csv_file = open_text(file_path)
+        except (TypeError, ValueError, *DECOMPRESSION_ERRORS) as e:
+            raise ValueError(f"Error loading CSV object: {e}")
 
-    def load_object(self, file_path: Path) -> t.List[t.Dict]:
-        """Returns the content of the csv file as a list of dicts."""
+        if streaming:
+            return self.iter_rows(csv_file)
         try:
-            with open(file_path) as csv_file:
-                csv_dict = csv.DictReader(csv_file)
-                return list(csv_dict)
-        except (FileNotFoundError, TypeError) as e:
+            with csv_file:
+                return CsvTable.from_file(csv_file)
+        except DECOMPRESSION_ERRORS as e:
             raise ValueError(f"Error loading CSV object: {e}")
+
+    @staticmethod
+    def iter_rows(csv_file: t.TextIO) -> t.Iterator[t.Dict]:
+        """Yields the rows of an open csv file one at a time, closing it when done."""
+        with csv_file:
+            yield from csv.DictReader(csv_file)
+
+
+class NdjsonLoader(Loader):
+    """Loads a JSON Lines (NDJSON) file."""
+
+    name = "ndjson"
+    has_config = False
+    streamable = True
+
+    def load_object(self, file_path: Path) -> t.Iterator[str]:
+        """Returns the lines of the file as a lazy iterator.
+
+        Lines are always streamed, so that only the records currently being validated
+        are held in memory.  They are decoded by the validator (see
+        `validator.NdjsonValidator`), which reports malformed lines as errors on their
+        line and can decode them in worker processes.
+        """
+        from fw_gear_file_validator.compression import DECOMPRESSION_ERRORS, open_text
+
+        try:
+            ndjson_file = open_text(file_path, encoding="UTF-8")
+        except (TypeError, ValueError, *DECOMPRESSION_ERRORS) as e:
+            raise ValueError(f"Error loading NDJSON object: {e}")
+        return self.iter_lines(ndjson_file)
+
+    @staticmethod
+    def iter_lines(ndjson_file: t.TextIO) -> t.Iterator[str]:
+        """Yields the lines of an open file one at a time, closing it when done."""
+        from fw_gear_file_validator.compression import DECOMPRESSION_ERRORS
+
+        with ndjson_file:
+            try:
+                yield from ndjson_file
+            except DECOMPRESSION_ERRORS as e:
+                raise ValueError(f"Error loading NDJSON object: {e}")
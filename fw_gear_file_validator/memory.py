@@ -0,0 +1,70 @@
+"""Memory usage of the process, and of the container it runs in."""
+import logging
+import os
+import typing as t
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+log = logging.getLogger(__name__)
+
+# Files defining the memory limit of the container, for cgroup v2 and v1.
+CGROUP_LIMIT_FILES = [
+    Path("/sys/fs/cgroup/memory.max"),
+    Path("/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+]
+# Fraction of the container's memory limit used as default budget, the rest being
+# left for the interpreter, the libraries and the validation errors.
+DEFAULT_BUDGET_FRACTION = 0.8
+
+
+class MemoryBudgetError(ValueError):
+    """Raised when a file is not expected to fit in the memory budget."""
+
+
+def peak_rss_mb() -> float:
+    """Returns the peak resident memory of the process so far, in MB."""
+    if resource is None:  # pragma: no cover
+        return 0.0
+    # ru_maxrss is in KB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    """Returns the resident memory of the process, in MB."""
+    try:
+        with open("/proc/self/statm") as fp:
+            pages = int(fp.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        return peak_rss_mb()
+
+
+def memory_limit_mb() -> t.Optional[float]:
+    """Returns the memory limit of the container, None if there is none."""
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            value = path.read_text().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2**60:
+            return int(value) / 2**20
+        return None
+    return None
+
+
+def resolve_budget(budget_mb: t.Optional[float]) -> t.Optional[float]:
+    """Returns the memory budget in MB, given its configured value.
+
+    A budget of 0 (or None) defaults to DEFAULT_BUDGET_FRACTION of the container's
+    memory limit, or to no budget if there is no limit.
+    """
+    if budget_mb:
+        return float(budget_mb)
+    limit = memory_limit_mb()
+    if limit is None:
+        return None
+    return limit * DEFAULT_BUDGET_FRACTION
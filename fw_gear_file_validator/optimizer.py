@@ -0,0 +1,475 @@
+"""Optimization of schemas validated with jsonschema, reporting the same errors.
+
+jsonschema walks the schema as written for every record it validates: it resolves
+every `$ref` again, descends into every `allOf` branch and looks every `pattern` up
+in the cache of the `re` module.  `optimize` rewrites the schema once instead:
+
+- local `$ref`s are replaced by their target, unless they are recursive (see
+  `schema.dereference`),
+- the keywords of `allOf` branches that don't depend on the other keywords of a
+  schema (e.g. "minimum", but not "properties" which "additionalProperties" depends
+  on) are moved up to the schema holding the `allOf`, and branches left without
+  keywords are dropped, so that chains of `allOf`s are flattened,
+- the cheap "type", "const" and "enum" keywords are moved first, so that keywords
+  stopping at the first error of a subschema ("not", "if", "contains" and "oneOf")
+  skip the other keywords of invalid instances.
+
+`OptimizedSchema` validates with the optimized schema and precompiled `pattern`s,
+and maps its errors back to the schema as written: they have the same schema path,
+(sub)schema and order as the errors of jsonschema with the original schema.
+"""
+import re
+import typing as t
+from collections import deque
+
+import jsonschema
+from jsonschema.exceptions import ValidationError
+
+from fw_gear_file_validator.schema import (
+    LITERAL_KEYWORDS,
+    dereference,
+    has_nested_ids,
+    iter_subschemas,
+    resolve_local,
+)
+
+# Keywords validated first, by cost.
+CHEAP_KEYWORDS = ("type", "const", "enum")
+# Keywords whose value maps names to subschemas.
+SCHEMA_MAP_KEYWORDS = {"properties", "patternProperties", "definitions", "dependencies"}
+# Keywords whose value is a list of subschemas (or a subschema for "items").
+SCHEMA_LIST_KEYWORDS = {"allOf", "anyOf", "oneOf", "items"}
+# Keywords whose value is a subschema.
+SCHEMA_KEYWORDS = {
+    "not",
+    "if",
+    "then",
+    "else",
+    "contains",
+    "propertyNames",
+    "additionalProperties",
+    "additionalItems",
+    "items",
+}
+# Keywords that depend on other keywords of their schema, and stay in their
+# `allOf` branch.
+INTERACTING_KEYWORDS = {
+    "$ref",
+    "properties",
+    "patternProperties",
+    "additionalProperties",
+    "items",
+    "additionalItems",
+    "if",
+    "then",
+    "else",
+}
+VALIDATION_KEYWORDS = set(jsonschema.Draft7Validator.VALIDATORS)
+# Keywords whose error messages show their subschemas.
+MESSAGE_SCHEMA_KEYWORDS = {"not", "oneOf"}
+
+# Compiled `pattern`s, by pattern.
+_patterns: t.Dict[str, re.Pattern] = {}
+
+
+def _pattern(validator, patrn, instance, schema):
+    """The "pattern" keyword of jsonschema, with precompiled regular expressions."""
+    if validator.is_type(instance, "string"):
+        compiled = _patterns.get(patrn)
+        if compiled is None:
+            compiled = _patterns[patrn] = re.compile(patrn)
+        if not compiled.search(instance):
+            yield ValidationError(f"{instance!r} does not match {patrn!r}")
+
+
+PatternValidator = jsonschema.validators.extend(
+    jsonschema.Draft7Validator, {"pattern": _pattern}
+)
+
+
+class _Optimizer:
+    """Builds the optimized version of a dereferenced schema.
+
+    The origin of the keywords moved up from `allOf` branches is recorded in
+    `origins`, by id of the optimized schema holding them: the path from the
+    original schema to the branch the keyword was in, e.g. ("allOf", 1).  The
+    indices in the original lists of the lists of `allOf` branches that lost some
+    are recorded in `list_origins`.
+    """
+
+    def __init__(self, flatten: bool):
+        self.flatten = flatten
+        self.changed = False
+        self.origins: t.Dict[int, t.Dict[str, t.Tuple]] = {}
+        self.list_origins: t.Dict[int, t.List[int]] = {}
+        self._optimized: t.Dict[int, t.Any] = {}
+        # Every node built is kept alive, so that their ids are not reused.
+        self._nodes: t.List[t.Any] = []
+
+    def schema(self, node: t.Any) -> t.Any:
+        if not isinstance(node, dict):
+            return node
+        if id(node) in self._optimized:
+            return self._optimized[id(node)]
+        result = {}
+        for key, value in node.items():
+            if key in LITERAL_KEYWORDS:
+                result[key] = value
+            elif key in SCHEMA_MAP_KEYWORDS and isinstance(value, dict):
+                result[key] = {name: self.schema(sub) for name, sub in value.items()}
+            elif key in SCHEMA_LIST_KEYWORDS and isinstance(value, list):
+                result[key] = [self.schema(sub) for sub in value]
+            elif key in SCHEMA_KEYWORDS:
+                result[key] = self.schema(value)
+            else:
+                result[key] = value
+
+        origins = {}
+        if self.flatten and isinstance(result.get("allOf"), list):
+            result = self._flatten(result, origins)
+        ordered = {key: result[key] for key in CHEAP_KEYWORDS if key in result}
+        ordered.update(result)
+        if _validation_keywords(ordered) != _validation_keywords(node):
+            self.changed = True
+        else:
+            # Errors show their schemas, keep their keys in the original order.
+            ordered = result
+        self._optimized[id(node)] = ordered
+        return self._add(ordered, origins)
+
+    def _add(self, optimized: dict, origins: t.Dict) -> dict:
+        self._nodes.append(optimized)
+        if origins:
+            self.origins[id(optimized)] = origins
+        return optimized
+
+    def _flatten(self, result: dict, origins: t.Dict) -> dict:
+        """Moves the keywords of the `allOf` branches of the schema up to it."""
+        if "$ref" in result:
+            # Keywords next to a $ref are ignored.
+            return result
+        hoisted = {}
+        branches = []
+        for index, branch in enumerate(result["allOf"]):
+            if branch is True:
+                continue
+            if not isinstance(branch, dict) or "$ref" in branch or "$id" in branch:
+                branches.append((index, branch))
+                continue
+            branch_origins = self.origins.get(id(branch), {})
+            rest = {}
+            for key, value in branch.items():
+                if (
+                    key in VALIDATION_KEYWORDS
+                    and key not in INTERACTING_KEYWORDS
+                    and key not in result
+                    and key not in hoisted
+                ):
+                    hoisted[key] = value
+                    origins[key] = ("allOf", index) + branch_origins.get(key, ())
+                else:
+                    rest[key] = value
+            if len(rest) == len(branch):
+                branches.append((index, branch))
+            elif VALIDATION_KEYWORDS.intersection(rest):
+                rest_origins = {k: v for k, v in branch_origins.items() if k in rest}
+                branches.append((index, self._add(rest, rest_origins)))
+
+        if not hoisted and len(branches) == len(result["allOf"]):
+            return result
+        self.changed = True
+        flattened = {}
+        for key, value in result.items():
+            if key == "allOf":
+                flattened.update(hoisted)
+            else:
+                flattened[key] = value
+        if branches:
+            flattened["allOf"] = [branch for _, branch in branches]
+            self._nodes.append(flattened["allOf"])
+            self.list_origins[id(flattened["allOf"])] = [i for i, _ in branches]
+        return flattened
+
+
+class OptimizedSchema:
+    """A schema optimized for jsonschema, and the mapping of its errors back to the
+    original schema.
+
+    Use `optimize` to build it.
+    """
+
+    def __init__(
+        self,
+        original: dict,
+        schema: dict,
+        origins: t.Dict[int, t.Dict[str, t.Tuple]],
+        list_origins: t.Dict[int, t.List[int]],
+        changed: bool,
+        reordered: bool,
+    ):
+        self.original = original
+        self.schema = schema
+        self.origins = origins
+        self.list_origins = list_origins
+        # Whether the errors need to be mapped back to the original schema, and
+        # whether their schema paths and order changed, or only their schemas.
+        self.changed = changed
+        self.reordered = reordered
+        # Original schemas of the errors, by schema path, when not reordered.
+        self._containers: t.Dict[t.Tuple, t.Any] = {}
+        self.validator = PatternValidator(schema)
+        for subschema in iter_subschemas(schema):
+            pattern = subschema.get("pattern")
+            if isinstance(pattern, str) and pattern not in _patterns:
+                try:
+                    _patterns[pattern] = re.compile(pattern)
+                except re.error:
+                    pass
+
+    def iter_errors(self, instance: t.Any) -> t.List[ValidationError]:
+        """Returns the errors of the instance, as jsonschema reports them with the
+        original schema."""
+        errors = list(self.validator.iter_errors(instance))
+        if not self.changed or not errors:
+            return errors
+        if not self.reordered:
+            for error in errors:
+                if isinstance(error.schema, bool):
+                    continue
+                if error.context or error.validator in MESSAGE_SCHEMA_KEYWORDS:
+                    # Their sub-errors and messages depend on the instance.
+                    self._map(error, instance)
+                    continue
+                key = tuple(error.relative_schema_path)
+                if key not in self._containers:
+                    self._map(error, instance)
+                    self._containers[key] = error.schema
+                error.schema = self._containers[key]
+            return errors
+        keyed = [
+            (self._map(error, instance), index, error)
+            for index, error in enumerate(errors)
+        ]
+        keyed.sort(key=lambda item: item[:2])
+        return [error for _, _, error in keyed]
+
+    def _map(
+        self,
+        error: ValidationError,
+        instance: t.Any,
+        node: t.Any = None,
+        original: t.Any = None,
+        keyword: t.Optional[str] = None,
+    ) -> t.Tuple:
+        """Maps the schema path, schema, message and sub-errors of the error to the
+        original schema.
+
+        Returns the positions of the steps of the path in the original schema and of
+        the items of the instance validated on the way, which sort the errors in the
+        order jsonschema yields them.  The sub-errors of an "anyOf" or "oneOf" error
+        (its context) are mapped from the lists of subschemas of the keyword, given
+        as node and original.
+        """
+        is_schema = node is None
+        if is_schema:
+            node, original = self.schema, self.original
+        instance_path = list(error.path)
+        depth = 0
+        path = []
+        positions = []
+        container = original
+
+        def descend(extras: bool = False):
+            # Steps into the item of the instance the rest of the path validates.
+            nonlocal instance, depth
+            if depth < len(instance_path):
+                key = instance_path[depth]
+                if isinstance(instance, list):
+                    positions.append(key)
+                elif extras:
+                    # jsonschema validates the additional properties in set order.
+                    found = _additional_properties(instance, container)
+                    positions.append(_index(set(found), key))
+                else:
+                    positions.append(_index(instance, key))
+                instance = instance[key]
+                depth += 1
+
+        for step in error.relative_schema_path:
+            if is_schema:
+                node = _resolve(node, self.schema)
+                original = _resolve(original, self.original)
+            if isinstance(node, dict):
+                extra = (
+                    self.origins.get(id(node), {}).get(step, ()) if is_schema else ()
+                )
+                for extra_step in extra:
+                    positions.append(_position(original, extra_step))
+                    path.append(extra_step)
+                    original = _resolve(original[extra_step], self.original)
+                container = original
+                positions.append(_position(original, step))
+                path.append(step)
+                child, original = node[step], original[step]
+                if not is_schema:
+                    if keyword in ("properties", "patternProperties"):
+                        descend()
+                    is_schema = True
+                else:
+                    keyword = step
+                    is_schema = not (
+                        step in SCHEMA_MAP_KEYWORDS
+                        or (step in SCHEMA_LIST_KEYWORDS and isinstance(child, list))
+                    )
+                    if step in ("items", "additionalItems", "additionalProperties"):
+                        if is_schema:
+                            descend(extras=step == "additionalProperties")
+                    elif step == "propertyNames":
+                        # Property names are validated in the order of the instance.
+                        positions.append(_index(instance, error.instance))
+            else:
+                index = self.list_origins.get(id(node), range(len(node)))[step]
+                container = original
+                positions.append(index)
+                path.append(index)
+                child, original = node[step], original[index]
+                if keyword == "items":
+                    descend()
+                is_schema = True
+            node = child
+
+        if not isinstance(error.schema, bool):
+            error.schema = container
+        error.schema_path = error.relative_schema_path = deque(path)
+        if error.validator in MESSAGE_SCHEMA_KEYWORDS and repr(node) != repr(original):
+            error.message = self._original_message(error, node, original)
+        if error.context:
+            keyed = [
+                (self._map(sub_error, error.instance, node, original, keyword), index)
+                for index, sub_error in enumerate(error.context)
+            ]
+            order = sorted(range(len(keyed)), key=keyed.__getitem__)
+            error.context = [error.context[index] for index in order]
+        return tuple(positions)
+
+    def _original_message(
+        self, error: ValidationError, optimized: t.Any, original: t.Any
+    ) -> str:
+        """Returns the message of a "not" or "oneOf" error, which ends with the
+        subschemas of the keyword, showing them as written."""
+        if error.validator == "not":
+            pairs = [(optimized, original)]
+        else:
+            # The subschemas the instance is valid under, the first one last.  The
+            # lists of "oneOf" are not flattened, their subschemas keep their index.
+            valid = [
+                index
+                for index, subschema in enumerate(optimized)
+                if self.validator.evolve(schema=subschema).is_valid(error.instance)
+            ]
+            pairs = [(optimized[i], original[i]) for i in valid[1:] + valid[:1]]
+        optimized_reprs = ", ".join(repr(o) for o, _ in pairs)
+        if not pairs or not error.message.endswith(optimized_reprs):
+            return error.message
+        original_reprs = ", ".join(repr(o) for _, o in pairs)
+        return error.message[: -len(optimized_reprs)] + original_reprs
+
+
+def _additional_properties(instance: dict, schema: dict) -> t.Iterator[str]:
+    """Yields the properties of the instance matching neither the `properties` nor
+    the `patternProperties` of the schema, as jsonschema finds them."""
+    properties = schema.get("properties", {})
+    patterns = "|".join(schema.get("patternProperties", {}))
+    for name in instance:
+        if name not in properties and not (patterns and re.search(patterns, name)):
+            yield name
+
+
+def _index(instance: t.Any, key: t.Any) -> int:
+    for index, name in enumerate(instance):
+        if name == key:
+            return index
+    return -1
+
+
+def _validation_keywords(node: dict) -> t.List[str]:
+    return [key for key in node if key in VALIDATION_KEYWORDS]
+
+
+def _resolve(node: t.Any, root: t.Any) -> t.Any:
+    if isinstance(node, dict) and "$ref" in node:
+        resolved = resolve_local(node, root)
+        return node if resolved is None else resolved
+    return node
+
+
+def _position(node: t.Any, step: t.Union[str, int]) -> int:
+    if isinstance(node, list):
+        return step
+    keys = list(node)
+    # "then" and "else" are validated where "if" is.
+    if step in ("then", "else") and "if" in node:
+        step = "if"
+    return keys.index(step)
+
+
+def _has_false_subschemas(schema: t.Any) -> bool:
+    """Returns whether the schema has `false` subschemas whose errors can't be mapped
+    back to the schema as written.
+
+    The errors of `false` subschemas are located at the keyword holding them, without
+    the index of the branch or the `then`/`else` they are in, so only the `false`
+    values of properties and `additionalProperties` can be told apart.
+    """
+    for subschema in iter_subschemas(schema):
+        if "$ref" in subschema and _resolve(subschema, schema) is False:
+            return True
+        for key, value in subschema.items():
+            if key in SCHEMA_LIST_KEYWORDS and isinstance(value, list):
+                values = value
+            elif key in SCHEMA_KEYWORDS and key != "additionalProperties":
+                values = [value]
+            else:
+                continue
+            if any(_resolve(value, schema) is False for value in values):
+                return True
+    return False
+
+
+def _has_remote_refs(schema: t.Any) -> bool:
+    return any(
+        isinstance(subschema.get("$ref"), str)
+        and not (subschema["$ref"] == "#" or subschema["$ref"].startswith("#/"))
+        for subschema in iter_subschemas(schema)
+    )
+
+
+def optimize(schema: t.Any) -> t.Optional[OptimizedSchema]:
+    """Returns the optimized version of the schema, None if it can't be optimized.
+
+    Schemas with nested `$id`s, references to other documents or `false` subschemas
+    other than property values are not optimized.
+    `allOf`s are only flattened when all the `$ref`s can be inlined, so that the
+    remaining (recursive) ones still point at the same subschemas.
+    """
+    if not isinstance(schema, dict):
+        return None
+    if (
+        has_nested_ids(schema)
+        or _has_remote_refs(schema)
+        or _has_false_subschemas(schema)
+    ):
+        return None
+    dereferenced = dereference(schema)
+    flatten = not any("$ref" in s for s in iter_subschemas(dereferenced))
+    optimizer = _Optimizer(flatten)
+    optimized = optimizer.schema(dereferenced)
+    changed = optimizer.changed or dereferenced != schema
+    return OptimizedSchema(
+        schema,
+        optimized,
+        optimizer.origins,
+        optimizer.list_origins,
+        changed,
+        optimizer.changed,
+    )
@@ -0,0 +1,167 @@
+"""Multi-process validation of large CSV and NDJSON files.
+
+The parent process reads the file and hands fixed-size chunks of rows (or lines) to a
+pool of worker processes.  Each worker builds its validator once, when it starts, and
+validates whole chunks with it.  Results are collected in submission order, and every
+chunk carries the index of its first row, so the merged errors have the same line
+numbers and the same order as a serial run.
+"""
+import itertools
+import logging
+import os
+import typing as t
+from collections import deque
+from pathlib import Path
+
+from fw_gear_file_validator.records import MAX_LENGTH, ErrorRecord
+from fw_gear_file_validator.validator import (
+    CsvValidator,
+    NdjsonValidator,
+    initialize_validator,
+)
+
+if t.TYPE_CHECKING:
+    from fw_gear_file_validator.cache import SchemaCache
+
+log = logging.getLogger(__name__)
+
+# Number of rows sent to a worker at a time.
+CHUNK_SIZE = 10000
+
+# Validator of the current worker process, set by `_init_worker`.
+_worker_validator = None
+
+
+def available_cpus() -> int:
+    """Returns the number of CPUs this process is allowed to run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def _init_worker(file_type: str, schema: dict, config: t.Dict[str, t.Any]):
+    global _worker_validator
+    _worker_validator = initialize_validator(file_type, schema, config)
+
+
+def _validate_chunk(start: int, rows: t.List) -> t.List[ErrorRecord]:
+    return list(_worker_validator.iter_validate(rows, start))
+
+
+class _ParallelValidation:
+    """Mixin distributing chunks of rows over a process pool.
+
+    It is combined with a validator whose `iter_validate(rows, start)` validates the
+    rows of a chunk, and sets the file_type of the validators of the workers.
+    """
+
+    file_type = None
+
+    def __init__(
+        self,
+        schema: t.Union[dict, Path, str],
+        engine: str = "jsonschema",
+        workers: int = 0,
+        chunk_size: int = CHUNK_SIZE,
+        cache: "SchemaCache" = None,
+        max_value_length: int = MAX_LENGTH,
+        optimize: bool = True,
+    ):
+        """
+        Args:
+            schema: the validation JSON schema
+            engine: validation engine used by the workers
+            workers: number of worker processes, 0 for all available CPUs
+            chunk_size: number of rows validated by a worker at a time
+            cache: cache to compile the schema through
+            max_value_length: maximum length of the error fields
+            optimize: whether the schema is optimized for jsonschema
+        """
+        super().__init__(
+            schema, cache, max_value_length=max_value_length, optimize=optimize
+        )
+        self.engine = engine
+        self.workers = workers or available_cpus()
+        self.chunk_size = chunk_size
+        # Configuration of the validators of the workers.
+        self.worker_config = {
+            "engine": engine,
+            "max_value_length": max_value_length,
+            "optimize": optimize,
+        }
+        # Validates inline when the file fits in a single chunk.
+        self.local_validator = initialize_validator(
+            self.file_type, self.validator.schema, self.worker_config
+        )
+
+    def iter_validate(self, rows: t.Iterable, start: int = 0) -> t.Iterator[t.Dict]:
+        rows = iter(rows)
+        chunks = self._iter_chunks(rows, start)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return
+        if self.workers == 1 or len(first_chunk[1]) < self.chunk_size:
+            yield from self.local_validator.iter_validate(first_chunk[1], start)
+            yield from self.local_validator.iter_validate(
+                rows, start + len(first_chunk[1])
+            )
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        log.debug(
+            f"Validating {self.file_type} chunks with {self.workers} worker processes"
+        )
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.file_type, self.validator.schema, self.worker_config),
+        )
+        try:
+            # Keep a bounded number of chunks in flight so memory doesn't grow with
+            # the file size, and collect them in order.
+            pending = deque()
+            for chunk_start, chunk in itertools.chain([first_chunk], chunks):
+                pending.append(executor.submit(_validate_chunk, chunk_start, chunk))
+                if len(pending) >= 2 * self.workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # When the validation stops early (e.g. once the error budget is
+            # exhausted), the chunks not started yet are not validated.
+            executor.shutdown(cancel_futures=True)
+
+    def _iter_chunks(
+        self, rows: t.Iterator, start: int
+    ) -> t.Iterator[t.Tuple[int, t.List]]:
+        """Yields (index of the first row, rows) chunks."""
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield start, chunk
+            start += len(chunk)
+
+
+class ParallelCsvValidator(_ParallelValidation, CsvValidator):
+    """CSV Validator distributing chunks of rows over a process pool."""
+
+    file_type = "csv"
+
+    def iter_validate(
+        self, csv_dict: t.Iterable[t.Dict], start: int = 0
+    ) -> t.Iterator[t.Dict]:
+        # Fail early on schemas the workers would not accept.
+        self.get_column_dtypes()
+        yield from super().iter_validate(csv_dict, start)
+
+
+class ParallelNdjsonValidator(_ParallelValidation, NdjsonValidator):
+    """NDJSON Validator distributing chunks of lines over a process pool.
+
+    Lines are decoded by the workers, so that decoding is parallelized as well.
+    """
+
+    file_type = "ndjson"
@@ -1,21 +1,30 @@
 """Parser module to parse gear config.json."""
 
 from pathlib import Path
-from typing import Tuple, Union
+from typing import TYPE_CHECKING, Tuple, Union
 
-from flywheel_gear_toolkit import GearToolkitContext
+from fw_gear_file_validator.loader import SUPPORTED_FILE_EXTENSIONS
 
-from fw_gear_file_validator.utils import FwReference
+if TYPE_CHECKING:
+    from flywheel_gear_toolkit import GearToolkitContext
+
+    from fw_gear_file_validator.utils import FwReference
 
 level_dict = {"Validate File Contents": "file", "Validate Flywheel Objects": "flywheel"}
-SUPPORTED_FILE_EXTENSIONS = {".json": "json", ".csv": "csv"}
-SUPPORTED_FLYWHEEL_MIMETYPES = {"application/json": "json", "text/csv": "csv"}
+SUPPORTED_FLYWHEEL_MIMETYPES = {
+    "application/json": "json",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+}
+# Containers whose files can be validated in a batch run.
+BATCH_LEVELS = ["project", "subject", "session", "acquisition"]
 
 
 def parse_config(
-    context: GearToolkitContext,
-) -> Tuple[bool, str, Path, FwReference, dict]:
+    context: "GearToolkitContext",
+) -> Tuple[bool, str, Path, "FwReference", dict, dict]:
     """Parses necessary items out of the context object"""
+    from fw_gear_file_validator.utils import FwReference
 
     debug = context.config.get("debug")
     tag = context.config.get("tag")
@@ -24,6 +33,11 @@ def parse_config(
     validation_level = level_dict[context.config.get("validation_level")]
 
     file_to_validate = context.get_input("input_file")
+    if not file_to_validate:
+        raise ValueError(
+            "No input file provided, enable batch to validate the files of the "
+            "destination container instead"
+        )
     ext, mime = get_filetype_data(file_to_validate)
 
     fw_ref = FwReference.init_from_gear_input(
@@ -45,9 +59,95 @@ def parse_config(
         # No need to validate file type if we're not validating the file contents.
         validate_filetype(ext, mime)
 
-    loader_config = {"add_parents": add_parents}
+    loader_config, validator_config = parse_options(context)
+
+    return debug, tag, schema_file_path, fw_ref, loader_config, validator_config
 
-    return debug, tag, schema_file_path, fw_ref, loader_config
+
+def parse_batch_config(
+    context: "GearToolkitContext",
+) -> Tuple[bool, str, Path, dict, str, dict, dict]:
+    """Parses the config of a batch run, validating the files of the destination.
+
+    Returns:
+        debug, tag, schema_file_path, the destination ({"type", "id"}) whose files
+        are validated, validation level ("file" or "flywheel"), loader_config,
+        validator_config
+    """
+    debug = context.config.get("debug")
+    tag = context.config.get("tag")
+    schema_file_path = Path(context.get_input_path("validation_schema"))
+    validation_level = level_dict[context.config.get("validation_level")]
+
+    destination = {
+        "type": context.destination.get("type"),
+        "id": context.destination.get("id"),
+    }
+    if destination["type"] not in BATCH_LEVELS:
+        raise ValueError(
+            f"Batch validation is not supported on {destination['type']} containers"
+        )
+    if validation_level == "file" and context.config.get("add_parents"):
+        raise ValueError("Cannot attach flywheel parents to file-content validation")
+
+    loader_config, validator_config = parse_options(context)
+
+    return (
+        debug,
+        tag,
+        schema_file_path,
+        destination,
+        validation_level,
+        loader_config,
+        validator_config,
+    )
+
+
+def parse_options(context: "GearToolkitContext") -> Tuple[dict, dict]:
+    """Returns the loader and validator configs."""
+    # Only imported for their defaults, when the gear runs (see `loader`).
+    from fw_gear_file_validator.constraints import MAX_INDEX_KEYS
+    from fw_gear_file_validator.memory import resolve_budget
+    from fw_gear_file_validator.records import MAX_LENGTH
+
+    add_parents = context.config.get("add_parents")
+    streaming = context.config.get("streaming", False)
+    engine = context.config.get("engine", "jsonschema")
+    workers = context.config.get("workers", 0)
+    cache_dir = context.config.get("cache_dir") or None
+    max_value_length = context.config.get("max_value_length", MAX_LENGTH)
+    max_index_keys = context.config.get("max_index_keys", MAX_INDEX_KEYS)
+    incremental = context.config.get("incremental", False)
+    max_errors = context.config.get("max_errors", 0)
+    fail_fast = context.config.get("fail_fast", False)
+    deadline = context.config.get("deadline", 0)
+    optimize = context.config.get("optimize", True)
+    memory_budget = resolve_budget(context.config.get("memory_budget", 0))
+    # Files referenced by the foreign keys of the schema are relative to it.
+    reference_dir = context.config.get("reference_dir") or None
+    if reference_dir is None:
+        schema_path = context.get_input_path("validation_schema")
+        reference_dir = Path(schema_path).parent if schema_path else None
+
+    loader_config = {
+        "add_parents": add_parents,
+        "streaming": streaming,
+        "memory_budget": memory_budget,
+    }
+    validator_config = {
+        "engine": engine,
+        "workers": workers,
+        "cache_dir": cache_dir,
+        "max_value_length": max_value_length,
+        "max_index_keys": max_index_keys,
+        "reference_dir": reference_dir,
+        "incremental": incremental,
+        "max_errors": max_errors,
+        "fail_fast": fail_fast,
+        "deadline": deadline,
+        "optimize": optimize,
+    }
+    return loader_config, validator_config
 
 
 def get_fw_type_info(input_file: dict) -> (str, str):
@@ -58,12 +158,15 @@ def get_fw_type_info(input_file: dict) -> (str, str):
 
 
 def get_ext(input_file: Union[Path, str]) -> Union[str, None]:
-    """Extracts the extension from a string or Path"""
+    """Extracts the extension from a string or Path, of the content of compressed
+    files (e.g. ".csv" for data.csv.gz)"""
     if isinstance(input_file, str):
         input_file = Path(input_file)
     if not isinstance(input_file, Path):
         return None
-    return input_file.suffix
+    from fw_gear_file_validator.compression import content_extension
+
+    return content_extension(input_file)
 
 
 def validate_filetype(ext: str, mime: str) -> Union[str, None]:
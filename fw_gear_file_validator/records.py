@@ -0,0 +1,200 @@
+"""Compact validation error records.
+
+Validation can produce hundreds of thousands of errors, each pointing at a value
+and a (sub)schema that may be large.  `ErrorRecord` keeps references to them rather
+than their string form, and only renders the fields of the FW error standard when they
+are accessed, truncated to a maximum length.
+"""
+import typing as t
+from collections.abc import Mapping
+
+if t.TYPE_CHECKING:
+    from jsonschema.exceptions import ValidationError
+
+# Default maximum length of the rendered value, expected value and message.
+MAX_LENGTH = 1000
+
+
+class _Full(Exception):
+    pass
+
+
+def truncate(text: str, max_length: t.Optional[int]) -> str:
+    """Truncates the text to max_length characters (0 or None for no limit)."""
+    if max_length and len(text) > max_length:
+        return text[:max_length] + "..."
+    return text
+
+
+def bounded_str(value: t.Any, max_length: t.Optional[int]) -> str:
+    """Returns `str(value)` truncated to max_length characters.
+
+    Lists and dicts are rendered element by element, stopping at max_length, so that
+    a large value is never rendered in full.
+    """
+    if not max_length or not isinstance(value, (dict, list)):
+        return truncate(str(value), max_length)
+
+    parts = []
+    size = 0
+
+    def write(text: str):
+        nonlocal size
+        parts.append(text)
+        size += len(text)
+        if size > max_length:
+            raise _Full
+
+    def render(node: t.Any):
+        if type(node) is dict:
+            write("{")
+            for index, (key, item) in enumerate(node.items()):
+                if index:
+                    write(", ")
+                write(repr(key))
+                write(": ")
+                render(item)
+            write("}")
+        elif type(node) is list:
+            write("[")
+            for index, item in enumerate(node):
+                if index:
+                    write(", ")
+                render(item)
+            write("]")
+        else:
+            write(repr(node))
+
+    try:
+        render(value)
+    except _Full:
+        pass
+    return truncate("".join(parts), max_length)
+
+
+class ErrorRecord(Mapping):
+    """A validation error, read as a dict in the FW error standard.
+
+    The keys are "type", "code", "location", "value", "expected" and "message", plus
+    any key set later on (e.g. "flywheel_path").  "value" and "expected" are rendered
+    from the failing instance and schema when accessed.  The message can be given as
+    a function of the instance, to defer its rendering as well.
+
+    Args:
+        code: the failing keyword
+        path: the path of the instance in the validated document
+        schema_path: the path of the keyword in the schema
+        instance: the failing instance
+        schema: the (sub)schema containing the keyword
+        message: the error message, or a function of the instance returning it
+        max_length: maximum length of the rendered fields (0 for no limit)
+    """
+
+    __slots__ = (
+        "code",
+        "path",
+        "schema_path",
+        "instance",
+        "schema",
+        "max_length",
+        "_message",
+        "_location",
+        "_extra",
+    )
+    KEYS = ("type", "code", "location", "value", "expected", "message")
+
+    def __init__(
+        self,
+        code: str,
+        path: t.Tuple,
+        schema_path: t.Tuple,
+        instance: t.Any,
+        schema: t.Any,
+        message: t.Union[str, t.Callable[[t.Any], str]],
+        max_length: int = MAX_LENGTH,
+    ):
+        self.code = code
+        self.path = path
+        self.schema_path = schema_path
+        self.instance = instance
+        self.schema = schema
+        self.max_length = max_length
+        if isinstance(message, str):
+            message = truncate(message, max_length)
+        self._message = message
+        self._location = None
+        self._extra = None
+
+    @classmethod
+    def from_error(
+        cls, error: "ValidationError", max_length: int = MAX_LENGTH
+    ) -> "ErrorRecord":
+        return cls(
+            str(error.validator),
+            tuple(error.path),
+            tuple(error.schema_path),
+            error.instance,
+            error.schema,
+            error.message,
+            max_length,
+        )
+
+    @property
+    def message(self) -> str:
+        if callable(self._message):
+            self._message = truncate(self._message(self.instance), self.max_length)
+        return self._message
+
+    def __getitem__(self, key: str) -> t.Any:
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        if key == "type":
+            # For now, validators can only produce errors.
+            return "error"
+        if key == "code":
+            return self.code
+        if key == "location":
+            if self._location is None:
+                return {"key_path": ".".join(str(p) for p in self.schema_path[:-1])}
+            return self._location
+        if key == "value":
+            return bounded_str(self.instance, self.max_length)
+        if key == "expected":
+            return bounded_str(self.schema, self.max_length)
+        if key == "message":
+            return self.message
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: t.Any):
+        if key == "location":
+            self._location = value
+        elif key == "code":
+            self.code = value
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __iter__(self) -> t.Iterator[str]:
+        yield from self.KEYS
+        if self._extra:
+            yield from (key for key in self._extra if key not in self.KEYS)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"ErrorRecord({self.to_dict()!r})"
+
+    def __getstate__(self) -> t.Tuple:
+        # Message functions can't be pickled, render them first.
+        _ = self.message
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state: t.Tuple):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        """Returns the rendered error."""
+        return {key: self[key] for key in self}
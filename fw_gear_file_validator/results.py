@@ -0,0 +1,391 @@
+"""Cache of validation results, to skip validating unchanged inputs again.
+
+Pipelines run the gear again on files whose content hasn't changed, e.g. whenever
+their metadata changes.  The result of a run is keyed by a hash of everything it
+depends on: the content validated, the schema and the files its foreign keys
+reference, the validation level, add_parents, the options changing the reported
+errors and the gear version.  A run with the key of a previous run re-publishes its
+QC result and tag instead of validating the input again.  Files with the same
+content share a key: the errors of a previous result are located in the input file
+again when they are re-published.
+
+The content of a file is hashed in a single streaming pass over its bytes, much
+cheaper than validating it.  Flywheel objects are hashed once loaded, as only the
+fields referenced by the schema are.
+
+Previous results are looked up in:
+
+- the QC result of the file, in which runs save their key as `result_key`,
+- the cache directory, when given, which also keeps a copy of the errors file, so
+  that it can be written to the output directory again.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import typing as t
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from fw_gear_file_validator.budget import DEADLINE
+from fw_gear_file_validator.errors import (
+    add_flywheel_location_to_errors,
+    errors_file_name,
+    write_errors,
+)
+from fw_gear_file_validator.timing import StageTimer
+from fw_gear_file_validator.utils import FwReference, add_tags_metadata
+
+if t.TYPE_CHECKING:
+    from flywheel_gear_toolkit import GearToolkitContext
+
+log = logging.getLogger(__name__)
+
+# Bump when the content of the cache entries or the results of a key change.
+RESULT_CACHE_VERSION = 1
+MAX_RESULTS = 1024
+# Number of bytes read at a time when hashing files.
+HASH_CHUNK_SIZE = 2**20
+# Name of the QC result of the gear.
+QC_RESULT_NAME = "validation"
+
+
+def file_hash(path: t.Union[Path, str], chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Returns the SHA-256 hash of the bytes of the file, read a chunk at a time."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def object_hash(obj: t.Any) -> str:
+    """Returns a hash of a JSON-like object, independent of key order."""
+    content = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("UTF-8")).hexdigest()
+
+
+def reference_hashes(
+    schema: t.Any, reference_dir: t.Union[Path, str, None] = None
+) -> t.Dict[str, t.Optional[str]]:
+    """Returns the hashes of the files referenced by the foreign keys of the schema.
+
+    Missing files hash to None, their absence is part of the result as well.
+    """
+    from fw_gear_file_validator.constraints import RowConstraints
+
+    constraints = RowConstraints.from_schema(schema, reference_dir=reference_dir)
+    hashes = {}
+    for foreign_key in constraints.foreign_keys if constraints else []:
+        path = constraints.reference_path(foreign_key)
+        hashes[str(path)] = file_hash(path) if path.is_file() else None
+    return hashes
+
+
+def result_key(
+    input_hash: str,
+    schema: dict,
+    validation_level: str,
+    add_parents: bool,
+    gear_version: str,
+    options: t.Optional[t.Dict[str, t.Any]] = None,
+) -> str:
+    """Returns the key of the result of validating the input.
+
+    Args:
+        input_hash: hash of the content validated (see `file_hash` and
+            `object_hash`)
+        schema: the validation schema
+        validation_level: "file" or "flywheel"
+        add_parents: whether the parent containers are validated
+        gear_version: version of the gear
+        options: other options the result depends on, e.g. the maximum length of
+            the values reported or the hashes of the referenced files
+    """
+    from fw_gear_file_validator.cache import schema_hash
+
+    return object_hash(
+        {
+            "version": RESULT_CACHE_VERSION,
+            "input": input_hash,
+            "schema": schema_hash(schema),
+            "validation_level": validation_level,
+            "add_parents": bool(add_parents),
+            "gear_version": gear_version,
+            "options": options or {},
+        }
+    )
+
+
+def gear_result_key(
+    context: "GearToolkitContext",
+    schema: dict,
+    input_hash: str,
+    fw_ref: FwReference,
+    validator_config: t.Dict[str, t.Any],
+    streaming: bool = False,
+) -> str:
+    """Returns the key of the result of validating the input of the gear run.
+
+    Args:
+        context: the gear context, for the add_parents config and gear version
+        schema: the validation schema
+        input_hash: hash of the content validated
+        fw_ref: the input, validated at the level of its contents
+        validator_config: the validator config (see `parser.parse_options`)
+        streaming: the streaming option of the loader, as the errors of streamed
+            JSON documents have their values elided (see `jsonstream`).
+    """
+    return result_key(
+        input_hash,
+        schema,
+        fw_ref.contents,
+        context.config.get("add_parents"),
+        context.manifest.get("version", ""),
+        options={
+            "max_value_length": validator_config.get("max_value_length"),
+            "max_errors": validator_config.get("max_errors"),
+            "fail_fast": validator_config.get("fail_fast"),
+            "streaming": bool(streaming),
+            "references": reference_hashes(
+                schema, validator_config.get("reference_dir")
+            ),
+        },
+    )
+
+
+def reusable_key(
+    key: t.Optional[str], partial: t.Optional[str], streamed: bool = False
+) -> t.Optional[str]:
+    """Returns the key to save the result of the run with, None if the result can't
+    be reused.
+
+    Where a validation stopped by its deadline ends depends on the run, unlike the
+    other reasons for stopping early (see `budget`).  Documents streamed only to fit
+    in the memory budget (see `loader.Loader.use_streaming`) are reported with
+    elided values, unlike the documents loaded with the same options by other runs.
+    """
+    return None if partial == DEADLINE or streamed else key
+
+
+@dataclass
+class CachedResult:
+    """A previous QC result: its state, data and, if kept, a copy of its errors."""
+
+    state: str
+    data: t.Dict[str, t.Any] = field(default_factory=dict)
+    errors_path: t.Optional[Path] = None
+
+
+def result_from_info(
+    info: t.Optional[t.Dict], gear_name: str, key: str
+) -> t.Optional[CachedResult]:
+    """Returns the QC result saved in the file info by the gear, if it has the key."""
+    qc = ((info or {}).get("qc") or {}).get(gear_name) or {}
+    result = qc.get(QC_RESULT_NAME)
+    if not isinstance(result, dict) or result.get("result_key") != key:
+        return None
+    data = {k: v for k, v in result.items() if k != "state"}
+    return CachedResult(result["state"], data)
+
+
+class ResultCache:
+    """Size-bounded cache of QC results on disk, keyed by `result_key`."""
+
+    def __init__(self, cache_dir: t.Union[Path, str], max_entries: int = MAX_RESULTS):
+        self.cache_dir = Path(cache_dir) / "results"
+        self.max_entries = max_entries
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _errors_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.errors.ndjson.gz"
+
+    def get(self, key: str) -> t.Optional[CachedResult]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="UTF-8") as fp:
+                content = json.load(fp)
+            if (
+                content.get("version") != RESULT_CACHE_VERSION
+                or content.get("key") != key
+            ):
+                raise ValueError("Outdated cache entry")
+            errors_path = None
+            if content["data"].get("errors_file"):
+                errors_path = self._errors_path(key)
+                if not errors_path.is_file():
+                    raise ValueError("Missing errors file")
+            # Mark the entry as recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError) as e:
+            log.debug(f"Discarding result cache entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        return CachedResult(content["state"], content["data"], errors_path)
+
+    def put(
+        self,
+        key: str,
+        state: str,
+        data: t.Dict[str, t.Any],
+        errors_path: t.Optional[Path] = None,
+    ):
+        """Saves the result, with a copy of the errors file if given.
+
+        The timings of the run are not saved, they only describe that run.
+        """
+        content = {
+            "version": RESULT_CACHE_VERSION,
+            "key": key,
+            "state": state,
+            "data": {k: v for k, v in data.items() if k != "timings"},
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            if errors_path is not None:
+                with open(errors_path, "rb") as src:
+                    with self._open_atomic(self._errors_path(key)) as dst:
+                        shutil.copyfileobj(src, dst)
+            with self._open_atomic(self._path(key)) as fp:
+                fp.write(json.dumps(content).encode("UTF-8"))
+            self._evict()
+        except (OSError, TypeError, ValueError) as e:
+            log.warning(f"Unable to save result to {self.cache_dir}: {e}")
+
+    @contextmanager
+    def _open_atomic(self, path: Path) -> t.Iterator[t.BinaryIO]:
+        # Write to a temporary file first so that concurrent runs never read a
+        # partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                yield fp
+            os.replace(tmp_path, path)
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+    def _evict(self):
+        """Removes the least recently used entries beyond max_entries from disk."""
+        paths = sorted(
+            self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True
+        )
+        for path in paths[self.max_entries :]:
+            path.unlink(missing_ok=True)
+            self._errors_path(path.stem).unlink(missing_ok=True)
+
+
+def cache_result(
+    cache: t.Optional[ResultCache],
+    key: t.Optional[str],
+    state: str,
+    data: t.Dict[str, t.Any],
+    output_dir: t.Union[Path, str],
+):
+    """Saves the QC result of the run to the cache, with a copy of its errors file.
+
+    Nothing is saved without a cache or a key, e.g. for results that can't be
+    reused (see `reusable_key`).
+    """
+    if cache is None or key is None:
+        return
+    errors_path = None
+    if data.get("errors_file"):
+        errors_path = Path(output_dir) / data["errors_file"]
+    cache.put(key, state, data, errors_path)
+
+
+def lookup_result(
+    key: str,
+    info: t.Optional[t.Dict],
+    gear_name: str,
+    cache: t.Optional[ResultCache] = None,
+) -> t.Optional[CachedResult]:
+    """Returns the previous result with the key, from the cache or the file info.
+
+    The cache is looked up first, as it also has the errors of the result.
+    """
+    cached = cache.get(key) if cache is not None else None
+    return cached or result_from_info(info, gear_name, key)
+
+
+def publish_result(
+    cached: CachedResult,
+    input_file: FwReference,
+    gtk_context: "GearToolkitContext",
+    timings: t.Optional[t.Dict] = None,
+):
+    """Saves the previous result as the QC result of the input file.
+
+    The cached copy of the errors file, if any, is written to the output directory,
+    with the Flywheel locations of the errors and of their summary set for the
+    input file: the previous result may be of another file with the same content.
+    Otherwise, the result refers to the errors file written by the previous run of
+    the gear on the input file.
+    """
+    data = {k: v for k, v in cached.data.items() if k != "timings"}
+    if cached.errors_path is not None:
+        errors_path = Path(gtk_context.output_dir) / errors_file_name(input_file.name)
+        data["data"] = relocate_errors(cached.errors_path, errors_path, input_file)
+        data["errors_file"] = errors_path.name
+    if timings:
+        data["timings"] = timings
+    gtk_context.metadata.add_qc_result(
+        input_file.name, QC_RESULT_NAME, state=cached.state, **data
+    )
+
+
+def relocate_errors(
+    src_path: Path, dst_path: Path, fw_ref: FwReference
+) -> t.List[t.Dict]:
+    """Writes the errors of src_path to dst_path, located in the Flywheel object of
+    fw_ref, and returns their summary (see `errors.write_errors`)."""
+    with gzip.open(src_path, "rt", encoding="UTF-8") as fp:
+        errors = [json.loads(line) for line in fp]
+    for error in errors:
+        error.pop("flywheel_path", None)
+        error.pop("container_id", None)
+    errors = add_flywheel_location_to_errors(fw_ref, errors)
+    return write_errors(errors, dst_path)
+
+
+def reuse_result(
+    context: "GearToolkitContext",
+    fw_ref: FwReference,
+    key: str,
+    cache: t.Optional[ResultCache],
+    tag: str,
+    timer: StageTimer,
+) -> bool:
+    """Re-publishes the previous result of the input with the key, if any, with its
+    tags.
+
+    Returns:
+        True if a previous result was found and re-published.
+    """
+    with timer.span("lookup_result"):
+        cached = lookup_result(
+            key, fw_ref.fw_object.info, context.manifest.get("name", ""), cache
+        )
+    if cached is None:
+        return False
+    log.info(f"Input unchanged since it was last validated, reusing result {key}")
+    with timer.span("save_errors"):
+        timings = {"stages": timer.summary(), "api": fw_ref.client.stats}
+        publish_result(cached, fw_ref, context, timings=timings)
+    with timer.span("tags"):
+        add_tags_metadata(context, fw_ref, cached.state == "PASS", tag)
+
+    log.info("Time spent by stage:")
+    timer.log()
+    log.info(f"Flywheel API usage: {fw_ref.client.stats}")
+    return True
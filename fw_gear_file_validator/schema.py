@@ -0,0 +1,169 @@
+"""Schema transformations applied once, before validation."""
+import typing as t
+from urllib.parse import unquote
+
+# Extension keywords of the root of CSV schemas, checked across rows (see
+# `constraints`).
+CONSTRAINT_KEYWORDS = {"uniqueKeys", "foreignKeys"}
+# Keywords whose values are data rather than schemas.
+LITERAL_KEYWORDS = {"enum", "const", "default", "examples", *CONSTRAINT_KEYWORDS}
+# Keywords that only validate the properties named in the schema.
+PROJECTABLE_KEYWORDS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "title",
+    "description",
+    "default",
+    "examples",
+    "definitions",
+    "type",
+    "properties",
+    "required",
+}
+
+
+def iter_subschemas(schema: t.Any) -> t.Iterator[t.Any]:
+    if isinstance(schema, dict):
+        yield schema
+        for value in schema.values():
+            yield from iter_subschemas(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            yield from iter_subschemas(value)
+
+
+def has_nested_ids(schema: t.Any) -> bool:
+    """Returns True if a subschema has an `$id`, which changes how references resolve."""
+    return any("$id" in s and s is not schema for s in iter_subschemas(schema))
+
+
+def resolve_local(schema: t.Any, root: t.Any) -> t.Any:
+    """Follows the `$ref`s of the schema within the root document.
+
+    Returns None for references to other documents, missing targets or cycles.
+    """
+    seen = set()
+    while isinstance(schema, dict) and "$ref" in schema:
+        ref = schema["$ref"]
+        if not isinstance(ref, str) or not (ref == "#" or ref.startswith("#/")):
+            return None
+        if ref in seen:
+            return None
+        seen.add(ref)
+        try:
+            schema = resolve_pointer(root, ref)
+        except (KeyError, IndexError, ValueError, TypeError):
+            return None
+    return schema
+
+
+def parse_pointer(document: t.Any, pointer: str) -> t.Tuple:
+    """Returns the keys and indices of a local JSON pointer reference in the document.
+
+    E.g. ("definitions", "num") for "#/definitions/num".
+    """
+    parts = ()
+    node = document
+    for part in unquote(pointer[1:]).split("/")[1:]:
+        part = part.replace("~1", "/").replace("~0", "~")
+        if isinstance(node, list):
+            part = int(part)
+        node = node[part]
+        parts += (part,)
+    return parts
+
+
+def resolve_pointer(document: t.Any, pointer: str) -> t.Any:
+    """Resolves a local JSON pointer reference (e.g. "#/definitions/num")."""
+    node = document
+    for part in parse_pointer(document, pointer):
+        node = node[part]
+    return node
+
+
+def dereference(schema: dict) -> dict:
+    """Returns a copy of the schema with its local `$ref`s replaced by their target.
+
+    Only references within the document ("#/...") are inlined.  Recursive references
+    and references to other documents are kept, as are the `definitions` themselves,
+    so that jsonschema can still resolve them.  Following Draft 7, keywords next to a
+    `$ref` are ignored and dropped.  Schemas with nested `$id`s (which change how
+    references resolve) are returned unchanged.
+    """
+    if not isinstance(schema, dict):
+        return schema
+    if has_nested_ids(schema):
+        return schema
+
+    resolved = {}
+
+    def _deref(node: t.Any, stack: t.Tuple[str, ...]) -> t.Any:
+        if isinstance(node, list):
+            return [_deref(value, stack) for value in node]
+        if not isinstance(node, dict):
+            return node
+        ref = node.get("$ref")
+        if isinstance(ref, str) and (ref == "#" or ref.startswith("#/")):
+            if ref in stack:
+                return node
+            if ref not in resolved:
+                try:
+                    target = resolve_pointer(schema, ref)
+                except (KeyError, IndexError, ValueError, TypeError):
+                    return node
+                resolved[ref] = _deref(target, stack + (ref,))
+            return resolved[ref]
+        return {
+            key: value if key in LITERAL_KEYWORDS else _deref(value, stack)
+            for key, value in node.items()
+        }
+
+    if "$ref" in schema:
+        # Inlining the reference of the root would drop the definitions the rest of
+        # the references resolve in.
+        return {
+            key: value
+            if key in LITERAL_KEYWORDS or key == "$ref"
+            else _deref(value, ())
+            for key, value in schema.items()
+        }
+    return _deref(schema, ())
+
+
+def referenced_properties(
+    schema: t.Any, depth: int = 2, root: t.Any = None
+) -> t.Optional[t.Dict[str, t.Any]]:
+    """Returns the properties of a JSON object the schema may look at, recursively.
+
+    Returns a dict mapping each property named in `properties` or `required` to the
+    properties referenced below it, in the same format, down to `depth` levels.  None
+    means the whole value may be needed, e.g. when `depth` is reached or when the
+    schema uses keywords validating arbitrary properties (`additionalProperties`,
+    `anyOf`, ...).  For instance, with depth=2:
+        {"file": {"info": None, "type": None}, "session": {}}
+    where the session is only required to exist.
+    """
+    if root is None:
+        root = schema
+        if has_nested_ids(schema):
+            return None
+    if depth == 0:
+        return None
+    schema = resolve_local(schema, root)
+    if not isinstance(schema, dict) or not PROJECTABLE_KEYWORDS.issuperset(schema):
+        return None
+    properties = schema.get("properties", {})
+    required = schema.get("required", [])
+    if schema.get("type", "object") != "object":
+        return None
+    if not isinstance(properties, dict) or not isinstance(required, list):
+        return None
+
+    referenced = {name: {} for name in required if isinstance(name, str)}
+    for name, subschema in properties.items():
+        if subschema is True:
+            referenced.setdefault(name, {})
+        else:
+            referenced[name] = referenced_properties(subschema, depth - 1, root)
+    return referenced
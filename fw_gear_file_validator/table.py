@@ -0,0 +1,279 @@
+"""Compact columnar representation of CSV files held in memory.
+
+A list of rows read by `csv.DictReader` holds a dict per row, with a reference to
+every key and a string object for every value, about 14 times the size of the file.
+`CsvTable` stores the values column by column instead:
+
+- columns of integers or floats (whose text is exactly the number they parse to) in
+  typed `array`s, 8 bytes per value,
+- columns with few distinct values as 2-byte codes into a dictionary of the values,
+- other columns as lists of interned strings.
+
+The table reads like the list of rows it replaces: indexing and iterating it yields
+the same row dicts as `csv.DictReader`, materialized on demand.  Validators aware of
+it (see `columnar.ColumnarCsvValidator`) read the columns directly, without
+materializing the rows, and reuse the numbers already parsed.
+"""
+import array
+import csv
+import itertools
+import sys
+import typing as t
+from collections.abc import Sequence
+
+# String columns are dictionary-encoded while they have at most MAX_DICTIONARY_SIZE
+# distinct values, and once MIN_ROWS_FOR_RATIO values have been read, as long as at
+# most half of their values are distinct.
+MAX_DICTIONARY_SIZE = 2**16
+MIN_ROWS_FOR_RATIO = 1024
+# Number of rows read from the file and added to the columns at a time.
+CHUNK_SIZE = 4096
+
+TYPECODES = {"int": "q", "float": "d"}
+
+
+class Column:
+    """The values of a column of a CsvTable.
+
+    The kind of the column is "int", "float" (typed arrays of the numbers),
+    "dictionary" (array of codes into `dictionary`) or "strings" (list of the
+    values).  Numeric columns fall back to strings as soon as a value isn't a number
+    written in its canonical form, and dictionary-encoded columns to plain strings
+    when they have too many distinct values.
+    """
+
+    __slots__ = ("name", "kind", "data", "dictionary", "_codes")
+
+    def __init__(self, name: t.Optional[str]):
+        self.name = name
+        self.kind = None
+        self.data: t.Union[array.array, t.List] = None
+        self.dictionary: t.Optional[t.List[t.Optional[str]]] = None
+        self._codes: t.Optional[t.Dict[t.Optional[str], int]] = None
+
+    def extend(self, values: t.List[t.Optional[str]]):
+        """Appends the values, as read from the file (None for missing values)."""
+        if not values:
+            return
+        if self.kind is None:
+            for kind in TYPECODES:
+                numbers = _parse_numbers(values, kind)
+                if numbers is not None:
+                    self.kind = kind
+                    self.data = numbers
+                    return
+            self._to_strings()
+        elif self.kind in TYPECODES:
+            numbers = _parse_numbers(values, self.kind)
+            if numbers is not None:
+                self.data.extend(numbers)
+                return
+            self._to_strings()
+
+        if self.kind == "dictionary":
+            codes = self._codes
+            new_values = [
+                value for value in dict.fromkeys(values) if value not in codes
+            ]
+            n_distinct = len(self.dictionary) + len(new_values)
+            n_values = len(self.data) + len(values)
+            if n_distinct <= MAX_DICTIONARY_SIZE and (
+                n_values < MIN_ROWS_FOR_RATIO or n_distinct <= n_values // 2 + 1
+            ):
+                for value in new_values:
+                    codes[value] = len(self.dictionary)
+                    self.dictionary.append(value)
+                self.data.extend(map(codes.__getitem__, values))
+                return
+            self._to_plain_strings()
+        self.data.extend(_intern(values))
+
+    def _to_strings(self):
+        values = self.text() if self.kind else []
+        self.kind = "dictionary"
+        self.data = array.array("H")
+        self.dictionary = []
+        self._codes = {}
+        self.extend(values)
+
+    def _to_plain_strings(self):
+        values = self.text()
+        self.kind = "strings"
+        self.data = _intern(values)
+        self.dictionary = None
+        self._codes = None
+
+    def __len__(self) -> int:
+        return len(self.data) if self.data is not None else 0
+
+    def __getitem__(self, index: int) -> t.Optional[str]:
+        value = self.data[index]
+        if self.kind == "dictionary":
+            return self.dictionary[value]
+        if self.kind == "int":
+            return str(value)
+        if self.kind == "float":
+            return repr(value)
+        return value
+
+    def text(self, start: int = 0, stop: t.Optional[int] = None) -> t.List:
+        """Returns the values of the rows from start to stop as read from the file."""
+        data = self.data[start:stop] if self.data is not None else []
+        if self.kind == "dictionary":
+            return list(map(self.dictionary.__getitem__, data))
+        if self.kind == "int":
+            return list(map(str, data))
+        if self.kind == "float":
+            return list(map(repr, data))
+        return list(data)
+
+    def typed(
+        self, cast_type: type, start: int = 0, stop: t.Optional[int] = None
+    ) -> t.Optional[t.List]:
+        """Returns the values cast to int or float if the column holds such numbers.
+
+        The values are the same as casting their text, without parsing it again.
+        Returns None if the column isn't numeric or can't be cast that way.
+        """
+        if self.kind == "int" and cast_type in (int, float):
+            values = self.data[start:stop].tolist()
+            return values if cast_type is int else list(map(float, values))
+        if self.kind == "float" and cast_type is float:
+            return self.data[start:stop].tolist()
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the values, in bytes."""
+        if self.data is None:
+            return 0
+        if self.kind == "strings":
+            return sys.getsizeof(self.data) + sum(
+                sys.getsizeof(v) for v in set(self.data)
+            )
+        size = self.data.itemsize * len(self.data)
+        if self.kind == "dictionary":
+            size += sum(sys.getsizeof(v) for v in self.dictionary)
+        return size
+
+
+def _intern(values: t.Iterable[t.Optional[str]]) -> t.List[t.Optional[str]]:
+    return [sys.intern(v) if v.__class__ is str else v for v in values]
+
+
+def _parse_numbers(values: t.List[t.Any], kind: str) -> t.Optional[array.array]:
+    """Returns the numbers written in the values if they are all in their canonical
+    text (e.g. "1" but not "01" or "1.0" for ints), else None."""
+    try:
+        if kind == "int":
+            numbers = list(map(int, values))
+            canonical = list(map(str, numbers)) == values
+        else:
+            numbers = list(map(float, values))
+            canonical = list(map(repr, numbers)) == values
+        return array.array(TYPECODES[kind], numbers) if canonical else None
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+class CsvTable(Sequence):
+    """The rows of a CSV file, stored column by column.
+
+    Rows are read as `csv.DictReader` reads them: keyed by the names of the header,
+    with None for the values missing from short rows, and the extra values of long
+    rows in a list under the None key.
+
+    Args:
+        fieldnames: the names of the columns, as in the header of the file
+    """
+
+    def __init__(self, fieldnames: t.Sequence[str]):
+        self.fieldnames = list(fieldnames)
+        self.column_list = [Column(name) for name in self.fieldnames]
+        # With duplicated names, the value of the last column is read, as in
+        # DictReader.
+        self.columns = {column.name: column for column in self.column_list}
+        # Extra values of the rows longer than the header, by row index.
+        self.extras: t.Dict[int, t.List[str]] = {}
+        self._length = 0
+
+    @classmethod
+    def from_file(cls, csv_file: t.TextIO, **fmtparams) -> "CsvTable":
+        """Reads the open csv file into a table."""
+        reader = csv.reader(csv_file, **fmtparams)
+        header = next(reader, None)
+        if header is None:
+            return cls([])
+        table = cls(header)
+        while True:
+            lines = list(itertools.islice(reader, CHUNK_SIZE))
+            if not lines:
+                return table
+            # Blank lines are skipped, as in DictReader.
+            table.extend([cells for cells in lines if cells])
+
+    @classmethod
+    def from_rows(cls, rows: t.Iterable[t.Dict[str, t.Any]]) -> "CsvTable":
+        """Builds a table from row dicts, as read by `csv.DictReader`."""
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return cls([])
+        table = cls([key for key in first if key is not None])
+        rows = itertools.chain([first], rows)
+        while True:
+            chunk = [
+                [row.get(name) for name in table.fieldnames] + (row.get(None) or [])
+                for row in itertools.islice(rows, CHUNK_SIZE)
+            ]
+            if not chunk:
+                return table
+            table.extend(chunk)
+
+    def extend(self, rows: t.List[t.List[t.Optional[str]]]):
+        """Appends rows of values, in the order of the columns."""
+        if not rows:
+            return
+        n_columns = len(self.column_list)
+        if set(map(len, rows)) != {n_columns}:
+            for index, cells in enumerate(rows):
+                if len(cells) > n_columns:
+                    self.extras[self._length + index] = list(cells[n_columns:])
+            rows = [
+                cells[:n_columns] + [None] * (n_columns - len(cells)) for cells in rows
+            ]
+        for column, values in zip(self.column_list, zip(*rows)):
+            column.extend(list(values))
+        self._length += len(rows)
+
+    def append(self, cells: t.List[t.Optional[str]]):
+        """Appends the values of a row, in the order of the columns."""
+        self.extend([cells])
+
+    def __len__(self) -> int:
+        return self._length
+
+    def row(self, index: int) -> t.Dict[t.Optional[str], t.Any]:
+        """Materializes the dict of the row at index."""
+        row = {column.name: column[index] for column in self.column_list}
+        if self.extras and index in self.extras:
+            row[None] = self.extras[index]
+        return row
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("table index out of range")
+        return self.row(index)
+
+    def __iter__(self) -> t.Iterator[t.Dict[t.Optional[str], t.Any]]:
+        for index in range(self._length):
+            yield self.row(index)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the values, in bytes."""
+        return sum(column.nbytes for column in self.column_list)
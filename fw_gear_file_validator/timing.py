@@ -0,0 +1,122 @@
+"""Timing and memory usage of the stages of a run, and optional profiling."""
+import logging
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+from pathlib import Path
+
+from fw_gear_file_validator.memory import peak_rss_mb
+
+log = logging.getLogger(__name__)
+
+# Name of the profile written to the output directory.
+PROFILE_FILE_NAME = "profile.pstats"
+
+
+class StageTimer:
+    """Accumulates the time spent in the stages of a run, and their memory usage.
+
+    A stage can be entered several times (e.g. once per file), its durations and
+    number of calls add up.  Stages are reported in the order they were first
+    entered.
+
+    The peak resident memory of the process is recorded at the end of each stage,
+    so the stage where it grows is the one that needed it.  With trace_memory, the
+    peak memory allocated by Python during each stage, on top of the memory allocated
+    before it, is also traced with tracemalloc.  This slows the run down and is only
+    meaningful for stages that don't run concurrently.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self._lock = threading.Lock()
+        self.trace_memory = trace_memory
+        self.seconds: t.Dict[str, float] = {}
+        self.calls: t.Dict[str, int] = {}
+        self.peak_rss_mb: t.Dict[str, float] = {}
+        self.traced_peak_mb: t.Dict[str, float] = {}
+        if trace_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextmanager
+    def span(self, stage: str) -> t.Iterator[None]:
+        traced_start = 0
+        if self.trace_memory:
+            import tracemalloc
+
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_rss = peak_rss_mb()
+            traced_peak = None
+            if self.trace_memory:
+                traced_peak = (
+                    tracemalloc.get_traced_memory()[1] - traced_start
+                ) / 2**20
+            with self._lock:
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+                self.calls[stage] = self.calls.get(stage, 0) + 1
+                self.peak_rss_mb[stage] = max(self.peak_rss_mb.get(stage, 0), peak_rss)
+                if traced_peak is not None:
+                    self.traced_peak_mb[stage] = max(
+                        self.traced_peak_mb.get(stage, 0), traced_peak
+                    )
+
+    def summary(self) -> t.Dict[str, t.Dict[str, t.Any]]:
+        """Returns the time spent (in seconds), number of calls and peak memory (in
+        MB) by stage."""
+        with self._lock:
+            summary = {}
+            for stage, seconds in self.seconds.items():
+                summary[stage] = {
+                    "seconds": round(seconds, 3),
+                    "calls": self.calls[stage],
+                    "peak_rss_mb": round(self.peak_rss_mb[stage], 1),
+                }
+                if stage in self.traced_peak_mb:
+                    summary[stage]["traced_peak_mb"] = round(
+                        self.traced_peak_mb[stage], 1
+                    )
+            return summary
+
+    def log(self, level: int = logging.INFO):
+        total = sum(self.seconds.values())
+        for stage, timing in self.summary().items():
+            message = (
+                f"{stage:<20} {timing['seconds']:>9.3f}s "
+                f"({timing['seconds'] / total if total else 0:>4.0%}) "
+                f"x{timing['calls']}, peak RSS {timing['peak_rss_mb']:.1f} MB"
+            )
+            if "traced_peak_mb" in timing:
+                message += f", traced peak {timing['traced_peak_mb']:.1f} MB"
+            log.log(level, message)
+
+
+@contextmanager
+def profile(output_dir: t.Optional[t.Union[Path, str]]) -> t.Iterator[None]:
+    """Profiles the block with cProfile if output_dir is given.
+
+    The statistics are dumped to PROFILE_FILE_NAME in output_dir, to be read with
+    pstats or a viewer such as snakeviz.
+    """
+    if output_dir is None:
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = Path(output_dir) / PROFILE_FILE_NAME
+        profiler.dump_stats(path)
+        log.info(f"Saved profile to {path}")
@@ -4,9 +4,12 @@ from dataclasses import dataclass
 from functools import cached_property
 from pathlib import Path
 
-import flywheel
-import flywheel_gear_toolkit
-from flywheel_gear_toolkit.utils.datatypes import Container
+from fw_gear_file_validator.client import CachingClient
+
+if t.TYPE_CHECKING:
+    import flywheel
+    import flywheel_gear_toolkit
+    from flywheel_gear_toolkit.utils.datatypes import Container
 
 PARENT_ORDER = [
     "group",
@@ -22,6 +25,8 @@ log = logging.getLogger()
 
 N_TRIES = 5
 SLEEP_TIME = 5
+# Maximum number of Flywheel API requests made at the same time.
+MAX_CONCURRENT_REQUESTS = 4
 
 
 @dataclass
@@ -51,9 +56,9 @@ class FwReference:
 
     id: str = None
     input_object: t.Union[
-        flywheel.ContainerReference,
-        flywheel.FileReference,
-        flywheel.JobFileInput,
+        "flywheel.ContainerReference",
+        "flywheel.FileReference",
+        "flywheel.JobFileInput",
         dict,
     ] = None
     type: str = None
@@ -61,14 +66,14 @@ class FwReference:
     name: str = None
     file_type: str = None
     ref: dict = None
-    _client: flywheel.Client = None
+    _client: "flywheel.Client" = None
     contents: str = None
 
     @classmethod
     def init_from_gear_input(
         cls,
-        fw_client: flywheel.Client,
-        gear_input: t.Union[dict, flywheel.models.JobFileInput],
+        fw_client: "flywheel.Client",
+        gear_input: t.Union[dict, "flywheel.models.JobFileInput"],
         content: str = None,
     ):
         """
@@ -87,6 +92,8 @@ class FwReference:
         if "label" in gear_input:
             raise ValueError("Only files are valid FwReference Inputs")
 
+        fw_client = CachingClient.wrap(fw_client)
+
         file_object = fw_client.get_file(gear_input.get("object", {}).get("file_id"))
         return cls(
             input_object=gear_input,
@@ -100,6 +107,7 @@ class FwReference:
         )
 
     def __post_init__(self) -> None:
+        self._client = CachingClient.wrap(self._client)
         self.path_is_valid()
         self.parents = {k: v for k, v in self.parents.items() if v}  # remove None's
         self.ref = {**self.parents, self.type: self.id}
@@ -134,25 +142,26 @@ class FwReference:
                 return self.parents[p]
 
     @property
-    def loc(self) -> t.Union[Path, dict]:
+    def loc(self) -> t.Union[Path, "FwReference"]:
         """Returns location of the object."""
         if self.contents == "file":
             if self.file_path:
                 return self.file_path
             return Path("")
         elif self.contents == "flywheel":
-            return self.hierarchy_objects
+            # Containers are fetched by the loader, only those it needs.
+            return self
 
     @property
-    def client(self) -> flywheel.Client:
+    def client(self) -> "flywheel.Client":
         """Returns the Flywheel client."""
         if not self._client:
             raise ValueError("Client not set. Use set_client() to set the client.")
         return self._client
 
-    def set_client(self, client: flywheel.Client):
+    def set_client(self, client: "flywheel.Client"):
         """Sets the Flywheel client as attribute."""
-        self._client = client
+        self._client = CachingClient.wrap(client)
 
     def get_lookup_path(self, level: str = None) -> str:
         """Returns the Flywheel path of the Flywheel object."""
@@ -168,21 +177,36 @@ class FwReference:
         return "fw://" + "/".join(hierarchy_parts)
 
     @cached_property
-    def fw_object(self) -> Container:
+    def fw_object(self) -> "Container":
         """Returns the container for the provided Flywheel reference."""
         return self.get_level_object(self.type)
 
     @cached_property
     def hierarchy_objects(self):
+        """Returns the containers of the reference, by level."""
+        return self.fetch_levels(self.ref.keys())
+
+    def fetch_levels(self, levels: t.Iterable[str]) -> t.Dict[str, "Container"]:
+        """Returns the containers of the given levels of the reference, by level.
+
+        Levels are fetched concurrently, up to MAX_CONCURRENT_REQUESTS at a time.
+        Levels missing from the reference are skipped.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        levels = [level for level in levels if level in self.ref]
+        max_workers = max(1, min(MAX_CONCURRENT_REQUESTS, len(levels)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fw_objects = list(executor.map(self.get_level_object, levels))
+
         hierarchy = {}
-        for level in self.ref.keys():
-            fw_object = self.get_level_object(level)
+        for level, fw_object in zip(levels, fw_objects):
             if fw_object is None:
                 continue
             hierarchy[level] = fw_object
         return hierarchy
 
-    def get_level_object(self, level) -> t.Union[dict, Container, None]:
+    def get_level_object(self, level) -> t.Union[dict, "Container", None]:
         """Returns all the parent containers."""
         if level not in self.ref.keys():
             return None
@@ -193,7 +217,7 @@ class FwReference:
 
 
 def add_tags_metadata(
-    context: flywheel_gear_toolkit.GearToolkitContext,
+    context: "flywheel_gear_toolkit.GearToolkitContext",
     fw_ref: FwReference,
     valid,
     tag,
@@ -218,23 +242,6 @@ def add_tags_metadata(
     context.metadata.add_file_tags(input_object, str(tag))
 
 
-def cast_csv_val(val: t.Any, cast_type: type):
-    """Attempt to cast a type.  Return original value if unsuccessful
-
-    Args:
-        val: the value to cast
-        cast_type: the type to cast it to
-
-    Returns:
-        cast_type(val) | val
-
-    """
-    try:
-        return cast_type(val)
-    except ValueError:
-        return val
-
-
 def get_loader_type(fw_ref):
     if fw_ref.contents == "flywheel":
         return fw_ref.contents
@@ -1,43 +1,151 @@
 import json
+import logging
 import typing as t
 from pathlib import Path
 
-import jsonschema
-from jsonschema.exceptions import ValidationError
+from fw_gear_file_validator.budget import ErrorBudget
+from fw_gear_file_validator.constraints import MAX_INDEX_KEYS, RowConstraints
+from fw_gear_file_validator.jsonstream import JsonStream, StreamingValidation
+from fw_gear_file_validator.records import MAX_LENGTH, ErrorRecord
+from fw_gear_file_validator.table import CsvTable
 
-from fw_gear_file_validator import utils
+if t.TYPE_CHECKING:
+    from jsonschema.exceptions import ValidationError
+
+    from fw_gear_file_validator.cache import SchemaCache
+    from fw_gear_file_validator.incremental import IncrementalValidation
+
+log = logging.getLogger(__name__)
 
 # We are not supporting array, object, or null.
 JSON_TYPES = {"string": str, "number": float, "integer": int, "boolean": bool}
+ENGINES = ["jsonschema", "columnar", "compiled"]
+
+
+def cast_csv_val(val: t.Any, cast_type: type):
+    """Attempt to cast a type.  Return original value if unsuccessful
+
+    Args:
+        val: the value to cast
+        cast_type: the type to cast it to
+
+    Returns:
+        cast_type(val) | val
+
+    """
+    try:
+        return cast_type(val)
+    except ValueError:
+        return val
 
 
 class JsonValidator:
     """Json Validator class."""
 
-    def __init__(self, schema: t.Union[dict, Path, str]):
+    def __init__(
+        self,
+        schema: t.Union[dict, Path, str],
+        cache: "SchemaCache" = None,
+        engine: str = "jsonschema",
+        max_value_length: int = MAX_LENGTH,
+        optimize: bool = True,
+    ):
+        """
+        Args:
+            schema: the validation JSON schema, or the path to it
+            cache: if given, the schema is compiled through (or retrieved from) this
+                cache instead of being used as is.
+            engine: "compiled" to validate with Python code generated for the schema
+                (see `compiler.SchemaCompiler`), jsonschema.Draft7Validator otherwise.
+            max_value_length: maximum length of the values, expected values and
+                messages of the errors (0 for no limit).
+            optimize: whether records are validated with an optimized version of
+                the schema (see `optimizer`), for the jsonschema engine.
+        """
+        self.max_value_length = max_value_length
         if isinstance(schema, str):
             schema = Path(schema)
         if isinstance(schema, Path):
             with open(schema, "r", encoding="UTF-8") as schema_instance:
                 schema = json.load(schema_instance)
-        self.validator = jsonschema.Draft7Validator(schema)
+        # jsonschema and the engines are only imported once a schema is validated,
+        # to keep the startup of the gear and the CLI short.
+        generate_code = engine == "compiled"
+        self.compiled = cache.get(schema, generate_code) if cache else None
+        if generate_code:
+            from fw_gear_file_validator.compiler import CompiledValidator
+
+            self.validator = (
+                self.compiled.generated_validator
+                if self.compiled
+                else CompiledValidator(schema)
+            )
+        elif self.compiled:
+            self.validator = self.compiled.validator
+        else:
+            import jsonschema
+
+            self.validator = jsonschema.Draft7Validator(schema)
+        # Records are validated with an optimized version of the schema, reporting
+        # the same errors as the schema as written (see `optimizer`).
+        self.optimized = None
+        if optimize and not generate_code:
+            from fw_gear_file_validator.optimizer import optimize
+
+            self.optimized = optimize(self.validator.schema)
+
+    def validate(
+        self, d: t.Union[dict, JsonStream], budget: t.Optional[ErrorBudget] = None
+    ) -> t.Tuple[bool, t.List[t.Dict]]:
+        """Validates the JSON document.
 
-    def validate(self, d: dict) -> t.Tuple[bool, t.List[t.Dict]]:
+        With a budget, validation stops once it is exhausted (see `budget`), and
+        only the first errors found are reported.
+        """
+        if budget is not None:
+            budget.start()
+        if isinstance(d, JsonStream):
+            return self.validate_stream(d, budget)
+        if budget is not None:
+            # The errors of the schema as written are found one at a time.
+            errors = self.handle_errors(budget.limit(self.validator.iter_errors(d)))
+            return not errors, errors
         valid, errors = self.process(d)
         return valid, errors
 
+    def validate_stream(
+        self, stream: JsonStream, budget: t.Optional[ErrorBudget] = None
+    ) -> t.Tuple[bool, t.List[t.Dict]]:
+        """Validates a JSON document read incrementally from a file.
+
+        Members of large objects and arrays are validated as they are read, and
+        discarded afterwards (see `jsonstream.StreamingValidation`).  With a budget,
+        the document is only read until it is exhausted.
+        """
+        with stream:
+            validation = StreamingValidation(self.validator, budget=budget)
+            errors = self.handle_errors(validation.iter_errors(stream))
+        valid = False if errors else True
+        return valid, errors
+
     def process(
         self, d: dict, reformat_error: bool = True
     ) -> t.Tuple[bool, t.List[t.Dict]]:
         """Validates a dict and returns a tuple of valid and formatted errors."""
-        errors = list(self.validator.iter_errors(d))
-        valid = False if errors else True
-        if errors and reformat_error:
+        if self.optimized is not None:
+            errors = self.optimized.iter_errors(d)
+        else:
+            errors = self.validator.iter_errors(d)
+        if reformat_error:
             errors = self.handle_errors(errors)
+        else:
+            errors = list(errors)
+        valid = False if errors else True
         return valid, errors
 
-    @staticmethod
-    def handle_errors(errors: list[ValidationError]) -> t.List[t.Dict]:
+    def handle_errors(
+        self, errors: t.Iterable[t.Union["ValidationError", ErrorRecord]]
+    ) -> t.List[ErrorRecord]:
         """Processes errors into a standard output format.
         A jsonschema error in python has the following data structure:
         {
@@ -68,6 +176,10 @@ class JsonValidator:
         Additionally, the value for location will be formatted as such:
         For JSON input file: { “key_path”: string }, with string being the JSON key
 
+        The errors are converted to ErrorRecords, which read like dicts of the above
+        items but only render the value, expected value and message when accessed, so
+        the ValidationErrors can be released right away.
+
         The flywheel relative items will be handled by a later function.
         They are omitted here to keep json validator flywheel client independent.
         These items are:
@@ -76,31 +188,44 @@ class JsonValidator:
 
         """
 
-        errors = sorted(errors, key=lambda e: e.path)
-
-        error_report = []
-        for error in errors:
-            error_report.append(
-                {
-                    "type": "error",  # For now, jsonValidaor can only produce errors.
-                    "code": str(error.validator),
-                    "location": {"key_path": ".".join(list(error.schema_path)[:-1])},
-                    "value": str(error.instance),
-                    "expected": str(error.schema),
-                    "message": error.message,
-                }
-            )
-        return error_report
+        records = [
+            error
+            if isinstance(error, ErrorRecord)
+            else ErrorRecord.from_error(error, self.max_value_length)
+            for error in errors
+        ]
+        records.sort(key=lambda record: record.path)
+        return records
 
 
 class CsvValidator(JsonValidator):
     """CSV Validator class."""
 
-    def __init__(self, schema: t.Union[dict, Path, str]):
-        super().__init__(schema)
+    # Whether CsvTables are validated column by column rather than row by row.
+    reads_columns = False
+
+    def __init__(
+        self,
+        schema: t.Union[dict, Path, str],
+        cache: "SchemaCache" = None,
+        engine: str = "jsonschema",
+        max_value_length: int = MAX_LENGTH,
+        optimize: bool = True,
+    ):
+        super().__init__(schema, cache, engine, max_value_length, optimize)
+        self.constraints = RowConstraints.from_schema(self.validator.schema)
+        # Set to reuse the errors of the chunks of rows validated in previous runs.
+        self.incremental: t.Optional["IncrementalValidation"] = None
 
     def get_column_dtypes(self):
         column_types = {}
+        if self.compiled:
+            for schema_property, json_type in self.compiled.column_types.items():
+                column_types[schema_property] = self.convert_json_types_to_python(
+                    json_type
+                )
+            return column_types
+
         schema = self.validator.schema
         for schema_property, property_val in schema["properties"].items():
             if "$ref" in property_val:
@@ -117,23 +242,84 @@ class CsvValidator(JsonValidator):
             )
         return JSON_TYPES.get(json_type, str)  # default to type str if not supported
 
-    def validate(self, csv_dict: t.List[t.Dict]) -> t.Tuple[bool, t.List[t.Dict]]:
-        csv_valid = True
-        csv_errors = []
+    def validate(
+        self, csv_dict: t.Iterable[t.Dict], budget: t.Optional[ErrorBudget] = None
+    ) -> t.Tuple[bool, t.List[t.Dict]]:
+        """Validates the csv rows.
+
+        The unique and foreign keys of the schema, if any, are checked as the rows are
+        read, and their errors reported after the errors of the rows (see
+        `constraints.RowConstraints`).  In incremental mode, only the rows of the
+        chunks not validated before are validated (see `incremental`).  With a
+        budget, the rows are read until it is exhausted (see `budget`).
+        """
+        limit = budget.limit if budget is not None else iter
+        if budget is not None:
+            budget.start()
+        if self.constraints is None:
+            csv_errors = list(
+                limit(self.iter_validate_rows(self._rows(csv_dict, budget)))
+            )
+        else:
+            with self.constraints.check(csv_dict, self.max_value_length) as check:
+                if isinstance(csv_dict, CsvTable):
+                    # Tables are read twice, so that the validator gets the table
+                    # itself rather than its rows.
+                    for _ in budget.rows(check) if budget is not None else check:
+                        pass
+                    rows = self._rows(csv_dict, budget)
+                else:
+                    rows = self._rows(check, budget)
+                csv_errors = list(limit(self.iter_validate_rows(rows)))
+                csv_errors.extend(limit(check.errors))
+        csv_valid = False if csv_errors else True
+        return csv_valid, csv_errors
+
+    def _rows(
+        self, csv_dict: t.Iterable[t.Dict], budget: t.Optional[ErrorBudget]
+    ) -> t.Iterable[t.Dict]:
+        if budget is None or (isinstance(csv_dict, CsvTable) and self.reads_columns):
+            return csv_dict
+        return budget.rows(csv_dict)
+
+    def iter_validate_rows(self, csv_dict: t.Iterable[t.Dict]) -> t.Iterator[t.Dict]:
+        """Validates the csv rows, incrementally if enabled."""
+        if self.incremental is None:
+            return self.iter_validate(csv_dict)
+        return self.incremental.iter_validate(self, csv_dict)
+
+    def iter_validate(
+        self, csv_dict: t.Iterable[t.Dict], start: int = 0
+    ) -> t.Iterator[t.Dict]:
+        """Validates the csv rows one at a time, yielding formatted errors as they occur.
+
+        Rows are consumed lazily, so when given a streaming iterator (see
+        `CsvLoader`) only the current row is held in memory, and the rows of a
+        `table.CsvTable` are only materialized one at a time.
+
+        Args:
+            csv_dict: the csv rows
+            start: index of the first row in the file, used for error locations
+                when validating a chunk of a larger file.
+        """
         column_types = self.get_column_dtypes()
         for (
             row_num,
             row_contents,
-        ) in enumerate(csv_dict):
+        ) in enumerate(csv_dict, start):
+            # Columns the schema doesn't declare are validated as read, e.g. against
+            # additionalProperties.
             cast_row = {
-                key: utils.cast_csv_val(value, column_types[key])
+                key: (
+                    cast_csv_val(value, column_types[key])
+                    if key in column_types
+                    else value
+                )
                 for key, value in row_contents.items()
             }
-            valid, errors = self.process(cast_row)
-            csv_valid = csv_valid & valid
+            _, errors = self.process(cast_row)
             self.add_csv_location_spec(row_num, errors)
-            csv_errors.extend(errors)
-        return csv_valid, csv_errors
+            yield from errors
 
     @staticmethod
     def add_csv_location_spec(row_num, row_errors):
@@ -144,25 +330,167 @@ class CsvValidator(JsonValidator):
             error["location"] = {"line": row_num + 1, "column_name": col_name}
 
 
+class NdjsonValidator(JsonValidator):
+    """JSON Lines (NDJSON) Validator class.
+
+    Each line of the file is a record validated on its own against the schema.
+    """
+
+    def validate(
+        self, lines: t.Iterable[str], budget: t.Optional[ErrorBudget] = None
+    ) -> t.Tuple[bool, t.List[t.Dict]]:
+        if budget is None:
+            errors = list(self.iter_validate(lines))
+        else:
+            budget.start()
+            errors = list(budget.limit(self.iter_validate(budget.rows(lines))))
+        valid = False if errors else True
+        return valid, errors
+
+    def iter_validate(
+        self, lines: t.Iterable[str], start: int = 0
+    ) -> t.Iterator[t.Dict]:
+        """Validates the lines one at a time, yielding formatted errors as they occur.
+
+        Blank lines are skipped, and lines that are not valid JSON are reported with
+        a "JSONDecodeError" code.
+
+        Args:
+            lines: the lines of the file
+            start: index of the first line in the file, used for error locations
+                when validating a chunk of a larger file.
+        """
+        for line_num, line in enumerate(lines, start):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                errors = [self.decode_error(line, e)]
+            else:
+                _, errors = self.process(record)
+            self.add_ndjson_location_spec(line_num, errors)
+            yield from errors
+
+    def decode_error(self, line: str, error: json.JSONDecodeError) -> ErrorRecord:
+        return ErrorRecord(
+            "JSONDecodeError",
+            (),
+            (),
+            line.rstrip("\r\n"),
+            None,
+            f"Line is not valid JSON: {error}",
+            self.max_value_length,
+        )
+
+    @staticmethod
+    def add_ndjson_location_spec(line_num, line_errors):
+        for error in line_errors:
+            key_path = error["location"]["key_path"]
+            error["location"] = {"line": line_num + 1, "key_path": key_path}
+
+
 def initialize_validator(
-    file_type: str, schema: t.Union[dict, Path, str]
-) -> t.Union[JsonValidator, CsvValidator]:
+    file_type: str,
+    schema: t.Union[dict, Path, str],
+    config: t.Dict[str, t.Any] = None,
+) -> t.Union[JsonValidator, CsvValidator, NdjsonValidator]:
     """Initialize the validator.
 
     In the future we may implement a recursive subclass factory (or something),
-    but for two validators the code does not require that complexity.
+    but for a few validators the code does not require that complexity.
 
     Args:
-        file_type: the type of file we're validating
+        file_type: the type of file we're validating, "flywheel" for the JSON
+            representation of Flywheel objects
         schema: the validation JSON schema file.
+        config: validator options, e.g. the validation "engine" to use
+            ("jsonschema", "compiled" or "columnar", the latter only for csv
+            files), the number of "workers" validating csv and ndjson files (0 for
+            all available CPUs) and the "max_value_length" of the error fields.
+            With "optimize" false, records are validated with the schema as
+            written rather than its optimized version (see `optimizer`).
+            The files referenced by the foreign keys of csv schemas are relative to
+            "reference_dir", and their indexes hold up to "max_index_keys" keys in
+            memory (0 for no limit) before being spilled to disk.  With
+            "incremental", csv files only validate the chunks of rows not validated
+            in a previous run (see `incremental`).
+            Compiled schemas are cached in memory, and in "cache_dir" if provided.
 
     Returns:
-        JsonValidator | CsvValidator
+        JsonValidator | CsvValidator | NdjsonValidator
 
     """
-    if file_type == "json":
-        return JsonValidator(schema)
+    from fw_gear_file_validator.cache import get_schema_cache
+
+    config = config or {}
+    engine = config.get("engine") or "jsonschema"
+    if engine not in ENGINES:
+        raise ValueError("validation engine " + engine + " Not supported")
+    cache = get_schema_cache(config.get("cache_dir"))
+    max_value_length = config.get("max_value_length", MAX_LENGTH)
+    optimize = config.get("optimize", True)
+
+    if file_type in ("json", "flywheel"):
+        if engine == "columnar":
+            log.warning("The columnar engine only supports csv files, using jsonschema")
+        return JsonValidator(schema, cache, engine, max_value_length, optimize)
+    elif file_type == "ndjson":
+        if engine == "columnar":
+            log.warning("The columnar engine only supports csv files, using jsonschema")
+            engine = "jsonschema"
+        workers = config.get("workers", 1)
+        if workers != 1:
+            from fw_gear_file_validator.parallel import ParallelNdjsonValidator
+
+            return ParallelNdjsonValidator(
+                schema,
+                engine=engine,
+                workers=workers,
+                cache=cache,
+                max_value_length=max_value_length,
+                optimize=optimize,
+            )
+        return NdjsonValidator(schema, cache, engine, max_value_length, optimize)
     elif file_type == "csv":
-        return CsvValidator(schema)
+        workers = config.get("workers", 1)
+        if workers != 1:
+            from fw_gear_file_validator.parallel import ParallelCsvValidator
+
+            csv_validator = ParallelCsvValidator(
+                schema,
+                engine=engine,
+                workers=workers,
+                cache=cache,
+                max_value_length=max_value_length,
+                optimize=optimize,
+            )
+        elif engine == "columnar":
+            from fw_gear_file_validator.columnar import ColumnarCsvValidator
+
+            csv_validator = ColumnarCsvValidator(
+                schema, cache, max_value_length, optimize
+            )
+        else:
+            csv_validator = CsvValidator(
+                schema, cache, engine, max_value_length, optimize
+            )
+        if config.get("incremental"):
+            from fw_gear_file_validator.incremental import (
+                ChunkStore,
+                IncrementalValidation,
+            )
+
+            if config.get("cache_dir"):
+                store = ChunkStore(config["cache_dir"])
+                csv_validator.incremental = IncrementalValidation(store)
+            else:
+                log.warning("Incremental validation requires a cache_dir, ignoring it")
+        if csv_validator.constraints:
+            csv_validator.constraints.reference_dir = config.get("reference_dir")
+            csv_validator.constraints.max_keys = config.get(
+                "max_index_keys", MAX_INDEX_KEYS
+            )
+        return csv_validator
     else:
         raise ValueError("file type " + file_type + " Not supported")
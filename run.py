@@ -5,10 +5,17 @@ import logging
 from flywheel_gear_toolkit import GearToolkitContext
 
 from fw_gear_file_validator import validator
+from fw_gear_file_validator.budget import ErrorBudget
 from fw_gear_file_validator.errors import (add_flywheel_location_to_errors,
                                            save_errors_metadata)
+from fw_gear_file_validator.jsonstream import JsonStream
 from fw_gear_file_validator.loader import Loader
-from fw_gear_file_validator.parser import parse_config
+from fw_gear_file_validator.parser import parse_batch_config, parse_config
+from fw_gear_file_validator.results import (ResultCache, cache_result,
+                                            file_hash, gear_result_key,
+                                            object_hash, reusable_key,
+                                            reuse_result)
+from fw_gear_file_validator.timing import StageTimer, profile
 from fw_gear_file_validator.utils import add_tags_metadata, get_loader_type
 
 log = logging.getLogger(__name__)
@@ -16,20 +23,120 @@ log = logging.getLogger(__name__)
 
 def main(context: GearToolkitContext) -> None:  # pragma: no cover
     """Parses gear config, runs main algorithm, and performs flywheel-specific actions."""
+    profile_dir = context.output_dir if context.config.get("profile") else None
+    with profile(profile_dir):
+        if context.config.get("batch"):
+            main_batch(context)
+        else:
+            main_file(context)
 
-    (debug, tag, schema_file_path, fw_ref, loader_config) = parse_config(context)
+
+def main_file(context: GearToolkitContext) -> None:  # pragma: no cover
+    """Validates the input file."""
+    # Tracing memory allocations is slow, only do it when profiling.
+    timer = StageTimer(trace_memory=bool(context.config.get("profile")))
+    with timer.span("parse_config"):
+        (
+            debug,
+            tag,
+            schema_file_path,
+            fw_ref,
+            loader_config,
+            validator_config,
+        ) = parse_config(context)
 
     loader_type = get_loader_type(fw_ref)
-    loader = Loader.factory(loader_type, config=loader_config)
-    d = loader.load_object(fw_ref.loc)
-    schema = loader.load_schema(schema_file_path)
+    with timer.span("load_schema"):
+        schema = Loader.load_schema(schema_file_path)
+
+    # Results are only reused when the content validated hasn't changed: the bytes
+    # of the file, hashed before loading it, or the Flywheel object once loaded.
+    use_results = context.config.get("result_cache", True)
+    cache_dir = validator_config.get("cache_dir")
+    results = ResultCache(cache_dir) if use_results and cache_dir else None
+    key = None
+    if use_results and fw_ref.contents == "file":
+        with timer.span("hash_input"):
+            key = gear_result_key(
+                context, schema, file_hash(fw_ref.loc), fw_ref, validator_config,
+                loader_config.get("streaming"),
+            )
+        if reuse_result(context, fw_ref, key, results, tag, timer):
+            return
+
+    with timer.span("load"):
+        loader = Loader.factory(
+            loader_type, config={**loader_config, "schema": schema}
+        )
+        d = loader.load_object(fw_ref.loc)
+
+    if use_results and fw_ref.contents == "flywheel":
+        with timer.span("hash_input"):
+            key = gear_result_key(
+                context, schema, object_hash(d), fw_ref, validator_config,
+                loader_config.get("streaming"),
+            )
+        if reuse_result(context, fw_ref, key, results, tag, timer):
+            return
+
+    with timer.span("init_validator"):
+        schema_validator = validator.initialize_validator(
+            loader_type, schema, validator_config
+        )
+    budget = ErrorBudget.from_config(validator_config)
+    with timer.span("validate"):
+        valid, errors = schema_validator.validate(d, budget)
+    partial = budget.reason if budget is not None else None
+    if partial:
+        log.warning(
+            f"Validation stopped early ({partial}), reporting the first "
+            f"{len(errors)} errors"
+        )
+        valid = False
+    # Documents streamed to fit in the memory budget have their values elided.
+    streamed = isinstance(d, JsonStream) and not loader_config.get("streaming")
+    key = reusable_key(key, partial, streamed)
+    with timer.span("locate_errors"):
+        errors = add_flywheel_location_to_errors(fw_ref, errors)
+
+    with timer.span("save_errors"):
+        timings = {"stages": timer.summary(), "api": fw_ref.client.stats}
+        state, meta_dict = save_errors_metadata(
+            errors, fw_ref, context, timings=timings, result_key=key, partial=partial
+        )
+        cache_result(results, key, state, meta_dict, context.output_dir)
+    with timer.span("tags"):
+        add_tags_metadata(context, fw_ref, valid, tag)
+
+    log.info("Time spent by stage:")
+    timer.log()
+    log.info(f"Flywheel API usage: {fw_ref.client.stats}")
+
+
+def main_batch(context: GearToolkitContext) -> None:  # pragma: no cover
+    """Validates all the files of the destination container."""
+    from fw_gear_file_validator.batch import BatchValidator
 
-    schema_validator = validator.initialize_validator(loader_type, schema)
-    valid, errors = schema_validator.validate(d)
-    errors = add_flywheel_location_to_errors(fw_ref, errors)
+    (
+        debug,
+        tag,
+        schema_file_path,
+        destination,
+        validation_level,
+        loader_config,
+        validator_config,
+    ) = parse_batch_config(context)
 
-    save_errors_metadata(errors, fw_ref, context)
-    add_tags_metadata(context, fw_ref, valid, tag)
+    schema = Loader.load_schema(schema_file_path)
+    batch_validator = BatchValidator(
+        context, schema, validation_level, tag, loader_config, validator_config
+    )
+    states = batch_validator.run(destination["type"], destination["id"])
+    log.info(f"Validated the files of {destination['type']} {destination['id']}")
+    log.info(f"Files by state: {dict(states)}")
+    log.info("Time spent by stage, over all files:")
+    batch_validator.timer.log()
+    log.info(f"Flywheel API usage: {batch_validator.client.stats}")
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -1,3 +1,6 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -5,6 +8,7 @@ import pytest
 from flywheel import Acquisition, FileEntry, Group, Project, Session, Subject
 
 from fw_gear_file_validator import utils
+from fw_gear_file_validator.client import CachingClient
 
 PARENT_ORDER = utils.PARENT_ORDER
 FwReference = utils.FwReference
@@ -14,6 +18,49 @@ BASE_DIR = BASE_DIR / "tests"
 test_config = BASE_DIR / "assets" / "config.json"
 
 
+class FakeClient:
+    """Flywheel client serving containers from memory, with a fixed latency."""
+
+    def __init__(self, containers: dict, latency: float = 0.0):
+        self.containers = containers
+        self.latency = latency
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _get(self, level, container_id):
+        with self._lock:
+            self.calls.append((level, container_id))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            return self.containers[level]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def __getattr__(self, name):
+        if not name.startswith("get_"):
+            raise AttributeError(name)
+        level = name[len("get_") :]
+        return lambda container_id: self._get(level, container_id)
+
+
+def make_hierarchy():
+    parents = {
+        level: f"{level}_id"
+        for level in PARENT_ORDER
+        if level not in ("analysis", "file")
+    }
+    containers = {level: {"label": level, "id": f"{level}_id"} for level in parents}
+    containers["file"] = FileEntry(
+        name="file.csv", file_id="file_id", type="tabular data", parents=parents
+    )
+    return containers
+
+
 def test_is_valid():
     with pytest.raises(ValueError):
         ref = FwReference(type="file", parents={})
@@ -100,3 +147,66 @@ def test_get_lookup_path():
 
     url = f"fw://{group.label}"
     assert fw_ref.get_lookup_path(level="group") == url
+
+
+def test_hierarchy_objects_fetched_concurrently():
+    containers = make_hierarchy()
+    client = FakeClient(containers, latency=0.2)
+    ref = FwReference.init_from_gear_input(client, containers["file"])
+
+    start = time.monotonic()
+    hierarchy = ref.hierarchy_objects
+    elapsed = time.monotonic() - start
+
+    assert list(hierarchy) == [
+        "group",
+        "project",
+        "subject",
+        "session",
+        "acquisition",
+        "file",
+    ]
+    assert hierarchy == containers
+    # 6 levels, fetched 4 at a time.
+    assert client.max_in_flight == utils.MAX_CONCURRENT_REQUESTS
+    assert elapsed < 3 * 0.2
+
+
+def test_caching_client_coalesces_calls():
+    containers = make_hierarchy()
+    fake_client = FakeClient(containers, latency=0.2)
+    client = CachingClient(fake_client)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(client.get_session, ["session_id"] * 4))
+    assert all(result is containers["session"] for result in results)
+    assert client.get_session("other_id") is containers["session"]
+    assert fake_client.calls == [("session", "session_id"), ("session", "other_id")]
+
+    stats = client.stats
+    assert stats["api_calls"] == 2
+    assert stats["cache_hits"] == 3
+    assert stats["calls_by_method"] == {"get_session": 2}
+    assert stats["api_time"] >= 0.4
+    assert client.latency == 0.2
+
+
+def test_caching_client_does_not_cache_failures():
+    fake_client = FakeClient({})
+    client = CachingClient(fake_client)
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            client.get_file("file_id")
+    assert len(fake_client.calls) == 2
+
+
+def test_fw_reference_fetches_containers_once():
+    containers = make_hierarchy()
+    fake_client = FakeClient(containers)
+    gear_input = {"object": {"file_id": "file_id"}}
+    ref = FwReference.init_from_gear_input(fake_client, gear_input)
+    _ = ref.hierarchy_objects
+    _ = ref.fw_object
+    _ = ref.get_lookup_path()
+    assert sorted(fake_client.calls) == sorted(
+        (level, container_id) for level, container_id in ref.ref.items()
+    )
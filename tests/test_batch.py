@@ -0,0 +1,158 @@
+import gzip
+import json
+import shutil
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from flywheel import ContainerReference, FileEntry, FileOutput
+
+from fw_gear_file_validator import batch
+from fw_gear_file_validator.parallel import ParallelCsvValidator
+from tests.test_FwReference import FakeClient, make_hierarchy
+
+ASSETS_DIR = Path(__file__).resolve().parent / "assets"
+SCHEMA = json.loads((ASSETS_DIR / "test_schema_csv.json").read_text())
+
+
+class BatchClient(FakeClient):
+    """FakeClient listing, downloading and tagging the files of a session."""
+
+    def __init__(self, files: dict, **kwargs):
+        super().__init__(make_hierarchy(), **kwargs)
+        self.files = files
+        self.pages = []
+        self.tags = {}
+        parents = dict(self.containers["file"].parents)
+        self.outputs = [
+            FileOutput(
+                name=name,
+                file_id=f"{name}_id",
+                mimetype="",
+                parents=parents,
+                parent_ref=ContainerReference(id="acquisition_id", type="acquisition"),
+                tags=["test-PASS"],
+            )
+            for name in files
+        ]
+
+    def get_all_files(self, filter, limit, after_id=None):
+        self.pages.append((filter, after_id))
+        ids = [output.file_id for output in self.outputs]
+        start = ids.index(after_id) + 1 if after_id else 0
+        return self.outputs[start : start + limit]
+
+    def get_file(self, file_id):
+        self._get("file", file_id)
+        output = next(o for o in self.outputs if o.file_id == file_id)
+        return FileEntry(
+            name=output.name,
+            file_id=file_id,
+            parents=output.parents,
+            tags=output.tags,
+        )
+
+    def download_file_from_container(self, container_id, file_name, dest_file):
+        shutil.copy(self.files[file_name], dest_file)
+
+    def add_file_tags(self, file_id, body):
+        self.tags.setdefault(file_id, set()).update(body)
+
+    def delete_file_tags(self, file_id, body):
+        self.tags.setdefault(file_id, set()).update(f"-{tag}" for tag in body)
+
+
+def test_iter_files_paginates():
+    client = BatchClient({f"{i}.csv": None for i in range(5)})
+    files = list(batch.iter_files(client, "session", "session_id", page_size=2))
+    assert [f.name for f in files] == [f"{i}.csv" for i in range(5)]
+    assert client.pages == [
+        ("parents.session=session_id", None),
+        ("parents.session=session_id", "1.csv_id"),
+        ("parents.session=session_id", "3.csv_id"),
+    ]
+
+
+def test_batch_validator(tmp_path):
+    invalid_json = tmp_path / "invalid.json"
+    invalid_json.write_text("{")
+    client = BatchClient(
+        {
+            "valid.csv": ASSETS_DIR / "test_input_valid.csv",
+            "invalid.csv": ASSETS_DIR / "test_input_invalid.csv",
+            "invalid2.csv": ASSETS_DIR / "test_input_invalid.csv",
+            "notes.txt": ASSETS_DIR / "test_input_valid.csv",
+            "invalid.json": invalid_json,
+        }
+    )
+    context = MagicMock()
+    context.client = client
+    context.output_dir = tmp_path
+    batch_validator = batch.BatchValidator(
+        context,
+        SCHEMA,
+        "file",
+        "test",
+        validator_config={"workers": 0},
+        batch_size=2,
+    )
+
+    states = batch_validator.run("session", "session_id")
+
+    assert states == {"PASS": 1, "FAIL": 2, "SKIPPED": 2}
+    assert client.tags == {
+        "valid.csv_id": {"test-PASS"},
+        "invalid.csv_id": {"test-FAIL", "-test-PASS"},
+        "invalid2.csv_id": {"test-FAIL", "-test-PASS"},
+    }
+    qc_results = {
+        call.args[0].name: call.kwargs
+        for call in context.metadata.add_qc_result_via_sdk.call_args_list
+    }
+    assert qc_results["valid.csv"] == {"state": "PASS"}
+    assert qc_results["invalid.csv"]["error_count"] == 1
+    errors_file = tmp_path / qc_results["invalid.csv"]["errors_file"]
+    with gzip.open(errors_file, "rt") as fp:
+        error = json.loads(fp.readline())
+    assert error["flywheel_path"] == (
+        "fw://group/project/subject/session/acquisition/invalid.csv"
+    )
+
+    # Parent containers are fetched once for all the files.
+    levels = [level for level, _ in client.calls if level != "file"]
+    assert sorted(levels) == sorted(set(levels))
+    # The same validator is used for all the csv files.
+    assert list(batch_validator._validators) == ["csv", "json"]
+    # The files are validated in threads, not each in its own process pool.
+    assert not isinstance(batch_validator._validators["csv"], ParallelCsvValidator)
+
+
+def test_batch_validator_broken_file(tmp_path):
+    client = BatchClient(
+        {
+            "broken.csv": None,
+            "valid.csv": ASSETS_DIR / "test_input_valid.csv",
+            "invalid.csv": ASSETS_DIR / "test_input_invalid.csv",
+        }
+    )
+    download = client.download_file_from_container
+
+    def failing_download(container_id, file_name, dest_file):
+        if file_name == "broken.csv":
+            raise OSError("download failed")
+        download(container_id, file_name, dest_file)
+
+    client.download_file_from_container = failing_download
+    context = MagicMock()
+    context.client = client
+    context.output_dir = tmp_path
+    batch_validator = batch.BatchValidator(
+        context, SCHEMA, "file", "test", validator_config={"workers": 1}
+    )
+
+    states = batch_validator.run("session", "session_id")
+
+    assert states == {"PASS": 1, "FAIL": 1, "SKIPPED": 1}
+    assert client.tags == {
+        "valid.csv_id": {"test-PASS"},
+        "invalid.csv_id": {"test-FAIL", "-test-PASS"},
+    }
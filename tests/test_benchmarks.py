@@ -0,0 +1,88 @@
+import io
+import json
+
+import jsonschema
+
+from benchmarks import data, startup, suite
+
+
+def test_data_generators_are_reproducible():
+    assert list(data.csv_rows(5, seed=1)) == list(data.csv_rows(5, seed=1))
+    assert list(data.csv_rows(5, seed=1)) != list(data.csv_rows(5, seed=2))
+
+    validator = jsonschema.Draft7Validator(data.json_schema(3, use_refs=True))
+    assert validator.is_valid(data.json_document(3, 3))
+    assert not validator.is_valid(data.json_document(3, 3, error_rate=0.5))
+
+
+def test_suite_reports_regressions(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    benchmarks = [b for b in suite.csv_benchmarks(100) if "clean" in b.name]
+    results = suite.run(benchmarks, repeat=1, log=io.StringIO())
+    assert [r.name for r in results] == [
+        "csv_validate[clean,jsonschema,100]",
+        "csv_validate[clean,compiled,100]",
+        "csv_validate[clean,columnar,100]",
+    ]
+    assert suite.find_regressions(results, {}, 0.25) == []
+
+    slow = {r.name: {"seconds": r.seconds, "peak_mb": r.peak_mb} for r in results}
+    slow[results[0].name]["seconds"] = results[0].seconds / 10 - 1
+    regressions = suite.find_regressions(results, slow, 0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("csv_validate[clean,jsonschema,100]: seconds")
+
+    assert suite.main(["--rows", "100", "-k", "csv_load", "--save", str(baseline)]) == 0
+    assert list(json.loads(baseline.read_text())) == ["csv_load[100]"]
+    assert (
+        suite.main(["--rows", "100", "-k", "csv_load", "--baseline", str(baseline)])
+        == 0
+    )
+
+
+def test_startup_import_times():
+    output = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |     json.decoder",
+            "import time:       300 |        420 |   json",
+            "import time:        80 |        500 | fw_gear_file_validator.schema",
+            "some warning",
+        ]
+    )
+    assert startup.parse_import_times(output) == [
+        startup.ImportTime("json.decoder", 120, 120, 2),
+        startup.ImportTime("json", 300, 420, 1),
+        startup.ImportTime("fw_gear_file_validator.schema", 80, 500, 0),
+    ]
+
+    names = [i.name for i in startup.import_times("fw_gear_file_validator.loader")]
+    assert "fw_gear_file_validator.loader" in names
+    assert "jsonschema" not in names
+
+    (benchmark,) = [b for b in suite.startup_benchmarks() if b.name == "startup[run]"]
+    assert suite.run([benchmark], repeat=1, log=io.StringIO())[0].seconds > 0
+
+
+def test_run_imports():
+    names = {i.name for i in startup.import_times("run")}
+    # Modules every run needs to load its input and validate it.
+    assert {
+        "fw_gear_file_validator.parser",
+        "fw_gear_file_validator.validator",
+        "fw_gear_file_validator.loader",
+    } <= names
+    # Modules only used by some runs are imported when they are needed.
+    deferred = {
+        "concurrent.futures",
+        "cProfile",
+        "tracemalloc",
+        "sqlite3",
+        "fw_gear_file_validator.cache",
+        "fw_gear_file_validator.compiler",
+        "fw_gear_file_validator.optimizer",
+        "fw_gear_file_validator.parallel",
+        "fw_gear_file_validator.columnar",
+        "fw_gear_file_validator.incremental",
+    }
+    assert not deferred & names
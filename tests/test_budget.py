@@ -0,0 +1,171 @@
+import json
+
+import pytest
+
+from fw_gear_file_validator import budget as budget_module
+from fw_gear_file_validator import errors, validator
+from fw_gear_file_validator.budget import ErrorBudget
+from fw_gear_file_validator.loader import JsonLoader
+from fw_gear_file_validator.table import CsvTable
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"id": {"type": "integer"}, "age": {"type": "integer"}},
+}
+
+
+def iter_rows(n_rows, read):
+    """Yields rows with an error on every row, counting them in read."""
+    for index in range(n_rows):
+        read.append(index)
+        yield {"id": str(index), "age": "x"}
+
+
+def test_from_config():
+    assert ErrorBudget.from_config({}) is None
+    assert ErrorBudget.from_config({"max_errors": 0, "deadline": 0}) is None
+    assert ErrorBudget.from_config({"fail_fast": True}).fail_fast
+    assert ErrorBudget.from_config({"deadline": 2.5}).deadline == 2.5
+
+
+def test_limit():
+    budget = ErrorBudget(max_errors=3)
+    budget.start()
+    assert list(budget.limit(range(3))) == [0, 1, 2]
+    assert not budget.partial
+
+    budget.start()
+    assert list(budget.limit(range(10))) == [0, 1, 2]
+    assert budget.reason == "max_errors"
+
+
+@pytest.mark.parametrize("engine", ["jsonschema", "compiled", "columnar"])
+def test_csv_max_errors(engine):
+    csv_validator = validator.initialize_validator("csv", SCHEMA, {"engine": engine})
+    read = []
+    budget = ErrorBudget(max_errors=5)
+    valid, csv_errors = csv_validator.validate(iter_rows(100000, read), budget)
+
+    assert not valid
+    assert [e["location"]["line"] for e in csv_errors] == [1, 2, 3, 4, 5]
+    assert budget.reason == "max_errors"
+    assert len(read) < 100000
+
+
+def test_csv_table_max_errors():
+    table = CsvTable.from_rows(iter_rows(1000, []))
+    csv_validator = validator.initialize_validator(
+        "csv", {**SCHEMA, "uniqueKeys": [["age"]]}, {"engine": "columnar"}
+    )
+    budget = ErrorBudget(max_errors=3)
+    _, csv_errors = csv_validator.validate(table, budget)
+    assert [e["code"] for e in csv_errors] == ["type"] * 3
+    assert budget.reason == "max_errors"
+
+    # The budget is reset by each validation.
+    _, csv_errors = csv_validator.validate(table[:2], budget)
+    assert [e["code"] for e in csv_errors] == ["type", "type", "uniqueKeys"]
+    assert not budget.partial
+
+
+def test_ndjson_fail_fast():
+    lines = [json.dumps({"id": index, "age": "x"}) for index in range(10)]
+    ndjson_validator = validator.initialize_validator("ndjson", SCHEMA)
+    budget = ErrorBudget(fail_fast=True)
+    valid, ndjson_errors = ndjson_validator.validate(iter(lines), budget)
+    assert not valid
+    assert [e["location"]["line"] for e in ndjson_errors] == [1]
+    assert budget.reason == "fail_fast"
+
+
+def test_json_max_errors():
+    schema = {"type": "object", "additionalProperties": {"type": "integer"}}
+    document = {f"key{index}": "x" for index in range(10)}
+    json_validator = validator.initialize_validator("json", schema)
+    budget = ErrorBudget(max_errors=2)
+    valid, json_errors = json_validator.validate(document, budget)
+    assert not valid
+    assert len(json_errors) == 2
+    assert budget.reason == "max_errors"
+
+
+def test_deadline(monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(budget_module.time, "monotonic", lambda: next(clock))
+    rows = [{"id": str(index), "age": str(index)} for index in range(100)]
+    csv_validator = validator.initialize_validator("csv", SCHEMA)
+    budget = ErrorBudget(deadline=10)
+    read = []
+    valid, csv_errors = csv_validator.validate(
+        (read.append(row) or row for row in rows), budget
+    )
+    # No error was found, but the validation stopped before the end.
+    assert valid and not csv_errors
+    assert budget.reason == "deadline"
+    assert len(read) == 10
+
+
+def test_partial_qc_result(tmp_path):
+    path = tmp_path / "errors.ndjson.gz"
+    assert errors.qc_result([], path, "deadline") == (
+        "FAIL",
+        {"error_count": 0, "partial": "deadline"},
+    )
+    record = {"code": "type", "location": {"line": 1}, "value": "x", "message": "m"}
+    state, data = errors.qc_result([record], path, "max_errors")
+    assert state == "FAIL"
+    assert data["error_count"] == 1
+    assert data["partial"] == "max_errors"
+
+
+def write_document(path, n_members):
+    with open(path, "w") as fp:
+        fp.write("{")
+        fp.write(",".join(f'"key{index}": "x"' for index in range(n_members)))
+        fp.write("}")
+
+
+@pytest.mark.parametrize(
+    "budget, reason, n_errors",
+    [
+        (ErrorBudget(fail_fast=True), "fail_fast", 1),
+        (ErrorBudget(max_errors=3), "max_errors", 3),
+    ],
+)
+def test_streamed_json_stops_early(tmp_path, monkeypatch, budget, reason, n_errors):
+    path = tmp_path / "large.json"
+    write_document(path, 10000)
+    schema = {"type": "object", "additionalProperties": {"type": "integer"}}
+    json_validator = validator.initialize_validator("json", schema)
+    stream = JsonLoader({"streaming": True}).load_object(path)
+    read = []
+    read_value = stream.read_value
+    monkeypatch.setattr(stream, "read_value", lambda: read.append(1) or read_value())
+
+    valid, json_errors = json_validator.validate(stream, budget)
+    assert not valid
+    assert [e["code"] for e in json_errors] == ["type"] * n_errors
+    assert budget.reason == reason
+    # The rest of the document is not read.
+    assert len(read) < 100
+
+
+def test_streamed_json_deadline(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(budget_module.time, "monotonic", lambda: next(clock))
+    path = tmp_path / "large.json"
+    write_document(path, 10000)
+    schema = {"type": "object", "additionalProperties": {"type": "integer"}}
+    json_validator = validator.initialize_validator("json", schema)
+    budget = ErrorBudget(deadline=10)
+    stream = JsonLoader({"streaming": True}).load_object(path)
+    read = []
+    read_value = stream.read_value
+    monkeypatch.setattr(stream, "read_value", lambda: read.append(1) or read_value())
+
+    valid, json_errors = json_validator.validate(stream, budget)
+    # The errors found before the deadline are reported.
+    assert not valid
+    assert 0 < len(json_errors) < 10
+    assert budget.reason == "deadline"
+    assert len(read) < 100
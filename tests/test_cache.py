@@ -0,0 +1,66 @@
+import json
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.cache import SchemaCache, get_schema_cache, schema_hash
+
+SCHEMA = {
+    "definitions": {"code": {"type": "string", "pattern": "^[A-Z]+$"}},
+    "properties": {"code": {"$ref": "#/definitions/code"}, "n": {"type": "integer"}},
+}
+
+
+def test_schema_hash():
+    reordered = {
+        "properties": SCHEMA["properties"],
+        "definitions": SCHEMA["definitions"],
+    }
+    assert schema_hash(SCHEMA) == schema_hash(reordered)
+    assert schema_hash(SCHEMA) != schema_hash({**SCHEMA, "required": ["n"]})
+
+
+def test_schema_cache_in_memory():
+    cache = SchemaCache(max_entries=2)
+    compiled = cache.get(SCHEMA)
+    assert cache.get(json.loads(json.dumps(SCHEMA))) is compiled
+    assert compiled.schema is SCHEMA
+    assert compiled.dereferenced["properties"]["code"]["pattern"] == "^[A-Z]+$"
+    assert compiled.column_types == {"code": "string", "n": "integer"}
+    assert compiled.patterns["^[A-Z]+$"].search("ABC")
+
+    cache.get({"properties": {"a": {}}})
+    cache.get({"properties": {"b": {}}})
+    assert cache.get(SCHEMA) is not compiled
+
+
+def test_schema_cache_on_disk(tmp_path):
+    compiled = SchemaCache(tmp_path).get(SCHEMA)
+    entry = tmp_path / "schemas" / f"{compiled.key}.json"
+    assert entry.exists()
+
+    loaded = SchemaCache(tmp_path).get(SCHEMA)
+    assert loaded is not compiled
+    assert loaded.dereferenced == compiled.dereferenced
+    assert loaded.column_types == compiled.column_types
+
+    # Corrupted entries are discarded and recompiled
+    entry.write_text("{not json")
+    assert SchemaCache(tmp_path).get(SCHEMA).column_types == compiled.column_types
+    assert json.loads(entry.read_text())["key"] == compiled.key
+
+
+def test_schema_cache_eviction(tmp_path):
+    cache = SchemaCache(tmp_path, max_entries=2)
+    for i in range(4):
+        cache.get({"properties": {str(i): {}}})
+    assert len(list((tmp_path / "schemas").glob("*.json"))) == 2
+
+
+def test_cached_csv_validator(tmp_path):
+    csv_validator = validator.initialize_validator(
+        "csv", SCHEMA, {"cache_dir": tmp_path}
+    )
+    assert csv_validator.compiled is get_schema_cache(tmp_path).get(SCHEMA)
+    assert csv_validator.get_column_dtypes() == {"code": str, "n": int}
+    valid, errors = csv_validator.validate([{"code": "abc", "n": "1"}])
+    assert not valid
+    assert errors[0]["code"] == "pattern"
@@ -0,0 +1,114 @@
+import gzip
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from fw_gear_file_validator import cli
+from fw_gear_file_validator.loader import CsvLoader
+
+ASSETS_DIR = Path(__file__).resolve().parent / "assets"
+SCHEMA = ASSETS_DIR / "test_schema_csv.json"
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name in ["test_input_valid.csv", "test_input_invalid.csv"]:
+        (tmp_path / "sub").mkdir(exist_ok=True)
+        (tmp_path / "sub" / name).write_text((ASSETS_DIR / name).read_text())
+    (tmp_path / "notes.txt").write_text("not validated")
+    (tmp_path / "broken.json").write_text("{")
+    gz_path = tmp_path / "sub" / "test_input_valid.csv.gz"
+    gz_path.write_bytes(
+        gzip.compress((ASSETS_DIR / "test_input_valid.csv").read_bytes())
+    )
+    return tmp_path
+
+
+def test_iter_paths(data_dir):
+    assert [p.relative_to(data_dir) for p in cli.iter_paths([data_dir])] == [
+        Path("broken.json"),
+        Path("sub/test_input_invalid.csv"),
+        Path("sub/test_input_valid.csv"),
+        Path("sub/test_input_valid.csv.gz"),
+    ]
+    paths = cli.iter_paths([data_dir], patterns=["*.txt", "*_valid.csv"])
+    assert [p.name for p in paths] == ["notes.txt", "test_input_valid.csv"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cli(data_dir, tmp_path, workers):
+    output = tmp_path / "results.ndjson"
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(f"# extra files\n{data_dir / 'notes.txt'}\n")
+    argv = [str(SCHEMA), str(data_dir), "--manifest", str(manifest)]
+    argv += ["--output", str(output), "--workers", str(workers)]
+
+    assert cli.main(argv) == 1
+
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(Path(r["path"]).name, r["valid"]) for r in results] == [
+        ("broken.json", False),
+        ("test_input_invalid.csv", False),
+        ("test_input_valid.csv", True),
+        ("test_input_valid.csv.gz", True),
+        ("notes.txt", False),
+    ]
+    assert results[0]["error"].startswith("Error loading JSON object")
+    assert results[1]["error_count"] == 1
+    assert results[1]["errors"][0]["location"] == {"line": 2, "column_name": "Col2"}
+    assert "not supported" in results[4]["error"]
+
+
+def test_cli_unexpected_error(data_dir, tmp_path, monkeypatch):
+    load_object = CsvLoader.load_object
+
+    def failing_load_object(self, path):
+        if path.name == "test_input_invalid.csv":
+            raise RuntimeError("unexpected")
+        return load_object(self, path)
+
+    monkeypatch.setattr(CsvLoader, "load_object", failing_load_object)
+    output = tmp_path / "results.ndjson"
+    argv = [str(SCHEMA), str(data_dir / "sub"), "--output", str(output)]
+    argv += ["--workers", "1"]
+
+    assert cli.main(argv) == 1
+
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(Path(r["path"]).name, r["valid"]) for r in results] == [
+        ("test_input_invalid.csv", False),
+        ("test_input_valid.csv", True),
+        ("test_input_valid.csv.gz", True),
+    ]
+    assert results[0]["error"] == "RuntimeError: unexpected"
+
+
+def test_cli_fail_fast(data_dir, tmp_path):
+    output = tmp_path / "results.ndjson"
+    path = data_dir / "sub" / "test_input_invalid.csv"
+    argv = [str(SCHEMA), str(path), "--fail-fast", "--output", str(output)]
+
+    assert cli.main(argv) == 1
+
+    (result,) = [json.loads(line) for line in output.read_text().splitlines()]
+    assert result["valid"] is False
+    assert result["partial"] == "fail_fast"
+    assert result["error_count"] == 1
+
+
+@pytest.mark.parametrize(
+    "module", ["cli", "loader", "validator", "errors", "utils", "parser"]
+)
+def test_imports_are_deferred(module):
+    code = (
+        f"import sys; from fw_gear_file_validator import {module}; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} & "
+        "{'flywheel', 'flywheel_gear_toolkit', 'jsonschema', 'sqlite3'}))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == "[]"
@@ -0,0 +1,79 @@
+import csv
+import random
+from pathlib import Path
+
+import pytest
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.columnar import ColumnarCsvValidator, cast_column
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BASE_DIR = BASE_DIR / "tests"
+csv_schema = BASE_DIR / "assets" / "test_schema_csv.json"
+
+SCHEMA = {
+    "type": "object",
+    "required": ["name", "score", "count", "flag", "code", "missing"],
+    "definitions": {"score": {"type": "number", "minimum": 0, "maximum": 10}},
+    "properties": {
+        "name": {"type": "string", "minLength": 2, "maxLength": 5},
+        "score": {"$ref": "#/definitions/score"},
+        "count": {"type": "integer", "exclusiveMinimum": 0, "exclusiveMaximum": 9},
+        "flag": {"type": "boolean", "const": True},
+        "code": {"type": "string", "pattern": "^[A-C][0-9]$", "enum": ["A1", "B2"]},
+        "level": {"type": "integer", "enum": [1, 2, 3]},
+        "other": {"type": "string", "anyOf": [{"maxLength": 2}, {"minLength": 4}]},
+    },
+}
+
+
+def random_rows(n_rows):
+    rng = random.Random(42)
+    choices = {
+        "name": ["a", "ab", "abcde", "abcdef", ""],
+        "score": ["1", "-1", "11", "5.5", "x", "10"],
+        "count": ["0", "1", "9", "4", "1.5", "y"],
+        "flag": ["True", "", "False"],
+        "code": ["A1", "B2", "C3", "Z9", "a1"],
+        "level": ["1", "2", "4", "1.0", "z"],
+        "other": ["ab", "abc", "abcd"],
+    }
+    return [{k: rng.choice(v) for k, v in choices.items()} for _ in range(n_rows)]
+
+
+def test_cast_column():
+    assert cast_column(["1", "2"], float) == ([1.0, 2.0], True)
+    assert cast_column(["1", "a"], int) == ([1, "a"], False)
+    assert cast_column(["a", "b"], str) == (["a", "b"], True)
+
+
+def test_columnar_matches_jsonschema():
+    rows = random_rows(500)
+    expected = validator.CsvValidator(SCHEMA).validate(rows)
+
+    columnar = ColumnarCsvValidator(SCHEMA)
+    columnar.block_size = 64
+    assert "other" in columnar.fallback_columns
+    assert not columnar.row_fallback
+    assert columnar.validate(iter(rows)) == expected
+
+
+def test_columnar_root_fallback():
+    schema = {**SCHEMA, "additionalProperties": False}
+    rows = random_rows(50)
+    columnar = ColumnarCsvValidator(schema)
+    assert columnar.row_fallback
+    assert columnar.validate(rows) == validator.CsvValidator(schema).validate(rows)
+
+
+@pytest.mark.parametrize("csv_name", ["test_input_valid.csv", "test_input_invalid.csv"])
+def test_columnar_csv_files(csv_name):
+    csv_validator = validator.initialize_validator(
+        "csv", csv_schema, {"engine": "columnar"}
+    )
+    assert isinstance(csv_validator, ColumnarCsvValidator)
+    with open(BASE_DIR / "assets" / csv_name) as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert csv_validator.validate(rows) == validator.CsvValidator(csv_schema).validate(
+        rows
+    )
@@ -0,0 +1,150 @@
+import json
+
+import jsonschema
+import pytest
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.cache import SchemaCache
+from fw_gear_file_validator.compiler import (
+    CompiledValidator,
+    SchemaCompiler,
+    _equal,
+)
+from tests.test_columnar import SCHEMA, random_rows
+
+TREE = {
+    "definitions": {
+        "node": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "minLength": 1},
+                "children": {"type": "array", "items": {"$ref": "#/definitions/node"}},
+            },
+            "required": ["name"],
+            "additionalProperties": False,
+        }
+    },
+    "$ref": "#/definitions/node",
+}
+
+SCHEMAS = [
+    SCHEMA,
+    TREE,
+    {
+        "type": "object",
+        "properties": {
+            "a": {"anyOf": [{"type": "integer"}, {"type": "string", "maxLength": 0}]},
+            "b": {"type": "array", "items": [{"type": "number"}, {"const": 1}]},
+            "c": {"enum": [1, "x", None], "type": ["integer", "string", "null"]},
+            "d": {"oneOf": [{"multipleOf": 3}, {"multipleOf": 5}]},
+            "e": {"type": "array", "uniqueItems": True, "minItems": 2},
+            "f": {"type": "object", "patternProperties": {"^x": {"type": "integer"}}},
+            "g": False,
+            "h": {"anyOf": [False, {"type": "string"}], "allOf": [False]},
+            "i": {"type": "array", "items": [True, False]},
+        },
+        "additionalProperties": True,
+    },
+    {"$id": "http://example.com/root", "items": {"$id": "item", "type": "string"}},
+    True,
+    False,
+]
+
+INSTANCES = [
+    {},
+    {"name": ""},
+    {"name": "root", "children": [{"name": 1}, {"children": [{}]}, {"other": 0}]},
+    {"a": 1.0, "b": [True, 2], "c": False, "d": 15, "e": [1, 1], "f": {"x": "1"}},
+    {
+        "a": "abc",
+        "b": ["1"],
+        "c": 1,
+        "d": 4,
+        "e": [1, True],
+        "g": None,
+        "h": 1,
+        "i": [0, 1],
+    },
+    ["a", 1, None],
+    "a string",
+    *random_rows(50),
+]
+
+
+def error_details(errors):
+    return [
+        (e.message, e.validator, list(e.path), list(e.schema_path), e.schema)
+        for e in errors
+    ]
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_compiled_validator_matches_jsonschema(schema):
+    expected = jsonschema.Draft7Validator(schema)
+    compiled = CompiledValidator(schema)
+    for instance in INSTANCES:
+        assert error_details(compiled.iter_errors(instance)) == error_details(
+            expected.iter_errors(instance)
+        )
+
+
+def test_compiled_validator_generated_code():
+    source = SchemaCompiler({"properties": {"n": {"maximum": 5}}}).generate()
+    assert "instance > 5" in source
+    assert "_fallback(" not in source
+
+    source = SchemaCompiler({"properties": {"n": {"multipleOf": 5}}}).generate()
+    assert "_fallback(" in source
+
+
+def test_compiled_validator_reuses_source():
+    source = SchemaCompiler(TREE).generate()
+    compiled = CompiledValidator(json.loads(json.dumps(TREE)), source)
+    assert compiled.source == source
+    assert not list(compiled.iter_errors({"name": "root", "children": []}))
+
+
+def test_compiled_engine(tmp_path):
+    config = {"engine": "compiled", "cache_dir": tmp_path}
+    json_validator = validator.initialize_validator("json", TREE, config)
+    assert isinstance(json_validator.validator, CompiledValidator)
+    valid, errors = json_validator.validate({"name": ""})
+    assert not valid
+    assert errors[0]["code"] == "minLength"
+
+    csv_validator = validator.initialize_validator(
+        "csv", SCHEMA, {**config, "workers": 1}
+    )
+    rows = random_rows(200)
+    assert csv_validator.validate(rows) == validator.CsvValidator(SCHEMA).validate(rows)
+
+    # The generated code is not saved, and is generated again by other processes.
+    loaded = SchemaCache(tmp_path).get(SCHEMA)
+    entry = tmp_path / "schemas" / f"{loaded.key}.json"
+    assert "source" not in json.loads(entry.read_text())
+    assert loaded.source is None
+    assert SchemaCache(tmp_path).get(SCHEMA, generate_code=True).source == (
+        csv_validator.compiled.source
+    )
+
+
+@pytest.mark.parametrize(
+    "one, two, expected",
+    [
+        (True, 1, False),
+        (False, 0, False),
+        (1, 1.0, True),
+        (True, True, True),
+        ([1, True], [1, True], True),
+        ([1, True], [True, 1], False),
+        ({"a": [0]}, {"a": [False]}, False),
+        ({"a": [0]}, {"a": [0.0]}, True),
+        ({"a": 1}, {"b": 1}, False),
+        ("1", 1, False),
+    ],
+)
+def test_equal(one, two, expected):
+    assert _equal(one, two) is expected
+    assert _equal(two, one) is expected
+    schema = {"const": one, "enum": [one]}
+    assert not list(CompiledValidator(schema).iter_errors(two)) is expected
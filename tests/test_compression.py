@@ -0,0 +1,80 @@
+import bz2
+import gzip
+import lzma
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from fw_gear_file_validator import compression
+from fw_gear_file_validator.parser import get_ext, identify_file_type
+
+ASSETS_DIR = Path(__file__).resolve().parent / "assets"
+CSV_PATH = ASSETS_DIR / "test_input_valid.csv"
+
+
+def compress(path: Path, name: str, tmp_path: Path) -> Path:
+    """Writes the file compressed according to the extension of name."""
+    content = path.read_bytes()
+    target = tmp_path / name
+    if name.endswith(".gz"):
+        target.write_bytes(gzip.compress(content))
+    elif name.endswith(".bz2"):
+        target.write_bytes(bz2.compress(content))
+    elif name.endswith(".xz"):
+        target.write_bytes(lzma.compress(content))
+    elif name.endswith(".zip"):
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(path.name, content)
+    else:
+        target.write_bytes(content)
+    return target
+
+
+@pytest.mark.parametrize(
+    "name", ["data.csv", "data.csv.gz", "data.csv.bz2", "data.csv.xz", "data.zip"]
+)
+def test_open_text(name, tmp_path):
+    path = compress(CSV_PATH, name, tmp_path)
+    with compression.open_text(path, newline="") as fp:
+        assert fp.read() == CSV_PATH.read_text()
+    assert compression.uncompressed_size(path) >= len(CSV_PATH.read_bytes())
+    assert compression.content_extension(path) == ".csv"
+
+
+def test_content_extension(tmp_path):
+    assert compression.content_extension("my.data.CSV.GZ") == ".csv"
+    assert compression.content_extension("data.json.zip") == ".json"
+    assert compression.content_extension("data.gz") == ""
+    assert compression.content_extension("data") == ""
+    # Zip archives named without the extension of their file are read if they exist.
+    assert compression.content_extension("missing.zip") == ""
+    assert (
+        compression.content_extension(compress(CSV_PATH, "d.zip", tmp_path)) == ".csv"
+    )
+
+    assert identify_file_type(get_ext("data.csv.gz")) == "csv"
+    assert identify_file_type(get_ext("data.json.xz")) == "json"
+
+
+def test_uncompressed_size(tmp_path):
+    assert compression.uncompressed_size(compress(CSV_PATH, "d.csv.gz", tmp_path)) == (
+        CSV_PATH.stat().st_size
+    )
+    assert compression.uncompressed_size(compress(CSV_PATH, "d.zip", tmp_path)) == (
+        CSV_PATH.stat().st_size
+    )
+    path = compress(CSV_PATH, "d.csv.xz", tmp_path)
+    assert compression.uncompressed_size(path) == (
+        path.stat().st_size * compression.DEFAULT_COMPRESSION_RATIO
+    )
+
+
+def test_zip_with_several_files(tmp_path):
+    path = tmp_path / "data.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("a.csv", "a\n1\n")
+        archive.writestr("b.csv", "a\n2\n")
+    with pytest.raises(ValueError, match="Expected a single file"):
+        compression.open_text(path)
+    assert compression.content_extension(path) == ""
@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+
+import pytest
+
+from fw_gear_file_validator import constraints, validator
+from fw_gear_file_validator.constraints import KeyIndex, RowConstraints
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "subject_id": {"type": "string"},
+        "session_id": {"type": "string"},
+        "age": {"type": "integer"},
+    },
+    "uniqueKeys": [["subject_id", "session_id"]],
+    "foreignKeys": [
+        {
+            "columns": ["session_id"],
+            "reference": {"file": "sessions.csv", "columns": ["id"]},
+        }
+    ],
+}
+ROWS = [
+    {"subject_id": "s1", "session_id": "a", "age": "10"},
+    {"subject_id": "s1", "session_id": "b", "age": "ten"},
+    {"subject_id": "s1", "session_id": "a", "age": "12"},
+    {"subject_id": "s2", "session_id": "c", "age": "13"},
+    {"subject_id": "s3", "session_id": "", "age": "14"},
+]
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    (tmp_path / "sessions.csv").write_text("id,label\na,A\nb,B\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"engine": "columnar"},
+        {"engine": "compiled", "workers": 2},
+        {"max_index_keys": 1},
+    ],
+)
+def test_constraints(reference_dir, config):
+    csv_validator = validator.initialize_validator(
+        "csv", SCHEMA, {"reference_dir": reference_dir, **config}
+    )
+    valid, errors = csv_validator.validate(iter(ROWS))
+
+    assert not valid
+    assert [(e["code"], e["location"]) for e in errors] == [
+        ("type", {"line": 2, "column_name": "age"}),
+        ("uniqueKeys", {"line": 3, "column_name": "subject_id,session_id"}),
+        ("foreignKeys", {"line": 4, "column_name": "session_id"}),
+    ]
+    assert errors[1]["message"] == (
+        "Duplicate key subject_id='s1', session_id='a', first found on line 1"
+    )
+    assert errors[1]["value"] == "{'subject_id': 's1', 'session_id': 'a'}"
+    assert errors[2]["message"] == "Key session_id='c' not found in sessions.csv"
+
+
+@pytest.mark.parametrize("name", ["sessions.json", "sessions.ndjson"])
+def test_json_references(tmp_path, name):
+    records = [{"id": 1}, {"id": "b"}, {"other": 3}]
+    if name.endswith(".ndjson"):
+        content = "\n".join(json.dumps(record) for record in records) + "\n"
+    else:
+        content = json.dumps(records)
+    (tmp_path / name).write_text(content)
+    schema = {
+        "type": "object",
+        "properties": {"id": {"type": "string"}},
+        "foreignKeys": [
+            {"columns": ["id"], "reference": {"file": str(tmp_path / name)}}
+        ],
+    }
+    rows = csv.DictReader(io.StringIO("id\n1\nb\n3\n"))
+    valid, errors = validator.CsvValidator(schema).validate(rows)
+    assert [e["location"]["line"] for e in errors] == [3]
+
+
+@pytest.mark.parametrize("name", ["sessions.csv", "sessions.json", "sessions.ndjson"])
+def test_missing_reference_file(tmp_path, name):
+    reference = {"file": name, "columns": ["id"]}
+    schema = {
+        **SCHEMA,
+        "foreignKeys": [{"columns": ["session_id"], "reference": reference}],
+    }
+    csv_validator = validator.initialize_validator(
+        "csv", schema, {"reference_dir": tmp_path}
+    )
+    with pytest.raises(ValueError, match=f"Reference file .*{name} .* can't be read"):
+        csv_validator.validate(iter(ROWS))
+
+
+@pytest.mark.parametrize(
+    "declaration",
+    [
+        {"uniqueKeys": "subject_id"},
+        {"uniqueKeys": [[]]},
+        {"foreignKeys": [{"columns": ["a"]}]},
+        {
+            "foreignKeys": [
+                {
+                    "columns": ["a"],
+                    "reference": {"file": "f.csv", "columns": ["a", "b"]},
+                }
+            ]
+        },
+    ],
+)
+def test_invalid_declarations(declaration):
+    with pytest.raises(ValueError):
+        RowConstraints.from_schema({"type": "object", **declaration})
+
+
+def test_key_index_spills_to_disk(tmp_path):
+    with KeyIndex(max_keys=2, spill_dir=tmp_path) as index:
+        assert index.setdefault(("a",), 1) == 1
+        assert index.setdefault(("b",), 2) == 2
+        assert not index.spilled
+        assert index.setdefault(("c",), 3) == 3
+        assert index.spilled
+        assert len(list(tmp_path.iterdir())) == 1
+        assert index.setdefault(("a",), 4) == 1
+        assert index.setdefault(("d",), 5) == 5
+        assert ("d",) in index and ("e",) not in index
+    assert not list(tmp_path.iterdir())
+
+
+def test_key_value():
+    assert constraints.get_key({"a": 1, "b": "x"}, ["a", "b"]) == ("1", "x")
+    assert constraints.get_key({"a": True}, ["a"]) == ("true",)
+    assert constraints.get_key({"a": ""}, ["a"]) is None
+    assert constraints.get_key({}, ["a"]) is None
@@ -1,3 +1,5 @@
+import gzip
+import json
 import tempfile
 from pathlib import Path
 from unittest.mock import MagicMock
@@ -5,14 +7,28 @@ from unittest.mock import MagicMock
 import flywheel
 
 from fw_gear_file_validator import errors, utils
+from fw_gear_file_validator.validator import initialize_validator
+from tests.test_FwReference import FakeClient, make_hierarchy
 
 BASE_DIR = d = Path(__file__).resolve().parents[1]
 test_config = BASE_DIR / "tests" / "assets" / "config.json"
 
 
-def test_save_errors_metadata():
-    error_dict = [{"key1": "k1v1", "key2": "k2v1"}, {"key1": "k1v2", "key2": "k2v2"}]
+def test_save_errors_metadata(tmp_path):
+    error_dict = [
+        {
+            "type": "error",
+            "code": "maximum",
+            "location": {"line": line, "column_name": "Col2"},
+            "value": str(line * 10),
+            "expected": "{'type': 'integer', 'maximum': 5}",
+            "message": f"{line * 10} is greater than the maximum of 5",
+        }
+        for line in range(1, 8)
+    ]
+    error_dict.append({**error_dict[0], "code": "type"})
     context = MagicMock()
+    context.output_dir = tmp_path
     file_name = "test_file_name.ext"
     file_id = "test_container_id"
     file_type = "test_file_type"
@@ -27,6 +43,83 @@ def test_save_errors_metadata():
     fw_ref = utils.FwReference.init_from_gear_input(mock_client, file, "file")
 
     errors.save_errors_metadata(error_dict, fw_ref, context)
+    summary = [
+        {
+            "code": "maximum",
+            "location": {"column_name": "Col2"},
+            "count": 7,
+            "message": "10 is greater than the maximum of 5",
+            "samples": [
+                {"location": {"line": line, "column_name": "Col2"}, "value": f"{line}0"}
+                for line in range(1, 6)
+            ],
+        },
+        {
+            "code": "type",
+            "location": {"column_name": "Col2"},
+            "count": 1,
+            "message": "10 is greater than the maximum of 5",
+            "samples": [
+                {"location": {"line": 1, "column_name": "Col2"}, "value": "10"}
+            ],
+        },
+    ]
     context.metadata.add_qc_result.assert_called_with(
-        file_name, "validation", state="FAIL", data=error_dict
+        file_name,
+        "validation",
+        state="FAIL",
+        data=summary,
+        error_count=8,
+        errors_file="test_file_name.ext.errors.ndjson.gz",
     )
+    with gzip.open(tmp_path / "test_file_name.ext.errors.ndjson.gz", "rt") as fp:
+        assert [json.loads(line) for line in fp] == error_dict
+
+    errors.save_errors_metadata([], fw_ref, context)
+    context.metadata.add_qc_result.assert_called_with(
+        file_name, "validation", state="PASS"
+    )
+
+    timings = {"stages": {"validate": {"seconds": 0.1, "calls": 1}}}
+    errors.save_errors_metadata([], fw_ref, context, timings=timings)
+    context.metadata.add_qc_result.assert_called_with(
+        file_name, "validation", state="PASS", timings=timings
+    )
+
+    result = errors.save_errors_metadata([], fw_ref, context, result_key="abc")
+    assert result == ("PASS", {"result_key": "abc"})
+    context.metadata.add_qc_result.assert_called_with(
+        file_name, "validation", state="PASS", result_key="abc"
+    )
+
+
+def test_add_flywheel_location_to_flywheel_errors():
+    client = FakeClient(make_hierarchy())
+    fw_ref = utils.FwReference.init_from_gear_input(
+        client, {"object": {"file_id": "file_id"}}, "flywheel"
+    )
+    json_validator = initialize_validator(
+        "flywheel",
+        {"properties": {"session": {"required": ["age"]}}, "required": ["file"]},
+    )
+    valid, error_list = json_validator.validate({"session": {}})
+    assert not valid
+
+    located = errors.add_flywheel_location_to_errors(fw_ref, error_list)
+    assert [(e["code"], e["flywheel_path"], e["container_id"]) for e in located] == [
+        (
+            "required",
+            "fw://group/project/subject/session/acquisition/file.csv",
+            "file_id",
+        ),
+        ("required", "fw://group/project/subject/session", "session_id"),
+    ]
+
+    # Errors rendered as dicts, e.g. read back from an errors file, are located the
+    # same way.
+    rendered = [
+        {k: v for k, v in e.items() if k not in ("flywheel_path", "container_id")}
+        for e in error_list
+    ]
+    located_dicts = errors.add_flywheel_location_to_errors(fw_ref, rendered)
+    assert [e["container_id"] for e in located_dicts] == ["file_id", "session_id"]
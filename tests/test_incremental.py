@@ -0,0 +1,108 @@
+import logging
+
+import pytest
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.incremental import (
+    ChunkStore,
+    IncrementalValidation,
+    iter_chunks,
+)
+from fw_gear_file_validator.table import CsvTable
+from tests.test_columnar import SCHEMA, random_rows
+
+CHUNK_SIZES = {"min_rows": 8, "max_rows": 64, "mask": 0xF}
+
+
+def incremental_validator(cache_dir, config=None):
+    csv_validator = validator.initialize_validator(
+        "csv", SCHEMA, {"incremental": True, "cache_dir": cache_dir, **(config or {})}
+    )
+    csv_validator.incremental = IncrementalValidation(
+        csv_validator.incremental.store, **CHUNK_SIZES
+    )
+    return csv_validator
+
+
+def test_chunks_are_content_defined():
+    rows = random_rows(1000)
+    chunks = list(iter_chunks(rows, **CHUNK_SIZES))
+    assert [row for _, chunk, _ in chunks for row in chunk] == rows
+    assert [start for start, _, _ in chunks][:2] == [0, len(chunks[0][1])]
+    assert all(8 <= len(chunk) <= 64 for _, chunk, _ in chunks[:-1])
+
+    # Inserting a row only changes the chunk holding it, and maybe the next one.
+    inserted = rows[:500] + [{**rows[0], "name": "new"}] + rows[500:]
+    digests = {digest for _, _, digest in chunks}
+    new_digests = [digest for _, _, digest in iter_chunks(inserted, **CHUNK_SIZES)]
+    assert len([digest for digest in new_digests if digest not in digests]) <= 2
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{}, {"engine": "columnar"}, {"engine": "compiled", "workers": 2}],
+)
+def test_incremental_matches_full_validation(tmp_path, config):
+    rows = random_rows(400)
+    csv_validator = incremental_validator(tmp_path, config)
+    assert csv_validator.validate(iter(rows)) == validator.CsvValidator(
+        SCHEMA
+    ).validate(rows)
+    assert csv_validator.incremental.validated_rows == 400
+
+    changed = rows[:200] + [{**rows[200], "count": "x"}] + rows[201:]
+    versions = [
+        rows,
+        rows + random_rows(50),
+        changed,
+        rows[:100] + rows[110:],
+    ]
+    for version in versions:
+        expected = validator.CsvValidator(SCHEMA).validate(version)
+        assert csv_validator.validate(iter(version)) == expected
+        assert csv_validator.incremental.reused_rows >= 300
+
+
+def test_incremental_tables(tmp_path):
+    rows = random_rows(300)
+    csv_validator = incremental_validator(tmp_path, {"engine": "columnar"})
+    expected = validator.CsvValidator(SCHEMA).validate(rows)
+    assert csv_validator.validate(CsvTable.from_rows(rows)) == expected
+    assert csv_validator.validate(CsvTable.from_rows(rows)) == expected
+    assert csv_validator.incremental.reused_rows == 300
+
+
+def test_incremental_constraints(tmp_path):
+    schema = {**SCHEMA, "uniqueKeys": [["name", "count"]]}
+    rows = random_rows(200)
+    expected = validator.CsvValidator(schema).validate(rows)
+    csv_validator = validator.initialize_validator(
+        "csv", schema, {"incremental": True, "cache_dir": tmp_path}
+    )
+    for _ in range(2):
+        valid, errors = csv_validator.validate(iter(rows))
+        assert (valid, errors) == expected
+        assert errors[-1]["code"] == "uniqueKeys"
+
+
+def test_chunk_store_evicts_least_recently_used(tmp_path):
+    store = ChunkStore(tmp_path, max_chunks=2)
+    db = store.connect()
+    for key in ["a", "b", "c"]:
+        store.put(db, key, [{"location": {"line": 1}}])
+    db.execute("UPDATE chunks SET used = 0 WHERE key = 'b'")
+    store.touch(db, ["a"])
+    store.evict(db)
+    assert store.get(db, "a") == [{"location": {"line": 1}}]
+    assert store.get(db, "b") is None
+    assert store.get(db, "c") is not None
+    db.close()
+
+
+def test_incremental_requires_cache_dir(caplog):
+    with caplog.at_level(logging.WARNING):
+        csv_validator = validator.initialize_validator(
+            "csv", SCHEMA, {"incremental": True}
+        )
+    assert csv_validator.incremental is None
+    assert "requires a cache_dir" in caplog.text
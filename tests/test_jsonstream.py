@@ -0,0 +1,105 @@
+import io
+import json
+import random
+
+import pytest
+
+from fw_gear_file_validator.jsonstream import JsonStream, StreamingValidation
+from fw_gear_file_validator.validator import JsonValidator
+
+SCHEMA = {
+    "definitions": {
+        "record": {
+            "type": "object",
+            "required": ["id"],
+            "properties": {
+                "id": {"type": "integer", "minimum": 0},
+                "name": {"type": "string", "maxLength": 3},
+            },
+            "additionalProperties": False,
+        }
+    },
+    "type": "object",
+    "required": ["records", "meta"],
+    "properties": {
+        "records": {
+            "type": "array",
+            "maxItems": 5,
+            "items": {"$ref": "#/definitions/record"},
+        },
+        "meta": {"enum": [1, 2]},
+        "forbidden": False,
+    },
+    "patternProperties": {"^x": {"type": "string"}, "^r": {"type": "array"}},
+    "additionalProperties": {"type": "number"},
+}
+
+
+def random_value(depth=0):
+    choice = random.random()
+    if depth > 3 or choice < 0.4:
+        return random.choice([1, -2, 1.5e3, "ab", "abcdef", None, True, 10**30, '"}'])
+    if choice < 0.7:
+        keys = ["id", "name", "records", "meta", "forbidden", "xa", "ra", "q", "zz"]
+        return {k: random_value(depth + 1) for k in random.sample(keys, 4)}
+    return [random_value(depth + 1) for _ in range(random.randint(0, 7))]
+
+
+def stream(document, chunk_size=3):
+    return JsonStream(io.StringIO(json.dumps(document, indent=1)), chunk_size)
+
+
+def test_json_stream_reads_members():
+    document = {"a": [1, -2.5e-3, 'x"]', {"b": None}], "c": {}, "d": []}
+    reader = stream(document, chunk_size=1)
+    values = {}
+    for key in reader.iter_object():
+        if key == "a":
+            values[key] = [reader.read_value() for _ in reader.iter_array()]
+        else:
+            values[key] = reader.read_value()
+    reader.check_end()
+    assert values == document
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a" 1}', "[1, 2,]", "[1] [2]"])
+def test_json_stream_invalid_document(text):
+    validator = JsonValidator({"items": {"type": "integer"}})
+    with pytest.raises(ValueError, match="Error loading JSON object"):
+        validator.validate(JsonStream(io.StringIO(text), chunk_size=2))
+
+
+@pytest.mark.parametrize("max_depth", [1, 2, 10])
+def test_streaming_validation_matches_full_validation(max_depth):
+    random.seed(max_depth)
+    validator = JsonValidator(SCHEMA)
+    for _ in range(200):
+        document = random_value()
+        if isinstance(document, dict):
+            document["records"] = [random_value(1) for _ in range(6)]
+        expected = list(validator.validator.iter_errors(document))
+        errors = StreamingValidation(validator.validator, max_depth).iter_errors(
+            stream(document)
+        )
+        streamed = validator.handle_errors(list(errors))
+        assert len(streamed) == len(expected)
+        for error, expected_error in zip(streamed, validator.handle_errors(expected)):
+            assert error["location"] == expected_error["location"]
+            assert error["code"] == expected_error["code"]
+            assert error["expected"] == expected_error["expected"]
+            if "..." not in error["value"]:
+                assert error == expected_error
+
+
+def test_validate_stream_elides_streamed_containers():
+    validator = JsonValidator(SCHEMA)
+    document = {"records": [{"id": -1}, {"id": 1, "name": "long"}]}
+    valid, errors = validator.validate(stream(document))
+    assert not valid
+    assert [error["location"]["key_path"] for error in errors] == [
+        "",
+        "properties.records.items.properties.id",
+        "properties.records.items.properties.name",
+    ]
+    assert errors[0]["message"] == "'meta' is a required property"
+    assert errors[0]["value"] == "{'records': ...}"
@@ -1,9 +1,30 @@
+import gc
 import json
+import subprocess
+import sys
+import types
+import warnings
 from pathlib import Path
 from unittest.mock import MagicMock
 
-from fw_gear_file_validator.loader import FwLoader
+import pytest
+from flywheel import Session, Subject
+
+from fw_gear_file_validator import loader as loader_module
+from fw_gear_file_validator import memory
+from fw_gear_file_validator.jsonstream import JsonStream
+from fw_gear_file_validator.loader import (
+    CsvLoader,
+    FwLoader,
+    JsonLoader,
+    Loader,
+    NdjsonLoader,
+)
+from fw_gear_file_validator.memory import MemoryBudgetError
+from fw_gear_file_validator.table import CsvTable
 from fw_gear_file_validator.utils import FwReference
+from tests.test_compression import compress
+from tests.test_FwReference import FakeClient, make_hierarchy
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 BASE_DIR = BASE_DIR / "tests"
@@ -66,3 +87,191 @@ def test_loader_init():
     validation_dict = loader.load_object(fw_reference.loc)
 
     client2.get_file.assert_called()
+
+
+def test_csv_loader_streaming():
+    csv_path = BASE_DIR / "assets" / "test_input_valid.csv"
+
+    loader = Loader.factory("csv", config={"streaming": False})
+    rows = loader.load_object(csv_path)
+    assert isinstance(rows, CsvTable)
+    assert len(rows) == 2
+    assert rows[0] == {"Col1": "row1_val1", "Col2": "1", "Col3": "row1_val3"}
+
+    loader = Loader.factory("csv", config={"streaming": True})
+    rows = loader.load_object(csv_path)
+    assert isinstance(rows, types.GeneratorType)
+    assert next(rows) == {"Col1": "row1_val1", "Col2": "1", "Col3": "row1_val3"}
+    assert len(list(rows)) == 1
+
+
+def test_csv_loader_missing_file():
+    loader = CsvLoader({"streaming": True})
+    with pytest.raises(ValueError):
+        loader.load_object(BASE_DIR / "assets" / "does_not_exist.csv")
+
+
+def test_json_loader_streaming():
+    json_path = BASE_DIR / "assets" / "test_input_valid.json"
+
+    loader = Loader.factory("json", config={"streaming": False})
+    assert loader.load_object(json_path)["string"] == "hello"
+
+    loader = Loader.factory("json", config={"streaming": True})
+    with loader.load_object(json_path) as stream:
+        assert isinstance(stream, JsonStream)
+        assert stream.read_value()["string"] == "hello"
+
+    with pytest.raises(ValueError):
+        JsonLoader({"streaming": True}).load_object(BASE_DIR / "does_not_exist.json")
+
+
+def test_fw_loader_projection():
+    containers = make_hierarchy()
+    containers["session"] = Session(label="session", age=1, info={"big": "blob"})
+    containers["subject"] = Subject(label="subject", sex="female")
+    client = FakeClient(containers)
+    fw_reference = FwReference.init_from_gear_input(
+        client, {"object": {"file_id": "file_id"}}, "flywheel"
+    )
+    client.calls.clear()
+    schema = {
+        "properties": {
+            "session": {"properties": {"age": {"maximum": 0}, "info": True}},
+            "subject": {"properties": {"sex": {"const": "male"}}},
+        },
+        "required": ["file"],
+    }
+    loader = FwLoader(config={"add_parents": True, "schema": schema})
+    validation_dict = loader.load_object(fw_reference.loc)
+
+    assert validation_dict == {
+        "subject": {"sex": "female"},
+        "session": {"age": 1, "info": {"big": "blob"}},
+        "file": {},
+    }
+    # The file is only required to exist, and other levels are not referenced.
+    assert sorted(client.calls) == [
+        ("session", "session_id"),
+        ("subject", "subject_id"),
+    ]
+
+    loader = FwLoader(config={"add_parents": False, "schema": schema})
+    assert loader.load_object(fw_reference.loc) == {"file": {}}
+
+    schema["additionalProperties"] = False
+    loader = FwLoader(config={"add_parents": True, "schema": schema})
+    assert list(loader.load_object(fw_reference.loc)) == list(fw_reference.ref)
+
+
+def test_memory_budget(tmp_path):
+    csv_path = BASE_DIR / "assets" / "test_input_valid.csv"
+    json_path = BASE_DIR / "assets" / "test_input_valid.json"
+    # Budgets below the current memory usage never fit.
+    budget = memory.current_rss_mb() / 2
+
+    assert isinstance(
+        CsvLoader({"memory_budget": None}).load_object(csv_path), CsvTable
+    )
+    rows = CsvLoader({"memory_budget": budget}).load_object(csv_path)
+    assert isinstance(rows, types.GeneratorType)
+    assert len(list(rows)) == 2
+
+    stream = JsonLoader({"memory_budget": budget}).load_object(json_path)
+    with stream:
+        assert isinstance(stream, JsonStream)
+    large_budget = budget * 4
+    assert isinstance(
+        JsonLoader({"memory_budget": large_budget}).load_object(json_path), dict
+    )
+
+    class InMemoryLoader(JsonLoader):
+        streamable = False
+
+    with pytest.raises(MemoryBudgetError, match="more than the .* MB memory budget"):
+        InMemoryLoader({"memory_budget": budget}).load_object(json_path)
+
+    class InMemoryCsvLoader(CsvLoader):
+        streamable = False
+
+    # The file isn't opened when it doesn't fit in the budget.
+    with warnings.catch_warnings(record=True) as recorded:
+        warnings.simplefilter("always", ResourceWarning)
+        with pytest.raises(MemoryBudgetError):
+            InMemoryCsvLoader({"memory_budget": budget}).load_object(csv_path)
+        gc.collect()
+    assert not [w for w in recorded if issubclass(w.category, ResourceWarning)]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz", ".zip"])
+def test_compressed_files(tmp_path, suffix, streaming):
+    csv_path = compress(
+        BASE_DIR / "assets" / "test_input_valid.csv", "data.csv" + suffix, tmp_path
+    )
+    rows = CsvLoader({"streaming": streaming}).load_object(csv_path)
+    assert list(rows)[0] == {"Col1": "row1_val1", "Col2": "1", "Col3": "row1_val3"}
+
+    json_path = compress(
+        BASE_DIR / "assets" / "test_input_valid.json", "data.json" + suffix, tmp_path
+    )
+    content = JsonLoader({"streaming": streaming}).load_object(json_path)
+    if streaming:
+        with content:
+            content = content.read_value()
+    assert content["string"] == "hello"
+
+
+def test_corrupted_compressed_file(tmp_path):
+    path = tmp_path / "data.csv.gz"
+    path.write_bytes(b"not gzip")
+    with pytest.raises(ValueError, match="Error loading CSV object"):
+        CsvLoader().load_object(path)
+    path = tmp_path / "data.json.gz"
+    path.write_bytes(b"not gzip")
+    with pytest.raises(ValueError, match="Error loading JSON object"):
+        JsonLoader().load_object(path)
+
+
+class UpperLoader(Loader):
+    name = "upper"
+
+    def load_object(self, file_path: Path) -> dict:
+        return {"content": Path(file_path).read_text().upper()}
+
+
+def test_loader_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader_module, "LOADERS", dict(loader_module.LOADERS))
+    monkeypatch.setattr(loader_module, "_loader_classes", {})
+    assert isinstance(Loader.factory("ndjson"), NdjsonLoader)
+    assert Loader.get_class("flywheel") is FwLoader
+
+    with pytest.raises(ValueError, match="Loader upper not found"):
+        Loader.factory("upper")
+    Loader.register("upper", "tests.test_loader:UpperLoader")
+    path = tmp_path / "file.txt"
+    path.write_text("abc")
+    assert Loader.factory("upper").load_object(path) == {"content": "ABC"}
+
+    Loader.register("missing", "tests.test_loader:MissingLoader")
+    with pytest.raises(ValueError, match="Loader missing can't be imported"):
+        Loader.factory("missing")
+
+
+def test_loader_imports_deferred():
+    # The modules reading the files are imported when a file is first loaded.
+    code = (
+        "import sys, fw_gear_file_validator.loader; "
+        "print(' '.join(m for m in sys.modules if m.startswith('fw_gear')))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BASE_DIR.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = set(process.stdout.split())
+    assert "fw_gear_file_validator.loader" in loaded
+    for name in ["compression", "jsonstream", "memory", "schema", "table"]:
+        assert f"fw_gear_file_validator.{name}" not in loaded
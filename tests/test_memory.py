@@ -0,0 +1,31 @@
+import pytest
+
+from fw_gear_file_validator import memory
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [("1073741824\n", 1024.0), ("max\n", None), ("9223372036854771712\n", None)],
+)
+def test_memory_limit(tmp_path, monkeypatch, content, expected):
+    limit_file = tmp_path / "memory.max"
+    limit_file.write_text(content)
+    monkeypatch.setattr(
+        memory, "CGROUP_LIMIT_FILES", [tmp_path / "missing", limit_file]
+    )
+    assert memory.memory_limit_mb() == expected
+
+
+def test_resolve_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "CGROUP_LIMIT_FILES", [tmp_path / "missing"])
+    assert memory.resolve_budget(0) is None
+    assert memory.resolve_budget(512) == 512.0
+
+    limit_file = tmp_path / "memory.max"
+    limit_file.write_text("1073741824")
+    monkeypatch.setattr(memory, "CGROUP_LIMIT_FILES", [limit_file])
+    assert memory.resolve_budget(0) == 1024 * memory.DEFAULT_BUDGET_FRACTION
+
+
+def test_rss():
+    assert 0 < memory.current_rss_mb() <= memory.peak_rss_mb() * 1.1
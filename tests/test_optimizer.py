@@ -0,0 +1,257 @@
+import jsonschema
+import pytest
+
+from fw_gear_file_validator import optimizer, validator
+
+DEFINITIONS = {
+    "code": {"type": "string", "pattern": "^[A-Z]{2}[0-9]+$", "maxLength": 6},
+    "positive": {"allOf": [{"type": "number"}, {"exclusiveMinimum": 0}]},
+    "node": {
+        "type": "object",
+        "properties": {
+            "value": {"$ref": "#/definitions/positive"},
+            "children": {"type": "array", "items": {"$ref": "#/definitions/node"}},
+        },
+    },
+}
+SCHEMAS = [
+    {
+        "definitions": DEFINITIONS,
+        "type": "object",
+        "properties": {
+            "code": {"$ref": "#/definitions/code"},
+            "age": {
+                "maximum": 120,
+                "allOf": [
+                    {"minimum": 0, "allOf": [{"multipleOf": 1}, {"maximum": 100}]},
+                    {"type": "integer", "not": {"const": 13}},
+                ],
+            },
+            "tags": {
+                "type": "array",
+                "items": [{"enum": ["a", "b"]}, {"$ref": "#/definitions/code"}],
+                "contains": {"const": "b"},
+                "uniqueItems": True,
+            },
+            "kind": {"enum": ["x", "y"]},
+            "score": {
+                "anyOf": [{"type": "integer", "minimum": 5}, {"type": "null"}],
+                "oneOf": [{"maximum": 10}, {"multipleOf": 7}],
+            },
+        },
+        "if": {"properties": {"kind": {"const": "x"}}},
+        "then": {"required": ["code"], "allOf": [{"minProperties": 3}]},
+        "else": {"properties": {"age": False}},
+        "dependencies": {"score": ["age"], "code": {"required": ["kind"]}},
+        "required": ["age"],
+        "additionalProperties": {"type": "string", "minLength": 2},
+    },
+    {
+        "definitions": DEFINITIONS,
+        "allOf": [
+            {"$ref": "#/definitions/node"},
+            {"required": ["value"], "maxProperties": 2},
+            {"propertyNames": {"pattern": "^[a-z]+$"}},
+        ],
+    },
+    {
+        "propertyNames": {"allOf": [{"pattern": "^[a-z]"}, {"maxLength": 3}]},
+        "patternProperties": {"^[a-z]": {"allOf": [{"type": "array"}]}},
+        "additionalProperties": {
+            "items": [{"const": 1}],
+            "additionalItems": {"allOf": [{"minimum": 2}, {"type": "integer"}]},
+        },
+    },
+]
+INSTANCES = [
+    {},
+    {"age": 13, "kind": "x"},
+    {"age": 101.5, "kind": "x", "code": "ab1", "tags": ["c", "AB1234567"]},
+    {"age": -1, "kind": "y", "tags": ["a", "a"], "score": 8, "other": 1},
+    {"age": "old", "kind": "z", "score": None, "code": "AB1", "Bad": "x"},
+    {"age": 50, "kind": "x", "code": "AB12", "tags": ["b", 3], "score": 14},
+    {"value": 0, "children": [{"value": -1}, {"value": 2, "children": [{}]}]},
+    {"value": "x", "children": [{"value": None}, 3], "extra": True},
+    {"long": [1, 1.5, 0], "B": [2, 3, 1], "c": 1, "D": 4},
+    [],
+    "string",
+]
+
+
+def original_errors(schema, instance):
+    json_validator = validator.JsonValidator(schema)
+    json_validator.optimized = None
+    return json_validator.process(instance)[1]
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_same_errors(schema, instance):
+    json_validator = validator.JsonValidator(schema)
+    assert json_validator.optimized is not None
+    assert json_validator.optimized.changed
+
+    expected = original_errors(schema, instance)
+    _, errors = json_validator.process(instance)
+    assert [dict(e) for e in errors] == [dict(e) for e in expected]
+
+
+def by_path(errors):
+    # jsonschema validates additional properties in set order, which varies between
+    # runs: only compare the order of the errors of each item.
+    return sorted(errors, key=lambda e: [str(step) for step in e.path])
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_same_raw_errors(schema, instance):
+    optimized = optimizer.optimize(schema)
+    expected = by_path(jsonschema.Draft7Validator(schema).iter_errors(instance))
+    errors = by_path(optimized.iter_errors(instance))
+    assert len(errors) == len(expected)
+    for error, expected_error in zip(errors, expected):
+        assert list(error.schema_path) == list(expected_error.schema_path)
+        assert list(error.path) == list(expected_error.path)
+        assert error.message == expected_error.message
+        assert error.schema is expected_error.schema
+
+
+def test_optimized_schema():
+    optimized = optimizer.optimize(
+        {
+            "definitions": {"code": {"pattern": "^a", "type": "string"}},
+            "properties": {"code": {"$ref": "#/definitions/code"}},
+            "allOf": [{"minProperties": 1, "allOf": [{"maxProperties": 3}]}, True],
+        }
+    )
+    assert optimized.schema == {
+        "definitions": {"code": {"type": "string", "pattern": "^a"}},
+        "properties": {"code": {"type": "string", "pattern": "^a"}},
+        "minProperties": 1,
+        "maxProperties": 3,
+    }
+
+
+def test_colliding_keywords_stay_in_branches():
+    schema = {"minimum": 1, "allOf": [{"minimum": 5, "maximum": 10}]}
+    optimized = optimizer.optimize(schema)
+    assert optimized.schema == {"minimum": 1, "maximum": 10, "allOf": [{"minimum": 5}]}
+    errors = optimized.iter_errors(0)
+    assert [list(e.schema_path) for e in errors] == [
+        ["minimum"],
+        ["allOf", 0, "minimum"],
+    ]
+    assert errors[1].schema is schema["allOf"][0]
+
+
+@pytest.mark.parametrize(
+    "schema",
+    [
+        True,
+        {"properties": {"a": {"$ref": "other.json#/definitions/a"}}},
+        {"properties": {"a": {"$id": "http://example.com/a", "type": "string"}}},
+    ],
+)
+def test_not_optimized(schema):
+    assert optimizer.optimize(schema) is None
+
+
+def test_dereferenced_schema():
+    schema = {
+        "definitions": {"count": {"type": "integer", "minimum": 0}},
+        "properties": {"a": {"$ref": "#/definitions/count"}},
+    }
+    optimized = optimizer.optimize(schema)
+    assert optimized.changed and not optimized.reordered
+    for _ in range(2):
+        errors = optimized.iter_errors({"a": -1})
+        assert [list(e.schema_path) for e in errors] == [["properties", "a", "minimum"]]
+        assert errors[0].schema is schema["definitions"]["count"]
+
+
+@pytest.mark.parametrize(
+    "schema",
+    [
+        {"allOf": [{"$ref": "#/definitions/d"}], "definitions": {"d": False}},
+        {"allOf": [{"minimum": 1}, False, {"maximum": 0}]},
+        {"if": True, "then": False, "allOf": [{"maximum": 0}]},
+    ],
+)
+def test_false_subschemas_not_optimized(schema):
+    assert optimizer.optimize(schema) is None
+    json_validator = validator.JsonValidator(schema)
+    _, errors = json_validator.process(5)
+    assert [dict(e) for e in errors] == [dict(e) for e in original_errors(schema, 5)]
+
+
+def raw_errors(errors):
+    return [
+        (
+            list(e.schema_path),
+            list(e.path),
+            e.message,
+            e.schema,
+            raw_errors(e.context),
+        )
+        for e in errors
+    ]
+
+
+@pytest.mark.parametrize(
+    "schema, instance",
+    [
+        (
+            {
+                "definitions": DEFINITIONS,
+                "anyOf": [
+                    {"allOf": [{"type": "string"}, {"allOf": [{"minLength": 3}]}]},
+                    {"$ref": "#/definitions/positive"},
+                ],
+            },
+            -1,
+        ),
+        (
+            {
+                "definitions": DEFINITIONS,
+                "properties": {
+                    "a": {"not": {"$ref": "#/definitions/code"}},
+                    "b": {
+                        "oneOf": [{"$ref": "#/definitions/positive"}, {"minimum": 1}]
+                    },
+                },
+            },
+            {"a": "AB1", "b": 2},
+        ),
+        (
+            {
+                "anyOf": [
+                    {
+                        "properties": {"a": {}},
+                        "patternProperties": {"^x": {}},
+                        "additionalProperties": {"allOf": [{"type": "string"}]},
+                    },
+                    {"required": ["z"]},
+                ]
+            },
+            {f"key{index}": index for index in range(20)},
+        ),
+        (
+            {
+                "definitions": {"node": {"$ref": "#/definitions/leaf"}, "leaf": {}},
+                "$ref": "#/definitions/node",
+            },
+            {},
+        ),
+    ],
+)
+def test_same_sub_errors_and_messages(schema, instance):
+    optimized = optimizer.optimize(schema)
+    expected = jsonschema.Draft7Validator(schema).iter_errors(instance)
+    assert raw_errors(optimized.iter_errors(instance)) == raw_errors(expected)
+
+
+def test_optimizer_disabled():
+    schema = {"properties": {"a": {"allOf": [{"minimum": 0}]}}}
+    json_validator = validator.initialize_validator("json", schema, {"optimize": False})
+    assert json_validator.optimized is None
+    assert validator.initialize_validator("json", schema).optimized is not None
@@ -0,0 +1,51 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.budget import FAIL_FAST, ErrorBudget
+from fw_gear_file_validator.parallel import ParallelCsvValidator
+from tests.test_columnar import SCHEMA, random_rows
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BASE_DIR = BASE_DIR / "tests"
+csv_schema = BASE_DIR / "assets" / "test_schema_csv.json"
+
+
+def test_parallel_matches_serial():
+    rows = random_rows(1000)
+    expected = validator.CsvValidator(SCHEMA).validate(rows)
+
+    for engine in ["jsonschema", "columnar"]:
+        parallel = ParallelCsvValidator(SCHEMA, engine=engine, workers=2, chunk_size=64)
+        valid, errors = parallel.validate(iter(rows))
+        assert (valid, errors) == expected
+        assert errors[-1]["location"]["line"] == 1000
+
+
+def test_parallel_single_chunk_runs_inline():
+    csv_validator = validator.initialize_validator("csv", csv_schema, {"workers": 2})
+    assert isinstance(csv_validator, ParallelCsvValidator)
+    with open(BASE_DIR / "assets" / "test_input_invalid.csv") as csv_file:
+        valid, errors = csv_validator.validate(csv.DictReader(csv_file))
+    assert not valid
+    assert errors[0]["location"] == {"line": 2, "column_name": "Col2"}
+
+
+def test_parallel_fail_fast(monkeypatch):
+    rows = random_rows(1000)
+    expected = validator.CsvValidator(SCHEMA).validate(rows)[1][:1]
+    shutdowns = []
+    shutdown = ProcessPoolExecutor.shutdown
+
+    def record_shutdown(self, wait=True, *, cancel_futures=False):
+        shutdowns.append(cancel_futures)
+        shutdown(self, wait, cancel_futures=cancel_futures)
+
+    monkeypatch.setattr(ProcessPoolExecutor, "shutdown", record_shutdown)
+    parallel = ParallelCsvValidator(SCHEMA, workers=2, chunk_size=64)
+    budget = ErrorBudget(fail_fast=True)
+    assert parallel.validate(iter(rows), budget) == (False, expected)
+    assert budget.reason == FAIL_FAST
+    # The chunks still queued are cancelled rather than validated.
+    assert shutdowns == [True]
@@ -6,7 +6,7 @@ from unittest.mock import MagicMock
 import flywheel
 import pytest
 
-from fw_gear_file_validator import parser
+from fw_gear_file_validator import parser, validator
 
 # from fw_gear_{{gear_package}}.parser import parse_config
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -19,6 +19,12 @@ CONFIG_JSON["inputs"]["input_file"]["location"]["path"] = (
     BASE_DIR / "assets" / CONFIG_JSON["inputs"]["input_file"]["location"]["name"]
 )
 
+# CSV schema with a foreign key, referencing a file relative to the schema.
+KEYS_SCHEMA = {
+    "properties": {"session_id": {"type": "string"}},
+    "foreignKeys": [{"columns": ["session_id"], "reference": {"file": "sessions.csv"}}],
+}
+
 
 def context_get_input_path_side_effect(value):
     return BASE_DIR / "assets" / CONFIG_JSON["inputs"][value]["location"]["name"]
@@ -53,11 +59,29 @@ def test_parse_config():
     client.get_file = MagicMock(return_value=file)
     context.client = client
     context._client = client
-    (debug, tag, schema_file_path, fw_reference, loader_config) = parser.parse_config(
-        context
-    )
+    (
+        debug,
+        tag,
+        schema_file_path,
+        fw_reference,
+        loader_config,
+        validator_config,
+    ) = parser.parse_config(context)
 
     assert loader_config["add_parents"] is False
+    assert loader_config["streaming"] is False
+    assert validator_config["engine"] == "jsonschema"
+    assert validator_config["workers"] == 0
+    assert validator_config["cache_dir"] is None
+    assert validator_config["max_value_length"] == 1000
+    assert validator_config["max_index_keys"] == 1000000
+    assert validator_config["reference_dir"] == BASE_DIR / "assets"
+    assert validator_config["incremental"] is False
+    assert validator_config["max_errors"] == 0
+    assert validator_config["fail_fast"] is False
+    assert validator_config["deadline"] == 0
+    assert validator_config["optimize"] is True
+    assert "memory_budget" in loader_config
 
     assert fw_reference.id == "6442f29a9bb0718c0adfaf9f"
     assert fw_reference.type == "file"
@@ -69,6 +93,16 @@ def test_parse_config():
     assert debug is False
 
 
+def test_parse_config_without_input_file():
+    context = MagicMock()
+    context.get_input_path.side_effect = context_get_input_path_side_effect
+    context.get_input.return_value = None
+    context.config = CONFIG_JSON["config"]
+
+    with pytest.raises(ValueError, match="No input file provided"):
+        parser.parse_config(context)
+
+
 def test_identify_json_type():
     ext = ".json"
     str_ext = parser.identify_file_type(ext=ext)
@@ -135,3 +169,25 @@ def test_identify_unsupported_type():
     with pytest.raises(TypeError) as e_info:
         ext, mime = parser.get_filetype_data(bad_str)
         parser.validate_filetype(ext, mime)
+
+
+@pytest.mark.parametrize("configured", [False, True])
+def test_parse_options_reference_dir(tmp_path, configured):
+    schema_dir = tmp_path / "input" / "validation_schema"
+    schema_dir.mkdir(parents=True)
+    schema_path = schema_dir / "schema.json"
+    schema_path.write_text(json.dumps(KEYS_SCHEMA))
+    reference_dir = tmp_path / "references" if configured else schema_dir
+    reference_dir.mkdir(exist_ok=True)
+    (reference_dir / "sessions.csv").write_text("session_id\na\nb\n")
+
+    context = MagicMock()
+    context.get_input_path.return_value = str(schema_path)
+    context.config = {"reference_dir": str(reference_dir) if configured else ""}
+    _, validator_config = parser.parse_options(context)
+    assert Path(validator_config["reference_dir"]) == reference_dir
+
+    csv_validator = validator.initialize_validator("csv", KEYS_SCHEMA, validator_config)
+    rows = [{"session_id": "a"}, {"session_id": "c"}]
+    _, errors = csv_validator.validate(iter(rows))
+    assert [(e["code"], e["location"]["line"]) for e in errors] == [("foreignKeys", 2)]
@@ -0,0 +1,53 @@
+import pickle
+
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.records import ErrorRecord, bounded_str, truncate
+
+
+def test_bounded_str():
+    value = {"a": [1, "x", None, True], "b": {"c": 1.5}}
+    assert bounded_str(value, 100) == str(value)
+    assert bounded_str(value, 0) == str(value)
+    assert bounded_str(value, 10) == str(value)[:10] + "..."
+    assert bounded_str(list(range(10**6)), 5) == "[0, 1..."
+    assert bounded_str("abcdef", 3) == "abc..."
+    assert truncate("abc", 3) == "abc"
+
+
+def test_error_record_reads_as_dict():
+    schema = {"properties": {"list": {"type": "array", "maxItems": 3}}}
+    jvalidator = validator.JsonValidator(schema)
+    _, errors = jvalidator.validate({"list": [1, 2, 3, 4]})
+    record = errors[0]
+    assert isinstance(record, ErrorRecord)
+    assert record == {
+        "type": "error",
+        "code": "maxItems",
+        "location": {"key_path": "properties.list"},
+        "value": "[1, 2, 3, 4]",
+        "expected": "{'type': 'array', 'maxItems': 3}",
+        "message": "[1, 2, 3, 4] is too long",
+    }
+
+    record["flywheel_path"] = "fw://group/project"
+    record["location"] = {"line": 1, "column_name": "list"}
+    assert list(record)[-1] == "flywheel_path"
+    assert record.to_dict()["location"] == {"line": 1, "column_name": "list"}
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_error_record_truncation():
+    schema = {"type": "array", "maxItems": 3}
+    jvalidator = validator.JsonValidator(schema, max_value_length=20)
+    _, errors = jvalidator.validate(list(range(100000)))
+    assert errors[0]["value"] == "[0, 1, 2, 3, 4, 5, 6..."
+    assert errors[0]["message"] == "[0, 1, 2, 3, 4, 5, 6..."
+    assert errors[0]["expected"] == "{'type': 'array', 'm..."
+
+
+def test_error_record_lazy_message():
+    record = ErrorRecord(
+        "maximum", ("n",), ("properties", "n", "maximum"), 9, {}, lambda v: f"{v} > 5"
+    )
+    assert record["message"] == "9 > 5"
+    assert pickle.loads(pickle.dumps(record))["message"] == "9 > 5"
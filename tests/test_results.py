@@ -0,0 +1,287 @@
+import gzip
+import json
+import os
+from unittest.mock import MagicMock
+
+from fw_gear_file_validator import results, utils
+from fw_gear_file_validator.results import CachedResult, ResultCache
+from fw_gear_file_validator.timing import StageTimer
+from tests.test_FwReference import FakeClient, make_hierarchy
+
+SCHEMA = {"type": "object", "properties": {"id": {"type": "string"}}}
+
+
+def result_key(**kwargs):
+    args = {
+        "input_hash": "abc",
+        "schema": SCHEMA,
+        "validation_level": "file",
+        "add_parents": False,
+        "gear_version": "1.0.0",
+        **kwargs,
+    }
+    return results.result_key(**args)
+
+
+def test_file_hash(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"id\n" + b"a\n" * 1000)
+    assert results.file_hash(path) == results.file_hash(path, chunk_size=7)
+    other = tmp_path / "other.csv"
+    other.write_bytes(b"id\n" + b"a\n" * 999 + b"b\n")
+    assert results.file_hash(path) != results.file_hash(other)
+
+
+def test_result_key():
+    key = result_key()
+    assert key == result_key(schema=dict(reversed(SCHEMA.items())))
+    assert (
+        len(
+            {
+                key,
+                result_key(input_hash="abd"),
+                result_key(schema={**SCHEMA, "required": ["id"]}),
+                result_key(validation_level="flywheel"),
+                result_key(add_parents=True),
+                result_key(gear_version="1.0.1"),
+                result_key(options={"max_value_length": 10}),
+            }
+        )
+        == 7
+    )
+
+
+def test_reference_hashes(tmp_path):
+    schema = {
+        **SCHEMA,
+        "foreignKeys": [
+            {"columns": ["id"], "reference": {"file": "ids.csv"}},
+            {"columns": ["id"], "reference": {"file": "missing.csv"}},
+        ],
+    }
+    (tmp_path / "ids.csv").write_text("id\na\n")
+    hashes = results.reference_hashes(schema, tmp_path)
+    assert hashes == {
+        str(tmp_path / "ids.csv"): results.file_hash(tmp_path / "ids.csv"),
+        str(tmp_path / "missing.csv"): None,
+    }
+    assert results.reference_hashes(SCHEMA) == {}
+
+
+def test_result_from_info():
+    info = {
+        "qc": {
+            "file-validator": {
+                "job_info": {"version": "1.0.0"},
+                "validation": {"state": "FAIL", "error_count": 2, "result_key": "k"},
+            }
+        }
+    }
+    cached = results.result_from_info(info, "file-validator", "k")
+    assert cached == CachedResult("FAIL", {"error_count": 2, "result_key": "k"})
+    assert results.result_from_info(info, "file-validator", "other") is None
+    assert results.result_from_info(info, "other-gear", "k") is None
+    assert results.result_from_info({}, "file-validator", "k") is None
+    assert results.result_from_info(None, "file-validator", "k") is None
+
+
+def test_result_cache(tmp_path):
+    errors_path = tmp_path / "data.csv.errors.ndjson.gz"
+    with gzip.open(errors_path, "wt") as fp:
+        fp.write('{"code": "type"}\n')
+    cache = ResultCache(tmp_path / "cache", max_entries=2)
+    assert cache.get("k1") is None
+
+    data = {"error_count": 1, "errors_file": errors_path.name, "timings": {}}
+    cache.put("k1", "FAIL", data, errors_path)
+    cache.put("k2", "PASS", {})
+    cached = cache.get("k1")
+    assert cached.state == "FAIL"
+    assert cached.data == {"error_count": 1, "errors_file": errors_path.name}
+    assert cached.errors_path.read_bytes() == errors_path.read_bytes()
+    assert cache.get("k2") == CachedResult("PASS", {})
+
+    # Entries missing their errors file are discarded.
+    cached.errors_path.unlink()
+    assert cache.get("k1") is None
+    assert not (cache.cache_dir / "k1.json").exists()
+
+    os.utime(cache.cache_dir / "k2.json", (0, 0))
+    cache.put("k3", "PASS", {})
+    cache.put("k4", "FAIL", data, errors_path)
+    assert sorted(p.name for p in cache.cache_dir.iterdir()) == [
+        "k3.json",
+        "k4.errors.ndjson.gz",
+        "k4.json",
+    ]
+
+
+def test_lookup_result(tmp_path):
+    cache = ResultCache(tmp_path)
+    info = {"qc": {"gear": {"validation": {"state": "PASS", "result_key": "k"}}}}
+    assert results.lookup_result("k", info, "gear") == CachedResult(
+        "PASS", {"result_key": "k"}
+    )
+    assert results.lookup_result("k", info, "gear", cache).data == {"result_key": "k"}
+    cache.put("k", "PASS", {"result_key": "k", "cached": 1})
+    assert results.lookup_result("k", info, "gear", cache).data == {
+        "result_key": "k",
+        "cached": 1,
+    }
+    assert results.lookup_result("other", info, "gear", cache) is None
+
+
+def test_publish_result(tmp_path):
+    context = MagicMock()
+    context.output_dir = tmp_path / "output"
+    context.output_dir.mkdir()
+    client = FakeClient(make_hierarchy())
+    fw_ref = utils.FwReference.init_from_gear_input(
+        client, {"object": {"file_id": "file_id"}}, "file"
+    )
+
+    # The result of another file with the same content.
+    errors_path = tmp_path / "cached.errors.ndjson.gz"
+    error = {
+        "type": "error",
+        "code": "type",
+        "location": {"line": 2, "column_name": "Col2"},
+        "value": "x",
+        "expected": "{'type': 'integer'}",
+        "message": "'x' is not of type 'integer'",
+        "flywheel_path": "fw://group/project/subject/session/acquisition/other.csv",
+        "container_id": "other_id",
+    }
+    with gzip.open(errors_path, "wt") as fp:
+        fp.write(json.dumps(error) + "\n")
+    data = {
+        "data": [{"code": "type", "container_id": "other_id"}],
+        "error_count": 1,
+        "errors_file": "other.csv.errors.ndjson.gz",
+        "result_key": "k",
+        "timings": {"stages": {}},
+    }
+    timings = {"stages": {"hash_input": {"seconds": 0.1}}}
+    results.publish_result(
+        CachedResult("FAIL", data, errors_path), fw_ref, context, timings=timings
+    )
+    fw_path = "fw://group/project/subject/session/acquisition/file.csv"
+    located = {**error, "flywheel_path": fw_path, "container_id": "file_id"}
+    context.metadata.add_qc_result.assert_called_with(
+        "file.csv",
+        "validation",
+        state="FAIL",
+        data=[
+            {
+                "code": "type",
+                "location": {"column_name": "Col2"},
+                "count": 1,
+                "message": error["message"],
+                "samples": [{"location": error["location"], "value": "x"}],
+                "flywheel_path": fw_path,
+                "container_id": "file_id",
+            }
+        ],
+        error_count=1,
+        errors_file="file.csv.errors.ndjson.gz",
+        result_key="k",
+        timings=timings,
+    )
+    with gzip.open(context.output_dir / "file.csv.errors.ndjson.gz", "rt") as fp:
+        assert [json.loads(line) for line in fp] == [located]
+
+    results.publish_result(CachedResult("PASS", {"result_key": "k"}), fw_ref, context)
+    context.metadata.add_qc_result.assert_called_with(
+        "file.csv", "validation", state="PASS", result_key="k"
+    )
+
+
+def gear_context(**config):
+    context = MagicMock()
+    context.config = {"add_parents": False, **config}
+    context.manifest = {"name": "file-validator", "version": "1.0.0"}
+    return context
+
+
+def test_gear_result_key(tmp_path):
+    schema = {
+        **SCHEMA,
+        "foreignKeys": [{"columns": ["id"], "reference": {"file": "ids.csv"}}],
+    }
+    (tmp_path / "ids.csv").write_text("id\na\n")
+    fw_ref = MagicMock(contents="file")
+    config = {"max_value_length": 1000, "reference_dir": tmp_path}
+
+    def key(context=None, schema=schema, input_hash="abc", **options):
+        return results.gear_result_key(
+            context or gear_context(), schema, input_hash, fw_ref, {**config, **options}
+        )
+
+    keys = {
+        key(),
+        key(input_hash="abd"),
+        key(schema={**schema, "required": ["id"]}),
+        key(context=gear_context(add_parents=True)),
+        key(max_value_length=10),
+        key(max_errors=10),
+        key(fail_fast=True),
+        results.gear_result_key(
+            gear_context(), schema, "abc", fw_ref, config, streaming=True
+        ),
+    }
+    assert len(keys) == 8
+    assert key() == key(workers=4)
+    # The referenced files are part of the key.
+    (tmp_path / "ids.csv").write_text("id\nb\n")
+    assert key() not in keys
+
+
+def test_cache_result(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    with gzip.open(output_dir / "data.csv.errors.ndjson.gz", "wt") as fp:
+        fp.write('{"code": "type"}\n')
+    data = {"error_count": 1, "errors_file": "data.csv.errors.ndjson.gz"}
+
+    # Where a validation stopped by its deadline ends depends on the run.
+    assert results.reusable_key("k1", "deadline") is None
+    results.cache_result(cache, results.reusable_key("k1", "deadline"), "FAIL", {}, "")
+    assert not cache.cache_dir.exists()
+
+    for partial in [None, "max_errors", "fail_fast"]:
+        assert results.reusable_key("k", partial) == "k"
+    # Documents streamed to fit in the memory budget have their values elided.
+    assert results.reusable_key("k", None, streamed=True) is None
+    results.cache_result(cache, "k", "FAIL", data, output_dir)
+    cached = cache.get("k")
+    assert cached.data == data
+    assert (
+        cached.errors_path.read_bytes()
+        == (output_dir / "data.csv.errors.ndjson.gz").read_bytes()
+    )
+    results.cache_result(None, "k2", "PASS", {}, output_dir)
+
+
+def test_reuse_result(tmp_path):
+    context = gear_context()
+    context.output_dir = tmp_path
+    containers = make_hierarchy()
+    containers["file"].tags = ["test-FAIL"]
+    client = FakeClient(containers)
+    fw_ref = utils.FwReference.init_from_gear_input(
+        client, {"object": {"file_id": "file_id"}}, "file"
+    )
+    cache = ResultCache(tmp_path / "cache")
+    timer = StageTimer()
+
+    assert not results.reuse_result(context, fw_ref, "k", cache, "test", timer)
+    context.metadata.add_qc_result.assert_not_called()
+
+    cache.put("k", "PASS", {"result_key": "k"})
+    assert results.reuse_result(context, fw_ref, "k", cache, "test", timer)
+    context.metadata.add_qc_result.assert_called_once()
+    assert context.metadata.add_qc_result.call_args.kwargs["state"] == "PASS"
+    context.metadata.add_file_tags.assert_called_once()
+    assert context.metadata.add_file_tags.call_args.args[1] == "test-PASS"
+    assert context.metadata.update_file.call_args.kwargs == {"tags": []}
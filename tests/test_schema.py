@@ -0,0 +1,109 @@
+import jsonschema
+import pytest
+
+from fw_gear_file_validator import schema
+
+
+def test_dereference():
+    original = {
+        "definitions": {
+            "num": {"type": "number", "maximum": 5},
+            "alias": {"$ref": "#/definitions/num"},
+            "tree": {"properties": {"child": {"$ref": "#/definitions/tree"}}},
+        },
+        "properties": {
+            "a": {"$ref": "#/definitions/alias", "description": "ignored"},
+            "b": {"$ref": "#/definitions/tree"},
+            "c": {"$ref": "other.json#/definitions/num"},
+            "d": {"const": {"$ref": "#/definitions/num"}},
+        },
+    }
+    dereferenced = schema.dereference(original)
+
+    assert dereferenced["properties"]["a"] == {"type": "number", "maximum": 5}
+    # Recursive and remote references are kept
+    tree = dereferenced["properties"]["b"]
+    assert tree["properties"]["child"] == {"$ref": "#/definitions/tree"}
+    assert dereferenced["properties"]["c"] == {"$ref": "other.json#/definitions/num"}
+    # Literal values are untouched
+    assert dereferenced["properties"]["d"] == {"const": {"$ref": "#/definitions/num"}}
+    # The original schema is not modified
+    assert original["properties"]["a"]["$ref"] == "#/definitions/alias"
+
+
+def test_dereference_root_ref():
+    original = {
+        "definitions": {
+            "node": {
+                "type": "object",
+                "properties": {"child": {"$ref": "#/definitions/node"}},
+            },
+            "num": {"type": "number"},
+        },
+        "$ref": "#/definitions/node",
+        "properties": {"a": {"$ref": "#/definitions/num"}},
+    }
+    dereferenced = schema.dereference(original)
+    assert dereferenced["$ref"] == "#/definitions/node"
+    assert dereferenced["definitions"]["num"] == {"type": "number"}
+    assert dereferenced["properties"]["a"] == {"type": "number"}
+    validator = jsonschema.Draft7Validator(dereferenced)
+    assert not validator.is_valid({"child": {"child": 1}})
+
+
+def test_dereference_nested_id():
+    original = {
+        "properties": {"a": {"$id": "sub", "$ref": "#/definitions/num"}},
+        "definitions": {"num": {"type": "number"}},
+    }
+    assert schema.dereference(original) is original
+
+
+def test_resolve_pointer():
+    document = {"definitions": {"a/b": {"items": [{"type": "string"}]}}}
+    assert schema.resolve_pointer(document, "#/definitions/a~1b/items/0") == {
+        "type": "string"
+    }
+
+
+def test_referenced_properties():
+    document = {
+        "definitions": {"label": {"type": "string"}},
+        "type": "object",
+        "properties": {
+            "file": {
+                "type": "object",
+                "properties": {"info": {"required": ["a"]}, "type": True},
+            },
+            "session": {"$ref": "#/definitions/label"},
+            "subject": {"properties": {"label": {"$ref": "#/definitions/label"}}},
+        },
+        "required": ["file", "project"],
+    }
+    assert schema.referenced_properties(document) == {
+        "file": {"info": None, "type": {}},
+        "session": None,
+        "subject": {"label": None},
+        "project": {},
+    }
+    assert schema.referenced_properties(document, depth=1) == {
+        "file": None,
+        "session": None,
+        "subject": None,
+        "project": {},
+    }
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {"properties": {"file": {}}, "additionalProperties": False},
+        {"anyOf": [{"properties": {"file": {}}}]},
+        {"type": "array"},
+        {"properties": {"file": {"$id": "file", "type": "object"}}},
+        {"$ref": "other.json#/definitions/a"},
+        True,
+    ],
+)
+def test_referenced_properties_not_projectable(document):
+    assert schema.referenced_properties(document) is None
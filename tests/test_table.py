@@ -0,0 +1,83 @@
+import csv
+import io
+import random
+import sys
+
+import pytest
+
+from fw_gear_file_validator import table as table_module
+from fw_gear_file_validator import validator
+from fw_gear_file_validator.columnar import ColumnarCsvValidator
+from fw_gear_file_validator.table import CsvTable
+from tests.test_columnar import SCHEMA, random_rows
+
+
+def to_csv(rows):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return text.getvalue()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "a,b\n1,2\n3,4\n",
+        "a,b\n1,2\n\n3\n4,5,6,7\n,x\n",
+        "a,a,b\n1,2,3\n",
+        "\n\na,b\n1.5,x\n",
+        "a\n",
+        "",
+    ],
+)
+def test_reads_like_dict_reader(text):
+    table = CsvTable.from_file(io.StringIO(text))
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert list(table) == rows
+    assert len(table) == len(rows)
+    assert table[:] == rows
+    if rows:
+        assert table[-1] == rows[-1]
+    assert list(CsvTable.from_rows(rows)) == rows
+
+
+def test_column_kinds(monkeypatch):
+    monkeypatch.setattr(table_module, "CHUNK_SIZE", 100)
+    rng = random.Random(0)
+    rows = [
+        {
+            "int": str(i),
+            "float": repr(rng.random()),
+            "padded": f"{i % 10:03}",
+            "category": rng.choice(["x", "y", "z"]),
+            "name": f"name{i}",
+            "late_text": str(i) if i < 150 else "n/a",
+        }
+        for i in range(2000)
+    ]
+    table = CsvTable.from_file(io.StringIO(to_csv(rows)))
+    assert {column.name: column.kind for column in table.column_list} == {
+        "int": "int",
+        "float": "float",
+        "padded": "dictionary",
+        "category": "dictionary",
+        "name": "strings",
+        "late_text": "dictionary",
+    }
+    assert list(table) == rows
+    assert table.columns["int"].typed(float, 1, 3) == [1.0, 2.0]
+    assert table.columns["name"].typed(int) is None
+    # Smaller than the dicts of the rows alone, without their values.
+    assert table.nbytes < sum(sys.getsizeof(row) for row in rows)
+
+
+def test_columnar_validates_tables():
+    rows = random_rows(500)
+    table = CsvTable.from_file(io.StringIO(to_csv(rows)))
+    expected = validator.CsvValidator(SCHEMA).validate(rows)
+
+    columnar = ColumnarCsvValidator(SCHEMA)
+    columnar.block_size = 64
+    assert columnar.validate(table) == expected
+    assert validator.CsvValidator(SCHEMA).validate(table) == expected
@@ -0,0 +1,46 @@
+import pstats
+import time
+
+from fw_gear_file_validator.timing import PROFILE_FILE_NAME, StageTimer, profile
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.span("validate"):
+            time.sleep(0.01)
+    with timer.span("load"):
+        pass
+
+    summary = timer.summary()
+    assert list(summary) == ["validate", "load"]
+    assert summary["validate"]["calls"] == 2
+    assert summary["validate"]["seconds"] >= 0.02
+    assert summary["load"]["calls"] == 1
+
+
+def test_profile(tmp_path):
+    with profile(None):
+        pass
+    assert not (tmp_path / PROFILE_FILE_NAME).exists()
+
+    with profile(tmp_path):
+        sorted(range(1000))
+    stats = pstats.Stats(str(tmp_path / PROFILE_FILE_NAME))
+    assert any(
+        name == "<built-in method builtins.sorted>" for _, _, name in stats.stats
+    )
+
+
+def test_stage_timer_memory():
+    timer = StageTimer(trace_memory=True)
+    with timer.span("allocate"):
+        data = [bytearray(1024) for _ in range(4096)]
+    with timer.span("noop"):
+        pass
+    del data
+
+    summary = timer.summary()
+    assert summary["allocate"]["peak_rss_mb"] > 0
+    assert summary["allocate"]["traced_peak_mb"] >= 4
+    assert summary["noop"]["traced_peak_mb"] < 1
@@ -2,6 +2,8 @@ import csv
 import json
 from pathlib import Path
 
+import pytest
+
 from fw_gear_file_validator import validator
 
 # from fw_gear_{{gear_package}}.parser import parse_config
@@ -42,3 +44,30 @@ def test_validate_csv():
         valid, errors = csv_validator.validate(csv_table)
     assert not valid
     assert len(errors) == 1
+
+
+def test_iter_validate_csv_streaming():
+    set_csv_path("test_input_invalid.csv")
+    csv_path = CONFIG_JSON["inputs"]["input_file"]["location"]["path"]
+    schema_path = CONFIG_JSON["inputs"]["validation_schema"]["location"]["path"]
+    csv_validator = validator.CsvValidator(schema_path)
+    with open(csv_path) as csv_file:
+        errors = csv_validator.iter_validate(csv.DictReader(csv_file))
+        error = next(errors)
+        assert error["location"] == {"line": 2, "column_name": "Col2"}
+        assert error["code"] == "type"
+        assert list(errors) == []
+
+
+@pytest.mark.parametrize("engine", validator.ENGINES)
+def test_validate_csv_undeclared_column(engine):
+    schema = {
+        "type": "object",
+        "properties": {"a": {"type": "integer"}},
+        "additionalProperties": False,
+    }
+    csv_validator = validator.initialize_validator("csv", schema, {"engine": engine})
+    valid, errors = csv_validator.validate([{"a": "1", "b": "x"}, {"a": "2"}])
+    assert not valid
+    assert [e["location"] for e in errors] == [{"line": 1, "column_name": ""}]
+    assert errors[0]["code"] == "additionalProperties"
@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from fw_gear_file_validator import parser, validator
+from fw_gear_file_validator.loader import Loader
+from fw_gear_file_validator.parallel import ParallelNdjsonValidator
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+BASE_DIR = BASE_DIR / "tests"
+json_schema = BASE_DIR / "assets" / "test_schema.json"
+
+SCHEMA = {
+    "type": "object",
+    "required": ["id"],
+    "properties": {
+        "id": {"type": "integer"},
+        "event": {"type": "object", "properties": {"value": {"maximum": 5}}},
+    },
+}
+
+
+def random_lines(n):
+    lines = []
+    for i in range(n):
+        record = {"id": i, "event": {"value": i % 7}}
+        if i % 11 == 0:
+            record["id"] = str(i)
+        lines.append(json.dumps(record) + "\n")
+    return lines
+
+
+@pytest.fixture
+def ndjson_path(tmp_path):
+    path = tmp_path / "events.ndjson"
+    lines = [
+        '{"string": "hello", "num": 1}',
+        "",
+        '{"string": "too long", "num": 1}',
+        '{"string": "hi", "num": ',
+        '{"num": 6}',
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_validate_ndjson(ndjson_path):
+    lines = Loader.factory("ndjson").load_object(ndjson_path)
+    ndjson_validator = validator.initialize_validator("ndjson", json_schema)
+    assert isinstance(ndjson_validator, validator.NdjsonValidator)
+    valid, errors = ndjson_validator.validate(lines)
+
+    assert not valid
+    assert [(e["code"], e["location"]) for e in errors] == [
+        ("maxLength", {"line": 3, "key_path": "properties.string"}),
+        ("JSONDecodeError", {"line": 4, "key_path": ""}),
+        ("maximum", {"line": 5, "key_path": "properties.num"}),
+    ]
+    assert errors[1]["value"] == '{"string": "hi", "num": '
+    assert errors[1]["message"].startswith("Line is not valid JSON")
+
+
+def test_validate_ndjson_valid():
+    ndjson_validator = validator.NdjsonValidator(json_schema)
+    assert ndjson_validator.validate(['{"num": 1}\n', "\n"]) == (True, [])
+
+
+def test_parallel_matches_serial():
+    lines = random_lines(1000)
+    expected = validator.NdjsonValidator(SCHEMA).validate(lines)
+    assert expected[1][-1]["location"]["line"] == 994
+
+    for engine in ["jsonschema", "compiled"]:
+        parallel = ParallelNdjsonValidator(
+            SCHEMA, engine=engine, workers=2, chunk_size=64
+        )
+        valid, errors = parallel.validate(iter(lines))
+        assert (valid, [e.to_dict() for e in errors]) == (
+            expected[0],
+            [e.to_dict() for e in expected[1]],
+        )
+
+
+def test_identify_ndjson_type():
+    assert parser.identify_file_type(parser.get_ext("events.jsonl")) == "ndjson"
+    assert parser.identify_file_type(parser.get_ext("events.ndjson.gz")) == "ndjson"
+    assert parser.identify_file_type(mime="application/x-ndjson") == "ndjson"